@@ -0,0 +1,121 @@
+import os
+import json
+import math
+import faiss
+import numpy as np
+from typing import Optional
+from backend.quantization import pq_subquantizers
+
+# Supported stage-1 (block level) index types
+FLAT = "flat"
+IVF_FLAT = "ivf_flat"
+HNSW = "hnsw"
+IVF_PQ = "ivf_pq"
+BLOCK_INDEX_TYPES = (FLAT, IVF_FLAT, HNSW, IVF_PQ)
+
+
+def _nlist_for(n_vectors: int) -> int:
+    # Common rule of thumb: ~4*sqrt(N) lists, but keep >= 39 training points per list
+    nlist = int(4 * math.sqrt(max(n_vectors, 1)))
+    return max(1, min(nlist, n_vectors // 39 if n_vectors >= 39 else 1))
+
+
+def build_block_index(kind: str, dimension: int, vectors: np.ndarray, hnsw_m: int = 32) -> faiss.Index:
+    """
+    Builds (and trains, where required) a block-level index over `vectors`.
+    Row order is preserved, so position i still maps to block_metadata[i].
+    """
+    if kind not in BLOCK_INDEX_TYPES:
+        raise ValueError(f"Unknown block index type '{kind}'. Expected one of {BLOCK_INDEX_TYPES}")
+
+    vectors = np.ascontiguousarray(vectors, dtype="float32").reshape(-1, dimension)
+    n = len(vectors)
+
+    if kind == FLAT or n == 0:
+        index = faiss.IndexFlatL2(dimension)
+    elif kind == HNSW:
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m)
+    elif kind == IVF_FLAT:
+        quantizer = faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIVFFlat(quantizer, dimension, _nlist_for(n))
+    else:
+        # Each PQ codebook wants ~39 training points per centroid; use smaller codes on small corpora
+        nbits = 8 if n >= 39 * 256 else (6 if n >= 39 * 64 else 4)
+        quantizer = faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, _nlist_for(n), pq_subquantizers(dimension), nbits)
+
+    if not index.is_trained:
+        index.train(vectors)
+    if n:
+        index.add(vectors)
+    return index
+
+
+def index_kind(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSWFlat):
+        return HNSW
+    if isinstance(index, faiss.IndexIVFPQ):
+        return IVF_PQ
+    if isinstance(index, faiss.IndexIVFFlat):
+        return IVF_FLAT
+    return FLAT
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    kind = index_kind(index)
+    if kind in (IVF_FLAT, IVF_PQ) and nprobe:
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    elif kind == HNSW and ef_search:
+        index.hnsw.efSearch = ef_search
+
+
+def excluding(index: faiss.Index, ids) -> Optional[faiss.SearchParameters]:
+    """
+    Search parameters that make FAISS itself skip `ids` (deleted blocks), keeping the
+    index's nprobe / efSearch, so a search returns k live results without over-fetching.
+    None when there is nothing to skip.
+    """
+    if not ids:
+        return None
+    batch = faiss.IDSelectorBatch(np.fromiter(sorted(ids), dtype="int64", count=len(ids)))
+    selector = faiss.IDSelectorNot(batch)
+    kind = index_kind(index)
+    if kind in (IVF_FLAT, IVF_PQ):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(index).nprobe)
+    elif kind == HNSW:
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    params.selectors = (batch, selector)  # the parameters only hold raw pointers
+    return params
+
+
+def save_block_index(index: faiss.Index, index_path: str, info_path: str, extra: Optional[dict] = None):
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp_path = index_path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, index_path)
+
+    info = {"kind": index_kind(index), "ntotal": int(index.ntotal)}
+    info.update(extra or {})
+    tmp_path = info_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(info, f)
+    os.replace(tmp_path, info_path)
+
+
+def load_block_index(index_path: str, info_path: str):
+    if not (os.path.exists(index_path) and os.path.exists(info_path)):
+        return None, None
+    with open(info_path, "r") as f:
+        info = json.load(f)
+    return faiss.read_index(index_path), info
+
+
+def recall_at_k(index: faiss.Index, reference: faiss.Index, queries: np.ndarray, k: int) -> float:
+    """Fraction of the exact top-k (from `reference`) that `index` also returns."""
+    _, approx = index.search(queries, k)
+    _, exact = reference.search(queries, k)
+    hits = sum(len(set(a) & set(e)) for a, e in zip(approx.tolist(), exact.tolist()))
+    return hits / float(exact.size) if exact.size else 1.0
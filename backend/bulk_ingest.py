@@ -0,0 +1,252 @@
+"""
+Bulk ingestion of existing files, without going through /upload:
+
+    python -m backend.bulk_ingest path/to/docs            # every PDF/DOCX/TXT below it
+    python -m backend.bulk_ingest --manifest files.txt    # one path per line
+
+Worker processes extract and chunk whole files while the main process embeds the
+chunks of several documents per batch and indexes them. The store is persisted
+every --checkpoint-every documents rather than after each block. Document ids are
+derived from path, size and modification time, so a rerun after an interruption
+skips everything up to the last checkpoint (Ctrl-C once saves what is indexed and stops).
+
+Run it with the server stopped: a running server does not see blocks written by
+another process, and would overwrite them on shutdown.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, List, Optional, Tuple
+
+from backend import config
+from backend.ingestion import DocumentProcessor
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+
+def discover(directory: str) -> List[str]:
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(SUPPORTED_EXTENSIONS))
+    return sorted(paths)
+
+
+def read_manifest(manifest_path: str) -> List[str]:
+    """One file per line; relative paths are resolved against the manifest's directory."""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path) as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(base, line) for line in lines if line and not line.startswith("#")]
+
+
+def document_id(path: str) -> str:
+    # Stable across runs, changes when the file does: the resume key
+    st = os.stat(path)
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"))
+
+
+def _init_worker():
+    # Ctrl-C is handled by the parent, which stops at the next checkpoint
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _extract(path: str) -> Tuple[List[dict], int]:
+    # Runs in a worker process. PDFs are read serially here: the parallelism is across files.
+    processor = DocumentProcessor(upload_dir=tempfile.gettempdir(), pdf_workers=1)
+    pages = processor.extract_text(path)
+    chunks = processor.chunk_text(pages)
+    name = os.path.basename(path)
+    for c in chunks:
+        c["source"] = name
+    return chunks, len(pages)
+
+
+def _extract_all(paths: List[str], workers: int) -> Iterator[Tuple[str, Optional[List[dict]], int, Optional[str]]]:
+    """
+    Yields (path, chunks, pages, error) as files finish extracting, with at most
+    2 files per worker in flight.
+    """
+    if workers <= 1:
+        for path in paths:
+            try:
+                yield (path, *_extract(path), None)
+            except Exception as e:
+                yield path, None, 0, f"{type(e).__name__}: {e}"
+        return
+
+    todo = list(reversed(paths))
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_worker)
+    try:
+        in_flight = {}
+        while todo or in_flight:
+            while todo and len(in_flight) < 2 * workers:
+                path = todo.pop()
+                in_flight[pool.submit(_extract, path)] = path
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                try:
+                    yield (path, *future.result(), None)
+                except Exception as e:
+                    yield path, None, 0, f"{type(e).__name__}: {e}"
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def ingest(engine, paths: List[str], workers: int = 1, embed_batch_size: Optional[int] = None,
+           checkpoint_every: int = 100, report_every: float = 10.0,
+           stop: Optional[threading.Event] = None) -> dict:
+    """
+    Indexes `paths` into a loaded engine and returns a throughput report. Files already
+    in the index (same path, size and mtime) are skipped. Blocks are persisted with one
+    save_index() per checkpoint; setting `stop` saves what is indexed and ends the run.
+    """
+    started = time.perf_counter()
+    embed_batch_size = embed_batch_size or engine.embed_batch_size
+    report = {
+        "documents_total": len(paths), "skipped": 0, "indexed": 0, "empty": 0, "failed": [],
+        "pages": 0, "chunks": 0, "blocks": 0, "checkpoints": 0, "interrupted": False,
+        "stage_s": {"extract_wait": 0.0, "embed_index": 0.0, "persist": 0.0},
+    }
+    indexed = {d["id"] for d in engine.list_documents()}
+    pending = []
+    for path in paths:
+        try:
+            doc_id = document_id(path)
+        except OSError as e:
+            report["failed"].append({"path": path, "error": f"{type(e).__name__}: {e}"})
+            continue
+        if doc_id in indexed:
+            report["skipped"] += 1
+        else:
+            pending.append((path, doc_id))
+            indexed.add(doc_id)  # the same file listed twice is indexed once
+    doc_ids = dict(pending)
+    stages = report["stage_s"]
+    batch: List[Tuple[str, str, List[dict]]] = []
+    batch_chunks = 0
+    unsaved = 0
+    last_report = started
+
+    def index_batch():
+        nonlocal batch, batch_chunks, unsaved
+        if not batch:
+            return
+        t = time.perf_counter()
+        report["blocks"] += engine.add_documents(batch, batch_size=embed_batch_size)
+        stages["embed_index"] += time.perf_counter() - t
+        report["indexed"] += len(batch)
+        report["chunks"] += batch_chunks
+        unsaved += len(batch)
+        batch, batch_chunks = [], 0
+
+    def checkpoint():
+        nonlocal unsaved
+        if not unsaved:
+            return
+        t = time.perf_counter()
+        engine.save_index(final=True)
+        stages["persist"] += time.perf_counter() - t
+        report["checkpoints"] += 1
+        unsaved = 0
+
+    def print_progress():
+        elapsed = time.perf_counter() - started
+        done = report["indexed"] + report["empty"] + len(report["failed"]) - missing
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (len(pending) - done) / rate if rate > 0 else float("inf")
+        print(f"[{elapsed:.0f}s] {done}/{len(pending)} documents, {report['chunks']} chunks, "
+              f"{rate:.2f} docs/s, {report['chunks'] / elapsed:.0f} chunks/s, ETA {eta:.0f}s")
+
+    missing = len(report["failed"])
+    print(f"Bulk ingest: {len(pending)} to index, {report['skipped']} already indexed.")
+    results = _extract_all([path for path, _ in pending], workers)
+    try:
+        while True:
+            t = time.perf_counter()
+            item = next(results, None)
+            stages["extract_wait"] += time.perf_counter() - t
+            if item is None:
+                break
+            path, chunks, pages, error = item
+            report["pages"] += pages
+            if error:
+                report["failed"].append({"path": path, "error": error})
+            elif not chunks:
+                report["empty"] += 1
+            else:
+                batch.append((doc_ids[path], os.path.basename(path), chunks))
+                batch_chunks += len(chunks)
+                if batch_chunks >= embed_batch_size:
+                    index_batch()
+                if unsaved >= checkpoint_every:
+                    checkpoint()
+
+            if report_every and time.perf_counter() - last_report >= report_every:
+                print_progress()
+                last_report = time.perf_counter()
+            if stop is not None and stop.is_set():
+                report["interrupted"] = True
+                break
+    finally:
+        results.close()
+    # Only reached without an exception: an error (or a second Ctrl-C) can leave a
+    # batch half committed, so nothing after the last checkpoint is saved then
+    index_batch()
+    checkpoint()
+    engine.chunk_store.wait_for_compaction()
+
+    elapsed = time.perf_counter() - started
+    report["elapsed_s"] = round(elapsed, 3)
+    for name in ("documents", "pages", "chunks"):
+        count = report["indexed"] if name == "documents" else report[name]
+        report[f"{name}_per_s"] = round(count / elapsed, 2) if elapsed > 0 else 0.0
+    report["stage_s"] = {name: round(seconds, 3) for name, seconds in stages.items()}
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    from backend.rag_engine import RAGEngine
+
+    parser = argparse.ArgumentParser(description="Index a directory or manifest of PDF/DOCX/TXT files.")
+    parser.add_argument("directory", nargs="?", help="Directory searched recursively for supported files")
+    parser.add_argument("--manifest", help="File listing one document path per line")
+    parser.add_argument("--models-dir", default="models")
+    parser.add_argument("--workers", type=int, default=config.PDF_WORKERS, help="Extraction processes")
+    parser.add_argument("--embed-batch-size", type=int, default=config.BULK_EMBED_BATCH_SIZE,
+                        help="Chunks per embedding call, across documents")
+    parser.add_argument("--checkpoint-every", type=int, default=100, help="Documents between saves")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between progress lines")
+    args = parser.parse_args(argv)
+    if bool(args.directory) == bool(args.manifest):
+        parser.error("give either a directory or --manifest")
+
+    paths = discover(args.directory) if args.directory else read_manifest(args.manifest)
+    engine = RAGEngine(models_dir=args.models_dir, defer_loading=True)
+    engine.load_models(ingestion_only=True)
+
+    stop = threading.Event()
+
+    def on_interrupt(signum, frame):
+        print("Stopping: saving the documents indexed so far (Ctrl-C again aborts without saving)...")
+        stop.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    signal.signal(signal.SIGINT, on_interrupt)
+    report = ingest(engine, paths, workers=args.workers, embed_batch_size=args.embed_batch_size,
+                    checkpoint_every=args.checkpoint_every, report_every=args.report_every, stop=stop)
+    print(json.dumps(report, indent=2))
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by item count and/or an approximate byte budget,
+    with optional per-entry TTL (seconds). Keeps hit/miss/eviction counters so
+    callers can report cache effectiveness.
+    """
+
+    def __init__(self, max_items: Optional[int] = None, max_bytes: Optional[int] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None, ttl: Optional[float] = None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.ttl = ttl
+
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key in self._data and self._expired(key):
+                self._remove(key)
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            if self.ttl is not None:
+                self._expires[key] = time.monotonic() + self.ttl
+            self.current_bytes += size
+            self._evict()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key]
+            self._remove(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._expires.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "items": len(self._data),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __getitem__(self, key: Hashable) -> Any:
+        with self._lock:
+            return self._data[key]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def _expired(self, key: Hashable) -> bool:
+        expires = self._expires.get(key)
+        return expires is not None and time.monotonic() >= expires
+
+    def _remove(self, key: Hashable):
+        del self._data[key]
+        self._expires.pop(key, None)
+        self.current_bytes -= self._sizes.pop(key)
+
+    def _evict(self):
+        # Always keep the most recent entry, even if it alone exceeds the budget
+        while len(self._data) > 1 and (
+            (self.max_items is not None and len(self._data) > self.max_items)
+            or (self.max_bytes is not None and self.current_bytes > self.max_bytes)
+        ):
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+
+class SemanticCache:
+    """
+    Reuses a stored value when a new query embedding lies within `max_distance`
+    (squared L2, same scale as FAISS scores) of a cached query embedding.
+    """
+
+    def __init__(self, max_distance: float, max_items: int = 256):
+        self.max_distance = max_distance
+        self.max_items = max_items
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[Hashable] = []
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, vector: np.ndarray) -> Any:
+        with self._lock:
+            if self._matrix is None:
+                self._rebuild()
+            if not self._keys:
+                self.misses += 1
+                return None
+            dists = ((self._matrix - np.asarray(vector, dtype="float32").reshape(1, -1)) ** 2).sum(axis=1)
+            best = int(np.argmin(dists))
+            if dists[best] > self.max_distance:
+                self.misses += 1
+                return None
+            key = self._keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][1]
+
+    def put(self, key: Hashable, vector: np.ndarray, value: Any):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (np.asarray(vector, dtype="float32").reshape(-1), value)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def _rebuild(self):
+        self._keys = list(self._entries.keys())
+        if self._keys:
+            self._matrix = np.stack([self._entries[k][0] for k in self._keys])
+        else:
+            self._matrix = np.zeros((0, 0), dtype="float32")
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by sha256(model id, normalized chunk text).
+    Backed by a local SQLite file so re-ingesting a revised document (or one that
+    shares boilerplate pages with another) only embeds the chunks that changed.
+    Bounded by `max_bytes`: past it, the oldest inserted rows are deleted.
+    """
+
+    # Approximate bytes per row on top of the vector: hex key plus SQLite overhead
+    ROW_OVERHEAD = 96
+    # Pruning removes rows down to this share of the cap, so it runs once per many inserts
+    PRUNE_TO = 0.9
+
+    def __init__(self, path: str, dimension: int, max_bytes: Optional[int] = None):
+        self.path = path
+        self.dimension = dimension
+        self.max_rows = None if max_bytes is None else max(1, max_bytes // (dimension * 4 + self.ROW_OVERHEAD))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+        # Upper bound on the row count (replaced keys are counted twice); recounted before pruning
+        self._rows = self._count()
+        self.evictions = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFKC", text).split())
+
+    def key(self, model_id: str, text: str) -> str:
+        payload = f"{model_id}\x00{self.normalize(text)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            # SQLite caps bound parameters per statement, so query in slices
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype="float32")
+            hits = sum(1 for k in keys if k in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        if not items:
+            return
+        rows = [(k, np.ascontiguousarray(v, dtype="float32").tobytes()) for k, v in items.items()]
+        with self._lock:
+            # REPLACE re-inserts an existing key with a new rowid, so rowid order is insertion order
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._rows += len(rows)
+            if self.max_rows is not None and self._rows > self.max_rows:
+                self._prune()
+            self._conn.commit()
+
+    def _prune(self):
+        self._rows = self._count()
+        excess = self._rows - int(self.max_rows * self.PRUNE_TO)
+        if self._rows <= self.max_rows or excess <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)", (excess,)
+        )
+        self._rows -= excess
+        self.evictions += excess
+
+    def _count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
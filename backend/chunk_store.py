@@ -0,0 +1,661 @@
+import os
+import re
+import sys
+import json
+import bisect
+import pickle
+import threading
+import numpy as np
+from typing import Any, Iterable, List, Dict, Optional, Tuple
+
+
+class ChunkRecords:
+    """
+    The chunk dicts of a committed segment, kept on disk and decoded on access:
+    one pickled record per row in `{name}_records.bin`, located through the
+    memory-mapped row offsets in `{name}_records.npy`. Indexes and slices like the
+    list it replaces, so nothing per chunk is held in memory at load time.
+    """
+
+    def __init__(self, data_path: str, offsets: np.ndarray):
+        self.data_path = data_path
+        self.offsets = offsets  # nrows + 1 byte offsets
+        # Mapped (not read) up front like the vectors, so the segment stays readable
+        # after a compaction or purge removes its files
+        if os.path.getsize(data_path):
+            self._data = np.memmap(data_path, dtype="uint8", mode="r")
+        else:
+            self._data = np.zeros(0, dtype="uint8")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return [pickle.loads(r) for r in self.raw(start, stop)]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("chunk record out of range")
+        return pickle.loads(next(self.raw(item, item + 1)))
+
+    def __iter__(self):
+        return (pickle.loads(r) for r in self.raw(0, len(self)))
+
+    def raw(self, start: int, stop: int) -> Iterable[bytes]:
+        """Encoded records of rows [start, stop), for copying without decoding."""
+        if stop <= start:
+            return iter(())
+        bounds = self.offsets[start:stop + 1].tolist()
+        data = self._data
+        return (data[a:b].tobytes() for a, b in zip(bounds[:-1], bounds[1:]))
+
+
+def records_nbytes(chunks: List[dict]) -> int:
+    # Approximate resident size of decoded chunk dicts, for cache budgets
+    return sum(sys.getsizeof(c.get("text", "")) + 256 for c in chunks)
+
+
+class Segment:
+    """
+    One immutable slice of the store: the blocks of one or more documents,
+    their representative block vectors and all of their chunk vectors.
+    """
+
+    def __init__(self, name: Optional[str], row_start: int, vectors: np.ndarray,
+                 block_vectors: np.ndarray, blocks: List[dict],
+                 offsets: Dict[str, Tuple[int, int]], chunks: List[dict]):
+        self.name = name  # None while the segment only lives in memory
+        self.row_start = row_start
+        self.vectors = vectors
+        self.block_vectors = block_vectors
+        self.blocks = blocks
+        self.offsets = offsets  # block_id -> (start, end), local to this segment
+        self.chunks = chunks  # a list while pending, ChunkRecords once committed
+
+    @property
+    def nrows(self) -> int:
+        return len(self.chunks)
+
+
+class ChunkStore:
+    """
+    Append-only, segmented on-disk store for blocks and chunk embeddings.
+
+    Every flush writes the blocks added since the previous flush as a new
+    segment and then atomically swaps MANIFEST.json to include it. Existing
+    segments are never rewritten, so ingest cost scales with the new document
+    only and a crash mid-write leaves the previous manifest (and every index it
+    references) intact. A background compaction merges runs of adjacent,
+    similar-sized segments (merge_tiers), streaming them into the new files.
+    Chunk matrices are memory-mapped at load time, so
+    fetching a block's vectors is a slice with no per-block file I/O. Chunk
+    dicts (text, page, source) stay on disk until a block is read, and decoded
+    blocks are kept in `cache` (the engine's chunk cache, under its byte budget).
+
+    Deleting a block only records a tombstone (block_id -> its global rows) in the
+    manifest and hides it from lookups; rows keep their numbers. A purge
+    (prepare_purge + commit_purge) later rewrites the store without tombstoned
+    blocks, renumbering the rows.
+    """
+
+    MANIFEST_FILE = "MANIFEST.json"
+    # 2: chunk dicts in per-row records instead of the pickled segment meta.
+    # Version 1 segments are still read (their chunks are loaded eagerly).
+    FORMAT_VERSION = 2
+    SEGMENT_FILE_PATTERN = re.compile(r"^(seg_\d+)_")
+
+    # Legacy single-matrix layout (pre-segment)
+    LEGACY_EMBEDDINGS_FILE = "chunk_embeddings.npy"
+    LEGACY_META_FILE = "chunk_store_meta.npy"
+
+    def __init__(self, store_dir: str, dimension: int = 384, compact_after_segments: int = 8,
+                 vector_dtype: str = "float32", cache: Optional[Any] = None):
+        self.store_dir = store_dir
+        self.dimension = dimension
+        # On-disk dtype for chunk vectors written from now on. Each segment records
+        # its own dtype, so float32 and float16 segments can coexist.
+        self.vector_dtype = vector_dtype
+        # Number of adjacent segments merged together by tiered compaction
+        self.compact_after_segments = compact_after_segments
+        self.manifest_path = os.path.join(store_dir, self.MANIFEST_FILE)
+        # Decoded chunk dicts per block, keyed ("chunks", block_id); an LRUCache or None
+        self.cache = cache
+
+        # Committed segments in row order. The list is replaced, never mutated,
+        # so readers can take a reference without holding the lock.
+        self.segments: List[Segment] = []
+        self.next_segment_id = 1
+
+        # Blocks added since the last flush
+        self._reset_pending(row_start=0)
+
+        # block_id -> (global_start, global_end), live blocks only
+        self.offsets: Dict[str, Tuple[int, int]] = {}
+        # Deleted blocks awaiting purge: block_id -> (global_start, global_end)
+        self.tombstones: Dict[str, Tuple[int, int]] = {}
+
+        self._lock = threading.Lock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._purging = False  # compaction waits while a purge rewrites the segments
+        # Names of segments swapped out whose files could not be deleted yet (on Windows
+        # a file stays locked while any reader still memory-maps it); retried later
+        self._retired: set = set()
+
+    # --- Introspection ---
+
+    @property
+    def ntotal(self) -> int:
+        return self.pending.row_start + self.pending.nrows
+
+    @property
+    def blocks(self) -> List[dict]:
+        result = []
+        for seg in self.segments + [self.pending]:
+            result.extend(seg.blocks)
+        return result
+
+    def block_vectors(self) -> np.ndarray:
+        parts = [seg.block_vectors for seg in self.segments + [self.pending] if len(seg.block_vectors)]
+        if not parts:
+            return np.zeros((0, self.dimension), dtype="float32")
+        return np.ascontiguousarray(np.concatenate(parts, axis=0), dtype="float32")
+
+    @property
+    def deleted_rows(self) -> int:
+        return sum(end - start for start, end in self.tombstones.values())
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def __contains__(self, block_id: str) -> bool:
+        return block_id in self.offsets
+
+    # --- Loading ---
+
+    def load(self) -> bool:
+        if not self.exists():
+            return False
+        with open(self.manifest_path, "r") as f:
+            manifest = json.load(f)
+
+        segments = []
+        row_start = 0
+        for name in manifest["segments"]:
+            seg = self._read_segment(name, row_start)
+            segments.append(seg)
+            row_start += seg.nrows
+
+        self.segments = segments
+        self.next_segment_id = manifest.get("next_segment_id", len(segments) + 1)
+        self.tombstones = {k: tuple(v) for k, v in manifest.get("tombstones", {}).items()}
+        self._reset_pending(row_start)
+        self._rebuild_offsets()
+        self._remove_orphaned_files(set(manifest["segments"]))
+        return True
+
+    def has_legacy_store(self, models_dir: str) -> bool:
+        return os.path.exists(os.path.join(models_dir, self.LEGACY_EMBEDDINGS_FILE))
+
+    def load_legacy_store(self, models_dir: str) -> Dict[str, Tuple[np.ndarray, List[dict]]]:
+        # Single-matrix layout written before segments existed
+        embeddings = np.load(os.path.join(models_dir, self.LEGACY_EMBEDDINGS_FILE), mmap_mode="r")
+        meta = np.load(os.path.join(models_dir, self.LEGACY_META_FILE), allow_pickle=True).item()
+        return {
+            block_id: (embeddings[start:end], meta["chunks"][start:end])
+            for block_id, (start, end) in meta["offsets"].items()
+        }
+
+    # --- Writing ---
+
+    def add_block(self, block_meta: dict, block_vector: np.ndarray, chunk_vectors: np.ndarray, chunks: List[dict]):
+        block_id = block_meta["block_id"]
+        if block_id in self.offsets or block_id in self.tombstones:
+            raise ValueError(f"Block '{block_id}' is already in the store")
+        vectors = np.ascontiguousarray(chunk_vectors, dtype="float32").reshape(-1, self.dimension)
+        block_vector = np.ascontiguousarray(block_vector, dtype="float32").reshape(1, self.dimension)
+
+        seg = self.pending
+        local_start = seg.nrows
+        # Grow the pending buffer geometrically: a document's blocks stay pending until
+        # its flush, and re-concatenating per block would copy O(blocks^2) rows.
+        # Readers keep their own views of the rows already written.
+        buffer = self._pending_buffer
+        if len(buffer) < local_start + len(vectors):
+            grown = np.zeros((max(2 * len(buffer), local_start + len(vectors), 64), self.dimension), dtype="float32")
+            grown[:local_start] = buffer[:local_start]
+            buffer = self._pending_buffer = grown
+        buffer[local_start:local_start + len(vectors)] = vectors
+        seg.vectors = buffer[:local_start + len(vectors)]
+        seg.block_vectors = np.concatenate([seg.block_vectors, block_vector], axis=0)
+        seg.blocks.append(block_meta)
+        seg.chunks.extend(chunks)
+        seg.offsets[block_id] = (local_start, local_start + len(vectors))
+        self.offsets[block_id] = (seg.row_start + local_start, seg.row_start + local_start + len(vectors))
+
+    def flush(self) -> Optional[str]:
+        """Writes pending blocks as a new segment and commits it to the manifest."""
+        with self._lock:
+            if not self.pending.blocks:
+                if not self.exists():
+                    self._write_manifest([seg.name for seg in self.segments])
+                return None
+
+            name = self._allocate_segment_name()
+            self._write_segment(name, self.pending)
+            self._write_manifest([seg.name for seg in self.segments] + [name])
+
+            committed = self._read_segment(name, self.pending.row_start)
+            self.segments = self.segments + [committed]
+            self._reset_pending(committed.row_start + committed.nrows)
+        if self._retired:
+            self._retire_segments([])
+        return name
+
+    def delete_block(self, block_id: str) -> Tuple[int, int]:
+        """
+        Tombstones a committed block: it disappears from lookups immediately and its
+        rows are dropped by the next purge. Only the manifest is rewritten. Returns its rows.
+        """
+        with self._lock:
+            if self.pending.offsets.get(block_id) is not None:
+                raise ValueError("Flush the store before deleting blocks added since the last flush")
+            rows = self.offsets.pop(block_id)
+            self.tombstones[block_id] = rows
+            self._write_manifest([seg.name for seg in self.segments])
+            if self.cache is not None:
+                self.cache.pop(("chunks", block_id))
+            return rows
+
+    # --- Compaction ---
+
+    def needs_compaction(self) -> bool:
+        return self._plan_merge(self.segments) is not None
+
+    def compact_async(self):
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self.merge_tiers, daemon=True)
+        self._compaction_thread.start()
+
+    def wait_for_compaction(self):
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+
+    def merge_tiers(self):
+        """
+        Tiered compaction (what compact_async runs): merges runs of adjacent segments
+        of similar size until no run qualifies (see _plan_merge). A row is only
+        rewritten when its segment at least doubles, so each row is copied
+        O(log(store size)) times instead of on every compaction.
+        """
+        while True:
+            with self._lock:
+                run = None if self._purging else self._plan_merge(self.segments)
+            if run is None or not self._merge(run):
+                return
+
+    def compact(self):
+        """Merges all committed segments into one contiguous segment (a full rewrite)."""
+        with self._lock:
+            run = [] if self._purging else list(self.segments)
+        if len(run) > 1:
+            self._merge(run)
+
+    def _plan_merge(self, segments: List[Segment]) -> Optional[List[Segment]]:
+        # Only adjacent segments can merge: global rows stay in segment order.
+        # Of the runs of `compact_after_segments` segments where no segment is more
+        # than half of the run, take the most balanced; a small segment next to a
+        # large one waits for its peers instead of forcing the large one to be copied.
+        width = self.compact_after_segments
+        best, best_skew = None, 0.5
+        for i in range(len(segments) - width + 1):
+            run = segments[i:i + width]
+            sizes = [seg.nrows for seg in run]
+            skew = max(sizes) / max(1, sum(sizes))
+            if skew <= best_skew:
+                best, best_skew = run, skew
+        return best
+
+    def _merge(self, run: List[Segment]) -> bool:
+        """Writes `run` (adjacent segments) as one new segment and swaps it in. False if stale."""
+        with self._lock:
+            name = self._allocate_segment_name()
+        base = run[0].row_start
+        self._write_blocks(name, [(seg, i) for seg in run for i in range(len(seg.blocks))])
+
+        with self._lock:
+            position = next((i for i, seg in enumerate(self.segments) if seg is run[0]), None)
+            if position is None or self.segments[position:position + len(run)] != run:
+                # The store was purged meanwhile; this merge is stale
+                self._remove_segment_files(name)
+                return False
+            merged = self._read_segment(name, base)
+            segments = self.segments[:position] + [merged] + self.segments[position + len(run):]
+            self._write_manifest([seg.name for seg in segments])
+            self.segments = segments
+
+        self._retire_segments([seg.name for seg in run])
+        print(f"Chunk store compacted {len(run)} segments ({merged.nrows} rows) into {name}.")
+        return True
+
+    def prepare_purge(self) -> Optional[dict]:
+        """
+        Writes the live blocks of the committed segments as one new segment. Only the
+        snapshot is taken under the lock: the copy is streamed without it, so blocks
+        can be added and deleted meanwhile (commit_purge rebases them). Compaction
+        is paused until commit_purge() or abort_purge(). Returns a plan with the
+        segment name, the new block vectors and row_map (old global row -> new row,
+        -1 for purged rows), or None when there is nothing to purge.
+        """
+        with self._lock:
+            self._purging = True
+        self.wait_for_compaction()
+        with self._lock:
+            segments = list(self.segments)
+            tombstones = dict(self.tombstones)
+            if not tombstones:
+                self._purging = False
+                return None
+            name = self._allocate_segment_name()
+
+        try:
+            old_total = segments[-1].row_start + segments[-1].nrows if segments else 0
+            row_map = np.full(old_total, -1, dtype="int64")
+            live = [(seg, i) for seg in segments for i, block in enumerate(seg.blocks)
+                    if block["block_id"] not in tombstones]
+            offsets = self._write_blocks(name, live)
+            for seg, i in live:
+                block_id = seg.blocks[i]["block_id"]
+                start, end = seg.offsets[block_id]
+                new_start = offsets[block_id][0]
+                row_map[seg.row_start + start:seg.row_start + end] = np.arange(new_start, new_start + end - start)
+        except Exception:
+            self._remove_segment_files(name)
+            self.abort_purge()
+            raise
+        block_vectors = np.asarray([seg.block_vectors[i] for seg, i in live], dtype="float32").reshape(-1, self.dimension)
+        return {"name": name, "segments": segments, "tombstones": tombstones, "row_map": row_map,
+                "nrows": sum(end - start for start, end in offsets.values()), "block_vectors": block_vectors}
+
+    def commit_purge(self, plan: dict) -> np.ndarray:
+        """
+        Swaps the purged segment in (manifest first) and deletes the old segment files.
+        Segments flushed, blocks still pending and tombstones recorded since
+        prepare_purge() are kept and renumbered. Returns the row map for every row
+        the store had before the swap (old global row -> new row, -1 if purged).
+        """
+        with self._lock:
+            n = len(plan["segments"])
+            if self.segments[:n] != plan["segments"]:
+                self._remove_segment_files(plan["name"])
+                self._purging = False
+                raise RuntimeError("Chunk store changed while purging")
+            old_total = len(plan["row_map"])
+            shift = plan["nrows"] - old_total
+            row_map = np.concatenate([plan["row_map"], np.arange(old_total, self.ntotal, dtype="int64") + shift])
+
+            purged = self._read_segment(plan["name"], 0)
+            segments = [purged]
+            for seg in self.segments[n:]:
+                segments.append(Segment(seg.name, seg.row_start + shift, seg.vectors, seg.block_vectors,
+                                        seg.blocks, seg.offsets, seg.chunks))
+            self.pending.row_start += shift
+            self.tombstones = {
+                block_id: (int(row_map[start]), int(row_map[start]) + end - start)
+                for block_id, (start, end) in self.tombstones.items() if block_id not in plan["tombstones"]
+            }
+            self._write_manifest([seg.name for seg in segments])
+            self.segments = segments
+            self._rebuild_offsets()
+            self._purging = False
+        self._retire_segments([seg.name for seg in plan["segments"]])
+        return row_map
+
+    def abort_purge(self):
+        with self._lock:
+            self._purging = False
+
+    # --- Reading ---
+
+    def get_block(self, block_id: str) -> Optional[Tuple[np.ndarray, List[dict]]]:
+        # Vectors are returned in the segment's stored dtype (float32 or float16)
+        if block_id not in self.offsets:
+            return None
+        start, end = self.offsets[block_id]
+        seg = self._segment_for_row(start)
+        local_start, local_end = start - seg.row_start, end - seg.row_start
+        if seg.name is None or self.cache is None:
+            return seg.vectors[local_start:local_end], seg.chunks[local_start:local_end]
+        chunks = self.cache.get(("chunks", block_id))
+        if chunks is None:
+            chunks = seg.chunks[local_start:local_end]
+            self.cache.put(("chunks", block_id), chunks)
+        return seg.vectors[local_start:local_end], chunks
+
+    def get_vectors(self, block_id: str) -> Optional[np.ndarray]:
+        """A block's vectors without decoding its chunk dicts."""
+        if block_id not in self.offsets:
+            return None
+        start, end = self.offsets[block_id]
+        seg = self._segment_for_row(start)
+        return seg.vectors[start - seg.row_start:end - seg.row_start]
+
+    def get_rows(self, rows: List[int]) -> Tuple[np.ndarray, List[dict]]:
+        """Fetches individual chunks by global row: (float32 vectors, chunk dicts)."""
+        vectors = np.zeros((len(rows), self.dimension), dtype="float32")
+        chunks = []
+        for i, row in enumerate(rows):
+            seg = self._segment_for_row(row)
+            vectors[i] = seg.vectors[row - seg.row_start]
+            chunks.append(seg.chunks[row - seg.row_start])
+        return vectors, chunks
+
+    def iter_chunks(self, start_row: int = 0):
+        """Yields chunk dicts in global row order, starting at `start_row`."""
+        for seg in self.segments + [self.pending]:
+            end = seg.row_start + seg.nrows
+            if end <= start_row:
+                continue
+            yield from seg.chunks[max(0, start_row - seg.row_start):]
+
+    def _segment_for_row(self, row: int) -> Segment:
+        segments = self.segments + [self.pending]
+        starts = [s.row_start for s in segments]
+        return segments[bisect.bisect_right(starts, row) - 1]
+
+    # --- Internals ---
+
+    def _reset_pending(self, row_start: int):
+        # Always a fresh buffer: views handed out for the previous pending rows stay valid
+        self.pending = self._empty_segment(row_start)
+        self._pending_buffer = np.zeros((0, self.dimension), dtype="float32")
+
+    def _empty_segment(self, row_start: int) -> Segment:
+        return Segment(
+            name=None,
+            row_start=row_start,
+            vectors=np.zeros((0, self.dimension), dtype="float32"),
+            block_vectors=np.zeros((0, self.dimension), dtype="float32"),
+            blocks=[],
+            offsets={},
+            chunks=[],
+        )
+
+    def _rebuild_offsets(self):
+        offsets = {}
+        for seg in self.segments + [self.pending]:
+            for block_id, (start, end) in seg.offsets.items():
+                if block_id not in self.tombstones:
+                    offsets[block_id] = (seg.row_start + start, seg.row_start + end)
+        self.offsets = offsets
+
+    def _allocate_segment_name(self) -> str:
+        name = f"seg_{self.next_segment_id:06d}"
+        self.next_segment_id += 1
+        return name
+
+    def _segment_paths(self, name: str) -> Tuple[str, str, str, str, str]:
+        # vectors, block vectors, block meta, chunk records, record offsets
+        base = os.path.join(self.store_dir, name)
+        return (f"{base}_chunks.npy", f"{base}_blocks.npy", f"{base}_meta.npy",
+                f"{base}_records.bin", f"{base}_records.npy")
+
+    def _write_segment(self, name: str, seg: Segment):
+        os.makedirs(self.store_dir, exist_ok=True)
+        chunks_path, blocks_path, meta_path, _, _ = self._segment_paths(name)
+        self._write_records(name, (pickle.dumps(c, protocol=pickle.HIGHEST_PROTOCOL) for c in seg.chunks))
+        self._atomic_save(chunks_path, np.ascontiguousarray(seg.vectors, dtype=self.vector_dtype))
+        self._atomic_save(blocks_path, np.ascontiguousarray(seg.block_vectors, dtype="float32"))
+        self._atomic_save(meta_path, {
+            "blocks": seg.blocks,
+            "offsets": seg.offsets,
+            "vector_dtype": self.vector_dtype,
+        })
+
+    def _write_blocks(self, name: str, blocks: List[Tuple[Segment, int]]) -> Dict[str, Tuple[int, int]]:
+        """
+        Copies committed blocks, given as (segment, index in segment.blocks) in output
+        order, into a new segment file set. Vectors go straight into a memory-mapped
+        .npy and chunk records are copied as encoded bytes, so memory stays at one
+        block whatever the segment size. Returns the new local offsets per block_id.
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        chunks_path, blocks_path, meta_path, _, _ = self._segment_paths(name)
+        offsets: Dict[str, Tuple[int, int]] = {}
+        ranges = []
+        row = 0
+        for seg, i in blocks:
+            block_id = seg.blocks[i]["block_id"]
+            start, end = seg.offsets[block_id]
+            offsets[block_id] = (row, row + end - start)
+            ranges.append((seg, start, end))
+            row += end - start
+
+        if row == 0:
+            self._atomic_save(chunks_path, np.zeros((0, self.dimension), dtype=self.vector_dtype))
+        else:
+            tmp_path = chunks_path + ".tmp"
+            out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=self.vector_dtype, shape=(row, self.dimension))
+            row = 0
+            for seg, start, end in ranges:
+                out[row:row + end - start] = seg.vectors[start:end]
+                row += end - start
+            out.flush()
+            del out
+            with open(tmp_path, "rb+") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, chunks_path)
+
+        self._write_records(name, (record for seg, start, end in ranges for record in self._raw_records(seg, start, end)))
+        block_vectors = [seg.block_vectors[i] for seg, i in blocks]
+        self._atomic_save(blocks_path, np.asarray(block_vectors, dtype="float32").reshape(-1, self.dimension))
+        self._atomic_save(meta_path, {
+            "blocks": [seg.blocks[i] for seg, i in blocks],
+            "offsets": offsets,
+            "vector_dtype": self.vector_dtype,
+        })
+        return offsets
+
+    @staticmethod
+    def _raw_records(seg: Segment, start: int, end: int) -> Iterable[bytes]:
+        if isinstance(seg.chunks, ChunkRecords):
+            return seg.chunks.raw(start, end)
+        return (pickle.dumps(c, protocol=pickle.HIGHEST_PROTOCOL) for c in seg.chunks[start:end])
+
+    def _write_records(self, name: str, records: Iterable[bytes]):
+        # Streams encoded chunk dicts to disk with their row offsets
+        _, _, _, records_path, index_path = self._segment_paths(name)
+        offsets = [0]
+        tmp_path = records_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for record in records:
+                f.write(record)
+                offsets.append(offsets[-1] + len(record))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, records_path)
+        self._atomic_save(index_path, np.asarray(offsets, dtype="int64"))
+
+    def _read_segment(self, name: str, row_start: int) -> Segment:
+        chunks_path, blocks_path, meta_path, records_path, index_path = self._segment_paths(name)
+        meta = np.load(meta_path, allow_pickle=True).item()
+        if "chunks" in meta:
+            chunks = meta["chunks"]  # format 1
+        else:
+            chunks = ChunkRecords(records_path, np.load(index_path, mmap_mode="r"))
+        return Segment(
+            name=name,
+            row_start=row_start,
+            vectors=np.load(chunks_path, mmap_mode="r"),
+            block_vectors=np.load(blocks_path),
+            blocks=meta["blocks"],
+            offsets={k: tuple(v) for k, v in meta["offsets"].items()},
+            chunks=chunks,
+        )
+
+    def _remove_segment_files(self, name: str) -> bool:
+        removed = True
+        for path in self._segment_paths(name):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except PermissionError:
+                removed = False  # still memory-mapped by a reader (Windows)
+        return removed
+
+    def _retire_segments(self, names: List[str]):
+        """
+        Deletes the files of segments no longer in the manifest, along with any
+        retired earlier that were still in use. Files that cannot be deleted yet
+        are retried on the next flush, merge or purge, and at the latest on startup.
+        """
+        with self._lock:
+            self._retired.update(names)
+            retired = sorted(self._retired)
+        removed = {name for name in retired if self._remove_segment_files(name)}
+        with self._lock:
+            self._retired -= removed
+
+    def _remove_orphaned_files(self, live: set):
+        # Segments retired by a previous run, or written by a merge or purge that crashed
+        # before its manifest swap
+        if not os.path.isdir(self.store_dir):
+            return
+        for filename in os.listdir(self.store_dir):
+            match = self.SEGMENT_FILE_PATTERN.match(filename)
+            if match and match.group(1) not in live:
+                try:
+                    os.remove(os.path.join(self.store_dir, filename))
+                except PermissionError:
+                    with self._lock:
+                        self._retired.add(match.group(1))
+
+    def _write_manifest(self, segment_names: List[str]):
+        os.makedirs(self.store_dir, exist_ok=True)
+        manifest = {
+            "version": self.FORMAT_VERSION,
+            "dimension": self.dimension,
+            "segments": segment_names,
+            "next_segment_id": self.next_segment_id,
+            "vector_dtype": self.vector_dtype,
+            "tombstones": self.tombstones,
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def _atomic_save(path: str, obj):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, obj, allow_pickle=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
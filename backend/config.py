@@ -0,0 +1,96 @@
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+# Load indexes and models in a background thread so the server accepts requests immediately
+# ("/" reports readiness, /ready returns 503 until loaded); 0 loads them before serving
+BACKGROUND_LOADING = _env_int("RAG_BACKGROUND_LOADING", 1) == 1
+
+# Prometheus-style /metrics and per-stage request timings; 0 turns all recording into no-ops
+METRICS = _env_int("RAG_METRICS", 1) == 1
+
+# Memory budget for lazily loaded chunk-level FAISS indexes (LRU evicted)
+CHUNK_CACHE_MB = _env_int("RAG_CHUNK_CACHE_MB", 512)
+
+# Stage-1 block index: flat | ivf_flat | hnsw | ivf_pq
+BLOCK_INDEX = os.environ.get("RAG_BLOCK_INDEX", "flat")
+# Stay on exact flat search until the corpus has this many blocks
+BLOCK_INDEX_THRESHOLD = _env_int("RAG_BLOCK_INDEX_THRESHOLD", 10000)
+BLOCK_NPROBE = _env_int("RAG_BLOCK_NPROBE", 16)
+BLOCK_EF_SEARCH = _env_int("RAG_BLOCK_EF_SEARCH", 64)
+
+# Chunk-level vector compression: none | fp16 | sq8 | pq
+CHUNK_QUANTIZATION = os.environ.get("RAG_CHUNK_QUANTIZATION", "none")
+# Compressed indexes fetch top_k * factor candidates and re-rank them exactly
+CHUNK_RERANK_FACTOR = _env_int("RAG_CHUNK_RERANK_FACTOR", 4)
+
+# Hybrid retrieval: BM25 over chunk texts fused with dense results (reciprocal-rank fusion)
+HYBRID_SEARCH = _env_int("RAG_HYBRID_SEARCH", 0) == 1
+# Share of the query's idf-weighted terms a BM25 hit must match to be kept below the dense threshold
+LEXICAL_MIN_COVERAGE = _env_float("RAG_LEXICAL_MIN_COVERAGE", 0.5)
+RRF_K = _env_int("RAG_RRF_K", 60)
+
+# Optional cross-encoder re-ranking of stage-2 candidates (models/reranker_model if present,
+# else RAG_RERANKER_MODEL). Questions whose best candidate is below RAG_RERANK_MIN_RELEVANCE
+# are refused without calling the LLM.
+RERANKER = _env_int("RAG_RERANKER", 0) == 1
+RERANKER_MODEL = os.environ.get("RAG_RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = _env_int("RAG_RERANK_CANDIDATES", 20)
+RERANK_BATCH_SIZE = _env_int("RAG_RERANK_BATCH_SIZE", 32)
+RERANK_CACHE_SIZE = _env_int("RAG_RERANK_CACHE_SIZE", 4096)
+# relevance = sigmoid(scale * logit + bias); fit scale/bias with `python -m backend.reranker labels.jsonl`
+RERANK_SCALE = _env_float("RAG_RERANK_SCALE", 1.0)
+RERANK_BIAS = _env_float("RAG_RERANK_BIAS", 0.0)
+RERANK_MIN_RELEVANCE = _env_float("RAG_RERANK_MIN_RELEVANCE", 0.1)
+
+# Persistent chunk embedding cache (models/embedding_cache.sqlite); set to 0 to disable
+EMBEDDING_CACHE = _env_int("RAG_EMBEDDING_CACHE", 1) == 1
+# Size cap of that file; the oldest embeddings are deleted past it
+EMBEDDING_CACHE_MB = _env_int("RAG_EMBEDDING_CACHE_MB", 1024)
+
+# In-process caches for repeated chat questions (invalidated when the index changes)
+QUERY_CACHE_SIZE = _env_int("RAG_QUERY_CACHE_SIZE", 1024)
+QUERY_CACHE_TTL = _env_float("RAG_QUERY_CACHE_TTL", 300.0)
+# Reuse a full answer when a query embedding is this close (squared L2) to a cached one; 0 disables
+SEMANTIC_CACHE_DISTANCE = _env_float("RAG_SEMANTIC_CACHE_DISTANCE", 0.0)
+SEMANTIC_CACHE_SIZE = _env_int("RAG_SEMANTIC_CACHE_SIZE", 256)
+
+# Deleted documents are tombstoned; the store is rewritten without them in the background
+# once deleted chunks exceed this share of all stored chunks
+PURGE_DELETED_FRACTION = _env_float("RAG_PURGE_DELETED_FRACTION", 0.25)
+
+# Background ingestion workers behind /upload
+INGEST_WORKERS = _env_int("RAG_INGEST_WORKERS", 1)
+
+# Parallel PDF text extraction: worker processes and pages handed to each task
+PDF_WORKERS = _env_int("RAG_PDF_WORKERS", os.cpu_count() or 1)
+PDF_PAGES_PER_TASK = _env_int("RAG_PDF_PAGES_PER_TASK", 16)
+
+# Chunks embedded per micro-batch during (streaming) ingestion
+EMBED_BATCH_SIZE = _env_int("RAG_EMBED_BATCH_SIZE", 64)
+
+# Chunks per embedding call in `python -m backend.bulk_ingest`, batched across documents
+BULK_EMBED_BATCH_SIZE = _env_int("RAG_BULK_EMBED_BATCH_SIZE", min(1024, 64 * (os.cpu_count() or 1)))
+
+# llama.cpp instances and the CPU threads split between them
+LLM_INSTANCES = _env_int("RAG_LLM_INSTANCES", 1)
+LLM_THREADS = _env_int("RAG_LLM_THREADS", 6)
+# Context window and answer allowance; retrieved chunks are packed into the rest
+LLM_CONTEXT = _env_int("RAG_LLM_CONTEXT", 4096)
+LLM_MAX_TOKENS = _env_int("RAG_LLM_MAX_TOKENS", 512)
+# Evaluate the constant system-instruction prefix at startup (llama.cpp reuses it across requests anyway)
+LLM_PREFIX_CACHE = _env_int("RAG_LLM_PREFIX_CACHE", 1) == 1
+
+# Chat generation pool: concurrent generations, requests allowed to wait, per-request timeout (s)
+LLM_WORKERS = _env_int("RAG_LLM_WORKERS", LLM_INSTANCES)
+LLM_QUEUE_SIZE = _env_int("RAG_LLM_QUEUE_SIZE", 16)
+LLM_TIMEOUT = _env_float("RAG_LLM_TIMEOUT", 120.0)
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+
+class QueueFullError(Exception):
+    """Raised when a request arrives while every worker is busy and the queue is full."""
+
+    def __init__(self, queue_depth: int):
+        super().__init__(f"Server busy: {queue_depth} requests queued")
+        self.queue_depth = queue_depth
+
+
+class BoundedExecutor:
+    """
+    Runs blocking work (retrieval + LLM generation) on a fixed worker pool so it
+    never blocks the event loop. At most `max_workers` jobs run and `max_queue`
+    wait; anything beyond that is rejected immediately (admission control).
+    """
+
+    _DONE = object()
+
+    def __init__(self, max_workers: int = 1, max_queue: int = 16, name: str = "llm"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - self.max_workers)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+        }
+
+    def _admit(self) -> int:
+        # Returns the queue position (0 = runs immediately)
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                raise QueueFullError(self.queue_depth)
+            position = max(0, self._in_flight - self.max_workers + 1)
+            self._in_flight += 1
+            return position
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _submit(self, fn: Callable[..., Any], *args) -> asyncio.Future:
+        # The slot is freed on the worker itself, so it never depends on the event loop
+        def task():
+            try:
+                return fn(*args)
+            finally:
+                self._release()
+
+        try:
+            return asyncio.get_running_loop().run_in_executor(self._pool, task)
+        except Exception:
+            self._release()
+            raise
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        """
+        Runs fn(*args) on the pool. Raises QueueFullError when saturated and
+        asyncio.TimeoutError after `timeout` seconds. The slot stays taken until
+        the worker actually finishes, so timed-out work still counts against capacity.
+        """
+        self._admit()
+        future = self._submit(fn, *args)
+        return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+
+    def stream(self, gen_factory: Callable[[], Iterator[Any]], timeout: Optional[float] = None,
+               is_disconnected: Optional[Callable[[], Any]] = None,
+               on_queued: Optional[Callable[[int], Any]] = None) -> AsyncIterator[Any]:
+        """
+        Iterates a blocking generator on the pool and returns an async iterator over
+        its items. Admission happens here (QueueFullError is raised before any
+        response starts). Iteration stops, and the generator is closed on its worker,
+        when the client disconnects, the consumer goes away or `timeout` seconds
+        elapse (asyncio.TimeoutError).
+        """
+        position = self._admit()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def publish(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                cancelled.set() # Event loop closed
+
+        def produce():
+            try:
+                gen = gen_factory()
+                try:
+                    for item in gen:
+                        if cancelled.is_set():
+                            break
+                        publish(item)
+                finally:
+                    gen.close()
+            except Exception as e:
+                publish(e)
+            finally:
+                publish(self._DONE)
+
+        self._submit(produce)
+        return self._consume(queue, cancelled, position, timeout, is_disconnected, on_queued)
+
+    async def _consume(self, queue: asyncio.Queue, cancelled: threading.Event, position: int,
+                       timeout: Optional[float], is_disconnected, on_queued) -> AsyncIterator[Any]:
+        loop = asyncio.get_running_loop()
+        try:
+            if position and on_queued is not None:
+                yield on_queued(position)
+
+            deadline = None if timeout is None else loop.time() + timeout
+            while True:
+                if is_disconnected is not None and await is_disconnected():
+                    break
+                wait = 1.0 if deadline is None else min(1.0, deadline - loop.time())
+                if wait <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=wait)
+                except asyncio.TimeoutError:
+                    continue # Re-check disconnect / deadline
+                if item is self._DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
@@ -1,34 +1,62 @@
 import os
-from typing import List
+import uuid
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional
 import pypdf
 import docx
 from fastapi import UploadFile
+from backend import config
+
+
+def _extract_pdf_range(file_path: str, start: int, end: int) -> List[dict]:
+    # Runs in a worker process: open the PDF independently and extract pages [start, end)
+    reader = pypdf.PdfReader(file_path)
+    records = []
+    for i in range(start, end):
+        text = reader.pages[i].extract_text()
+        if text:
+            records.append({"text": text, "page": i + 1})
+    return records
+
 
 class DocumentProcessor:
-    def __init__(self, upload_dir: str = "uploads"):
+    def __init__(self, upload_dir: str = "uploads", pdf_workers: Optional[int] = None,
+                 pdf_pages_per_task: Optional[int] = None):
         self.upload_dir = upload_dir
+        self.pdf_workers = pdf_workers if pdf_workers is not None else config.PDF_WORKERS
+        self.pdf_pages_per_task = pdf_pages_per_task or config.PDF_PAGES_PER_TASK
         os.makedirs(self.upload_dir, exist_ok=True)
 
+    UPLOAD_CHUNK_BYTES = 1024 * 1024
+
     async def save_file(self, file: UploadFile) -> str:
-        file_path = os.path.join(self.upload_dir, file.filename)
+        # One file per upload: a queued job must not see a later upload of the same name.
+        # The caller removes it once ingested. Copied in fixed-size pieces, not read whole.
+        file_path = os.path.join(self.upload_dir, f"{uuid.uuid4().hex}_{os.path.basename(file.filename)}")
         with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+            while True:
+                content = await file.read(self.UPLOAD_CHUNK_BYTES)
+                if not content:
+                    break
+                f.write(content)
         return file_path
 
     def extract_text(self, file_path: str) -> List[dict]:
         """
         Extracts text from file. Returns a list of dicts with 'text' and 'page' (if applicable).
         """
+        return list(self.iter_pages(file_path))
+
+    def iter_pages(self, file_path: str) -> Iterator[dict]:
+        """
+        Streaming form of extract_text: yields {text, page} records one page at a time.
+        """
         ext = os.path.splitext(file_path)[1].lower()
-        chunks = []
 
         if ext == ".pdf":
-            reader = pypdf.PdfReader(file_path)
-            for i, page in enumerate(reader.pages):
-                text = page.extract_text()
-                if text:
-                    chunks.append({"text": text, "page": i + 1})
+            yield from self.iter_pdf_pages(file_path)
         
         elif ext == ".docx":
             doc = docx.Document(file_path)
@@ -38,21 +66,53 @@ class DocumentProcessor:
             # DOCX doesn't have strict pages, so we treat it as one big page or split roughly
             # For simplicity, we stick to one block, but RAG usually needs chunking.
             # We will handle chunking later, here we just get raw text.
-            chunks.append({"text": "\n".join(full_text), "page": 1})
+            yield {"text": "\n".join(full_text), "page": 1}
             
         elif ext == ".txt":
             with open(file_path, "r", encoding="utf-8") as f:
                 text = f.read()
-            chunks.append({"text": text, "page": 1})
-            
-        return chunks
+            yield {"text": text, "page": 1}
+
+    def iter_pdf_pages(self, file_path: str) -> Iterator[dict]:
+        """
+        Yields {text, page} records in page order. Large PDFs are split into page
+        ranges extracted by a process pool; at most 2 ranges per worker are in
+        flight, so memory stays bounded regardless of document size.
+        """
+        reader = pypdf.PdfReader(file_path)
+        n_pages = len(reader.pages)
+        step = self.pdf_pages_per_task
+
+        if self.pdf_workers <= 1 or n_pages <= step:
+            for i, page in enumerate(reader.pages):
+                text = page.extract_text()
+                if text:
+                    yield {"text": text, "page": i + 1}
+            return
+        del reader
+
+        ranges = deque((start, min(start + step, n_pages)) for start in range(0, n_pages, step))
+        workers = min(self.pdf_workers, len(ranges))
+        # spawn: forking a multi-threaded server process is not safe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            in_flight = deque()
+            while ranges or in_flight:
+                while ranges and len(in_flight) < 2 * workers:
+                    start, end = ranges.popleft()
+                    in_flight.append(pool.submit(_extract_pdf_range, file_path, start, end))
+                # Results are consumed in submission order, which is page order
+                yield from in_flight.popleft().result()
 
     def chunk_text(self, raw_chunks: List[dict], chunk_size: int = 500, overlap: int = 50) -> List[dict]:
         """
         Splits extracted text into smaller semantic chunks.
         """
-        processed_chunks = []
-        
+        return list(self.iter_chunks(raw_chunks, chunk_size, overlap))
+
+    def iter_chunks(self, raw_chunks: Iterable[dict], chunk_size: int = 500, overlap: int = 50) -> Iterator[dict]:
+        """
+        Streaming form of chunk_text: consumes page records lazily and yields chunks.
+        """
         for item in raw_chunks:
             text = item["text"]
             page = item["page"]
@@ -67,11 +127,11 @@ class DocumentProcessor:
                 # Check for word boundary/newline to avoid cutting words
                 # (Simple fallback)
                 
-                processed_chunks.append({
+                start += (chunk_size - overlap)
+                if not chunk_text.strip():
+                    continue  # blank pages of a scan or a blank TXT have nothing to index
+                yield {
                     "text": chunk_text,
                     "page": page,
                     "source": "file" # Placeholder
-                })
-                start += (chunk_size - overlap)
-                
-        return processed_chunks
+                }
@@ -0,0 +1,106 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+# Job lifecycle
+QUEUED = "queued"
+EXTRACTING = "extracting"
+INDEXING = "indexing"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class IngestionJob:
+    def __init__(self, filename: str, doc_id: str):
+        self.job_id = str(uuid.uuid4())
+        self.filename = filename
+        self.doc_id = doc_id
+        self.status = QUEUED
+        self.error: Optional[str] = None
+
+        # Progress counters
+        self.pages_extracted = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.blocks_indexed = 0
+
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "id": self.doc_id,
+                "filename": self.filename,
+                "status": self.status,
+                "error": self.error,
+                "pages_extracted": self.pages_extracted,
+                "chunks_total": self.chunks_total,
+                "chunks_embedded": self.chunks_embedded,
+                "blocks_indexed": self.blocks_indexed,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class IngestionJobManager:
+    """
+    Runs ingestion work on a worker pool so /upload can return immediately.
+    Keeps the most recent `max_history` jobs for status queries.
+    """
+
+    def __init__(self, max_workers: int = 1, max_history: int = 1000):
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, filename: str, doc_id: str, work: Callable[[IngestionJob], None]) -> IngestionJob:
+        job = IngestionJob(filename, doc_id)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._trim_history()
+        self._executor.submit(self._run, job, work)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: IngestionJob, work: Callable[[IngestionJob], None]):
+        job.update(started_at=time.time())
+        try:
+            work(job)
+            job.update(status=COMPLETED, finished_at=time.time())
+        except Exception as e:
+            print(f"Ingestion Error ({job.filename}): {e}")
+            job.update(status=FAILED, error=str(e), finished_at=time.time())
+
+    def _trim_history(self):
+        # Drop the oldest finished jobs first; never drop queued or running ones
+        if len(self._jobs) <= self.max_history:
+            return
+        for job_id in list(self._jobs.keys()):
+            if len(self._jobs) <= self.max_history:
+                break
+            if self._jobs[job_id].status in (COMPLETED, FAILED):
+                del self._jobs[job_id]
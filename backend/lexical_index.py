@@ -0,0 +1,421 @@
+import os
+import re
+import math
+import numpy as np
+from collections import Counter
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"\w+")
+# For ASCII text \w is [A-Za-z0-9_], so splitting on everything else is equivalent and faster
+_ASCII_SEPARATORS = str.maketrans({chr(c): " " for c in range(128) if not (chr(c).isalnum() or chr(c) == "_")})
+
+
+def tokenize(text: str) -> List[str]:
+    if text.isascii():
+        return text.lower().translate(_ASCII_SEPARATORS).split()
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _trigrams(term: str) -> set:
+    padded = f"^{term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up (returning limit + 1) once it exceeds `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _appended(buffer: np.ndarray, size: int, values: np.ndarray) -> np.ndarray:
+    """Writes values after buffer[:size], growing the buffer geometrically. Views of buffer[:size] stay valid."""
+    if len(buffer) < size + len(values):
+        grown = np.empty(max(2 * len(buffer), size + len(values), 64), dtype=buffer.dtype)
+        grown[:size] = buffer[:size]
+        buffer = grown
+    buffer[size:size + len(values)] = values
+    return buffer
+
+
+def _find(rows: np.ndarray, targets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """For ascending rows: (mask of the targets present in rows, their positions in rows)."""
+    positions = np.searchsorted(rows, targets)
+    if not len(rows):
+        return np.zeros(len(targets), dtype=bool), positions
+    return rows[np.minimum(positions, len(rows) - 1)] == targets, positions
+
+
+def _starts(counts: np.ndarray) -> np.ndarray:
+    return np.concatenate([[0], np.cumsum(counts)]).astype("int64")
+
+
+class PostingsSegment:
+    """
+    Immutable postings for a contiguous range of rows: for each term id (ascending),
+    the rows containing it (ascending) with their term frequencies.
+    """
+
+    def __init__(self, term_ids: np.ndarray, offsets: np.ndarray, postings: np.ndarray, nrows: int):
+        self.term_ids = term_ids
+        self.offsets = offsets  # term_ids[i] -> postings[:, offsets[i]:offsets[i + 1]]
+        self.postings = postings  # int32 [rows, term frequencies]
+        self.nrows = nrows
+
+    @classmethod
+    def build(cls, token_ids: np.ndarray, row_lengths: np.ndarray, start_row: int) -> "PostingsSegment":
+        """From the term id of every token of rows start_row, start_row + 1, ... (row_lengths tokens each)."""
+        n = len(row_lengths)
+        pairs, counts = np.unique(token_ids * n + np.repeat(np.arange(n), row_lengths), return_counts=True)
+        term_of_pair = pairs // n
+        first = np.concatenate([[0], np.flatnonzero(np.diff(term_of_pair)) + 1]) if len(pairs) else pairs
+        return cls(term_of_pair[first], np.append(first, len(pairs)).astype("int64"),
+                   np.stack([pairs % n + start_row, counts]).astype("int32"), n)
+
+    @classmethod
+    def merge(cls, segments: List["PostingsSegment"]) -> "PostingsSegment":
+        """Merges segments of consecutive row ranges, given in row order."""
+        term_ids = np.concatenate([s.term_ids for s in segments])
+        counts = np.concatenate([np.diff(s.offsets) for s in segments])
+        postings = np.concatenate([s.postings for s in segments], axis=1)
+        # Each (segment, term) group moves to its term's run, after the same term's
+        # groups from earlier segments, which keeps every term's rows ascending
+        order = np.argsort(term_ids, kind="stable")
+        source = _starts(counts)[:-1]
+        target = np.empty_like(source)
+        target[order] = _starts(counts[order])[:-1]
+        merged = np.empty_like(postings)
+        merged[:, np.repeat(target - source, counts) + np.arange(postings.shape[1])] = postings
+        unique, first = np.unique(term_ids[order], return_index=True)
+        return cls(unique, np.append(target[order][first], postings.shape[1]).astype("int64"), merged,
+                   sum(s.nrows for s in segments))
+
+    def remap(self, row_map: np.ndarray, start_row: int) -> "PostingsSegment":
+        """
+        Renumbers this segment's rows (from start_row on) by row_map, which keeps their
+        order and maps dropped rows to -1, and drops the terms left without rows.
+        """
+        mapped = row_map[start_row:start_row + self.nrows]
+        if self.nrows and mapped[0] >= 0 and mapped[-1] - mapped[0] == self.nrows - 1:
+            # No row dropped: the rows only shift
+            shift = int(mapped[0]) - start_row
+            if not shift:
+                return self
+            return PostingsSegment(self.term_ids, self.offsets, self.postings + np.array([[shift], [0]], dtype="int32"),
+                                   self.nrows)
+        moved = row_map[self.postings[0]]
+        keep = moved >= 0
+        kept_before = _starts(keep)
+        counts = kept_before[self.offsets[1:]] - kept_before[self.offsets[:-1]]
+        nonempty = counts > 0
+        return PostingsSegment(self.term_ids[nonempty], _starts(counts[nonempty]),
+                               np.stack([moved[keep], self.postings[1][keep]]).astype("int32"),
+                               int((mapped >= 0).sum()))
+
+    def lookup(self, term_ids: np.ndarray) -> Dict[int, np.ndarray]:
+        """Postings of those of term_ids (ascending) that occur in this segment."""
+        found, positions = _find(self.term_ids, term_ids)
+        return {int(term_ids[i]): self.postings[:, self.offsets[p]:self.offsets[p + 1]]
+                for i, p in zip(np.flatnonzero(found), positions[found])}
+
+
+class BM25Index:
+    """
+    In-memory inverted index over chunk texts, keyed by the chunk store's global row.
+
+    Postings live in immutable segments, one per add() batch, merged like a binary
+    counter (a segment absorbs the next one once that is as large), so there are
+    O(log n) of them and each posting is copied O(log n) times.
+
+    Terms found in more than `common_term_fraction` of the rows (and in at least
+    `common_term_min_df` rows, so small corpora keep every term) are skipped like
+    stopwords: they weigh little and have the longest postings. The other terms are
+    scored rarest first with max-score pruning: once no unseen row can reach the
+    top k, the remaining postings are only probed for the rows still in contention.
+
+    Query terms missing from the vocabulary (typos such as "marigin") are expanded
+    to vocabulary terms within a small edit distance, found through a character
+    trigram index, and scored with a reduced weight.
+
+    search() may run while add() or remove() modify the index (the engine calls it
+    without the index lock): it works on the rows and segments published together
+    when it starts.
+    """
+
+    FORMAT_VERSION = 2
+    ADD_BATCH_ROWS = 4096
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, fuzzy_weight: float = 0.7, min_fuzzy_length: int = 4,
+                 common_term_fraction: float = 0.05, common_term_min_df: int = 1000):
+        self.k1 = k1
+        self.b = b
+        self.fuzzy_weight = fuzzy_weight
+        self.min_fuzzy_length = min_fuzzy_length
+        self.common_term_fraction = common_term_fraction
+        self.common_term_min_df = common_term_min_df
+
+        self.terms: List[str] = []  # term id -> term
+        self.term_ids: Dict[str, int] = {}
+        self.df: List[int] = []  # term id -> live rows containing it
+        self.grams: Dict[str, set] = {}  # trigram -> terms containing it
+        self.removed: set = set()  # rows of deleted chunks (they keep their row number)
+        self.total_length = 0
+        self._lengths = np.zeros(0, dtype="int32")  # row -> token count
+        self._live = np.zeros(0, dtype=bool)
+        self._published: Tuple[int, List[PostingsSegment]] = (0, [])  # (nrows, segments), swapped as one
+
+    @property
+    def nrows(self) -> int:
+        return self._published[0]
+
+    @property
+    def live_rows(self) -> int:
+        return self.nrows - len(self.removed)
+
+    def _add_terms(self, terms: List[str]):
+        # Readers look terms up by name, so names are published last
+        first = len(self.terms)
+        self.df.extend([0] * len(terms))
+        self.terms.extend(terms)
+        self.term_ids.update(zip(terms, range(first, first + len(terms))))
+        for term in terms:
+            for gram in _trigrams(term):
+                self.grams.setdefault(gram, set()).add(term)
+
+    def add(self, start_row: int, texts: Iterable[str]):
+        """Indexes texts as rows start_row, start_row + 1, ... (rows must be appended in order)."""
+        if start_row != self.nrows:
+            raise ValueError(f"BM25 rows must be contiguous: expected {self.nrows}, got {start_row}")
+        batch = []
+        for text in texts:
+            batch.append(tokenize(text))
+            if len(batch) == self.ADD_BATCH_ROWS:
+                self._add_batch(batch)
+                batch = []
+        if batch:
+            self._add_batch(batch)
+
+    def _add_batch(self, row_terms: List[List[str]]):
+        start, segments = self._published
+        tokens = list(chain.from_iterable(row_terms))
+        self._add_terms(list(set(tokens).difference(self.term_ids)))
+        token_ids = np.fromiter(map(self.term_ids.__getitem__, tokens), dtype="int64", count=len(tokens))
+        lengths = np.fromiter(map(len, row_terms), dtype="int64", count=len(row_terms))
+        segment = PostingsSegment.build(token_ids, lengths, start)
+
+        df = self.df
+        for term_id, count in zip(segment.term_ids.tolist(), np.diff(segment.offsets).tolist()):
+            df[term_id] += count
+        self._lengths = _appended(self._lengths, start, lengths)
+        self._live = _appended(self._live, start, np.ones(len(lengths), dtype=bool))
+        self.total_length += int(lengths.sum())
+
+        segments = segments + [segment]
+        while len(segments) > 1 and segments[-2].nrows <= segments[-1].nrows:
+            segments[-2:] = [PostingsSegment.merge(segments[-2:])]
+        self._published = (start + len(lengths), segments)
+
+    def remove(self, rows: Iterable[int], texts: Iterable[str]):
+        """Drops deleted chunks (with their original texts) from the term statistics; cost is their size."""
+        for row, text in zip(rows, texts):
+            if row >= self.nrows or row in self.removed:
+                continue
+            for term in set(tokenize(text)):
+                term_id = self.term_ids.get(term)
+                if term_id is not None:
+                    self.df[term_id] -= 1
+            self._live[row] = False
+            self.removed.add(row)
+            self.total_length -= int(self._lengths[row])
+
+    def remap(self, row_map: np.ndarray, nrows: int) -> "BM25Index":
+        """
+        Returns a copy with rows renumbered by row_map (old row -> new row, -1 for
+        dropped rows), for when the chunk store is rewritten without deleted chunks.
+        row_map must keep the order of the rows it keeps. The copy shares this index's
+        vocabulary and document frequencies (dropped rows were already removed), so
+        this index must not be modified afterwards.
+        """
+        index = BM25Index(self.k1, self.b, self.fuzzy_weight, self.min_fuzzy_length,
+                          self.common_term_fraction, self.common_term_min_df)
+        index.terms, index.term_ids, index.df, index.grams = self.terms, self.term_ids, self.df, self.grams
+
+        old_rows, segments = self._published
+        row_map = np.asarray(row_map, dtype="int64")[:old_rows]
+        if len(row_map) < old_rows:
+            row_map = np.concatenate([row_map, np.full(old_rows - len(row_map), -1, dtype="int64")])
+        kept = np.flatnonzero(row_map >= 0)
+        index._lengths = np.zeros(nrows, dtype="int32")
+        index._lengths[row_map[kept]] = self._lengths[kept]
+        index._live = np.ones(nrows, dtype=bool)
+        index._live[row_map[kept]] = self._live[kept]
+        index.removed = set(np.flatnonzero(~index._live).tolist())
+        index.total_length = int(index._lengths[index._live].sum())
+        starts = _starts([segment.nrows for segment in segments])
+        index._published = (nrows, [segment.remap(row_map, start) for segment, start in zip(segments, starts)])
+        return index
+
+    @staticmethod
+    def _idf(df: int, live_rows: int) -> float:
+        return math.log(1 + (live_rows - df + 0.5) / (df + 0.5))
+
+    def _fuzzy_terms(self, term: str) -> List[str]:
+        if len(term) < self.min_fuzzy_length:
+            return []
+        limit = 1 if len(term) <= 6 else 2
+        shared = Counter()
+        for gram in _trigrams(term):
+            for candidate in tuple(self.grams.get(gram, ())):
+                shared[candidate] += 1
+        return [c for c, n in shared.items()
+                if n >= 2 and self.df[self.term_ids[c]] > 0 and _edit_distance(term, c, limit) <= limit]
+
+    def expand(self, query: str) -> List[Tuple[str, List[Tuple[str, float]]]]:
+        """Returns each distinct query term with the (index term, weight) pairs it matches."""
+        expanded = []
+        for term in dict.fromkeys(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is not None and self.df[term_id] > 0:
+                expanded.append((term, [(term, 1.0)]))
+            else:
+                expanded.append((term, [(t, self.fuzzy_weight) for t in self._fuzzy_terms(term)]))
+        return expanded
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float, float]]:
+        """
+        Returns up to k (row, bm25 score, coverage) sorted by score. Coverage is the
+        idf-weighted share of the query's (not common) terms that the row matches,
+        exactly or fuzzily.
+        """
+        nrows, segments = self._published
+        live_rows = nrows - len(self.removed)
+        if live_rows <= 0 or k <= 0:
+            return []
+        lengths = self._lengths
+        live = self._live if self.removed else None
+        avgdl = self.total_length / live_rows or 1.0
+        max_df = max(self.common_term_min_df, self.common_term_fraction * live_rows)
+
+        # Per query term: its idf and the (term id, weight, idf) of the index terms it matches
+        query_terms = []
+        total_idf = 0.0
+        for _, matches in self.expand(query):
+            kept = []
+            for term, weight in matches:
+                term_id = self.term_ids[term]
+                if self.df[term_id] <= max_df:
+                    kept.append((term_id, weight, self._idf(self.df[term_id], live_rows)))
+            if matches and not kept:
+                continue  # only common terms: ignored like a stopword
+            term_idf = max([idf for _, _, idf in kept], default=self._idf(0, live_rows))
+            total_idf += term_idf
+            if kept:
+                query_terms.append((term_idf, kept))
+        if not query_terms:
+            return []
+
+        term_ids = np.unique([term_id for _, kept in query_terms for term_id, _, _ in kept])
+        found = [segment.lookup(term_ids) for segment in segments]
+        # Per query term: (idf, score upper bound, [(rows, tfs, weight * idf) per index term and segment])
+        terms = []
+        for term_idf, kept in query_terms:
+            scored = [(postings[0], postings[1], weight * idf)
+                      for term_id, weight, idf in kept for postings in (f.get(term_id) for f in found)
+                      if postings is not None]
+            terms.append((term_idf, sum(weight * idf for _, weight, idf in kept) * (self.k1 + 1), scored))
+
+        def bm25(tfs, rows, weighted_idf):
+            return weighted_idf * tfs * (self.k1 + 1) / (tfs + self.k1 * (1 - self.b + self.b * lengths[rows] / avgdl))
+
+        # Max-score: while unseen rows can still make the top k, whole postings are
+        # scored; after that, only the candidate rows are looked up in the rest
+        terms.sort(key=lambda t: -t[1])
+        bounds = [bound for _, bound, _ in terms]
+        scores = np.zeros(nrows)
+        threshold = 0.0  # a lower bound on the k-th best final score
+        candidates = None
+        for i, (_, _, scored) in enumerate(terms):
+            remaining = sum(bounds[i + 1:])  # what the terms after this one can still add to a row
+            if candidates is None:
+                for rows, tfs, weighted_idf in scored:
+                    scores[rows] += bm25(tfs, rows, weighted_idf)
+                    if live is not None:
+                        rows = rows[live[rows]]
+                    if len(rows) >= k:
+                        threshold = max(threshold, np.partition(scores[rows], -k)[-k])
+                if remaining < threshold:
+                    seen = np.flatnonzero(scores)
+                    if live is not None:
+                        seen = seen[live[seen]]
+                    candidates = seen[scores[seen] + remaining >= threshold]
+            else:
+                for rows, tfs, weighted_idf in scored:
+                    hit, positions = _find(rows, candidates)
+                    hit_rows = candidates[hit]
+                    scores[hit_rows] += bm25(tfs[positions[hit]], hit_rows, weighted_idf)
+                if len(candidates) >= k:
+                    threshold = max(threshold, np.partition(scores[candidates], -k)[-k])
+                candidates = candidates[scores[candidates] + remaining >= threshold]
+
+        if candidates is None:
+            candidates = np.flatnonzero(scores)
+            if live is not None:
+                candidates = candidates[live[candidates]]
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        top = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        matched = np.zeros(len(top))
+        for term_idf, _, scored in terms:
+            covered = np.zeros(len(top), dtype=bool)
+            for rows, _, _ in scored:
+                covered |= _find(rows, top)[0]
+            matched += term_idf * covered
+        coverage = matched / total_idf if total_idf else matched
+        return [(int(row), float(scores[row]), float(c)) for row, c in zip(top, coverage)]
+
+    # --- Persistence ---
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        nrows, segments = self._published
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, {
+                "version": self.FORMAT_VERSION,
+                "terms": self.terms,
+                "df": np.asarray(self.df, dtype="int64"),
+                "segments": [(s.term_ids, s.offsets, s.postings, s.nrows) for s in segments],
+                "doc_lengths": self._lengths[:nrows].astype("int32"),
+                "removed": np.asarray(sorted(self.removed), dtype="int64"),
+            }, allow_pickle=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> Optional["BM25Index"]:
+        if not os.path.exists(path):
+            return None
+        data = np.load(path, allow_pickle=True).item()
+        if data.get("version") != cls.FORMAT_VERSION:
+            return None
+        index = cls(**kwargs)
+        index._add_terms(list(data["terms"]))
+        index.df = data["df"].tolist()
+        index._lengths = np.array(data["doc_lengths"], dtype="int32")
+        index._live = np.ones(len(index._lengths), dtype=bool)
+        index._live[data["removed"]] = False
+        index.removed = set(data["removed"].tolist())
+        index.total_length = int(index._lengths[index._live].sum())
+        index._published = (len(index._lengths), [PostingsSegment(*s) for s in data["segments"]])
+        return index
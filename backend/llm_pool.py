@@ -0,0 +1,155 @@
+import time
+import queue
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+from backend import metrics
+
+
+class LLMPool:
+    """
+    N independent llama.cpp instances sharing the CPU. `total_threads` is split
+    evenly between them, so N concurrent generations each get their own cores
+    instead of serializing behind one model. Weights are memory-mapped by
+    llama.cpp, so extra instances mostly cost KV cache, not another copy of the model.
+
+    Called like a `Llama` object: pool(prompt, **kwargs). Each call is routed to
+    the first idle instance; callers wait in FIFO order when all are busy.
+
+    warm_prefix() evaluates a constant prompt prefix (the system instruction) on
+    every instance at startup. llama.cpp already reuses the longest matching token
+    prefix left in the context by the previous request, and every prompt starts
+    with that instruction, so after one request an instance keeps it anyway; the
+    warm-up only moves that cost (and the first page faults) out of the first
+    request each instance serves.
+    """
+
+    def __init__(self, factory: Callable[[int], Any], instances: int = 1, total_threads: int = 6,
+                 window_seconds: float = 60.0):
+        self.instances = max(1, instances)
+        self.threads_per_instance = max(1, total_threads // self.instances)
+        self.window_seconds = window_seconds
+
+        self._idle: "queue.Queue[Any]" = queue.Queue()
+        for _ in range(self.instances):
+            self._idle.put(factory(self.threads_per_instance))
+
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._busy = 0
+        self._requests = 0
+        self._tokens = 0
+        self._busy_seconds = 0.0
+        self._recent = deque()  # (finished_at, tokens) within window_seconds
+        self._ttft_total = 0.0
+        self._ttft_count = 0
+
+        # Pre-evaluated prompt prefix
+        self._instances = list(self._idle.queue)
+        self._prefix_tokens: list = []
+
+    def warm_prefix(self, prefix: str):
+        """Evaluates `prefix` once per instance, leaving it in each KV cache."""
+        first = self._instances[0]
+        tokens = first.tokenize(prefix.encode("utf-8"), special=True)
+        # Only keep tokens that stay stable when text follows the prefix, so the
+        # cached tokens are a true token prefix of every full prompt
+        probe = first.tokenize((prefix + "Context:").encode("utf-8"), special=True)
+        stable = 0
+        for a, b in zip(tokens, probe):
+            if a != b:
+                break
+            stable += 1
+        tokens = tokens[:stable]
+
+        for llm in self._instances:
+            llm.reset()
+            llm.eval(tokens)
+        with self._lock:
+            self._prefix_tokens = tokens
+        print(f"LLM prefix cache: {len(tokens)} prompt tokens pre-evaluated on {len(self._instances)} instance(s)")
+
+    def count_tokens(self, text: str) -> int:
+        # Tokenizing only reads the shared vocabulary, so any instance will do
+        return len(self._instances[0].tokenize(text.encode("utf-8"), add_bos=False, special=True))
+
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        with self._lock:
+            self._waiting += 1
+        try:
+            llm = self._idle.get()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        with self._lock:
+            self._busy += 1
+        try:
+            yield llm
+        finally:
+            with self._lock:
+                self._busy -= 1
+            self._idle.put(llm)
+
+    def __call__(self, prompt: str, stream: bool = False, **kwargs):
+        if stream:
+            return self._stream(prompt, **kwargs)
+        with self.acquire() as llm:
+            started = time.perf_counter()
+            output = llm(prompt, **kwargs)
+            tokens = output.get("usage", {}).get("completion_tokens", 0)
+            self._record(tokens, time.perf_counter() - started)
+        return output
+
+    def _stream(self, prompt: str, **kwargs):
+        # The instance stays checked out until the stream is exhausted or closed
+        with self.acquire() as llm:
+            started = time.perf_counter()
+            tokens = 0
+            try:
+                for output in llm(prompt, stream=True, **kwargs):
+                    if tokens == 0:
+                        self._record_ttft(time.perf_counter() - started)
+                    tokens += 1
+                    yield output
+            finally:
+                self._record(tokens, time.perf_counter() - started)
+
+    def _record(self, tokens: int, seconds: float):
+        metrics.LLM_GENERATED_TOKENS.inc(tokens)
+        if tokens and seconds > 0:
+            metrics.LLM_TOKENS_PER_SECOND.observe(tokens / seconds)
+        now = time.monotonic()
+        with self._lock:
+            self._requests += 1
+            self._tokens += tokens
+            self._busy_seconds += seconds
+            self._recent.append((now, tokens))
+            while self._recent and now - self._recent[0][0] > self.window_seconds:
+                self._recent.popleft()
+
+    def _record_ttft(self, seconds: float):
+        metrics.LLM_TTFT_SECONDS.observe(seconds)
+        with self._lock:
+            self._ttft_total += seconds
+            self._ttft_count += 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            recent = sum(t for finished, t in self._recent if now - finished <= self.window_seconds)
+            return {
+                "instances": self.instances,
+                "threads_per_instance": self.threads_per_instance,
+                "busy": self._busy,
+                "queue_depth": self._waiting,
+                "requests": self._requests,
+                "tokens_generated": self._tokens,
+                # Per-instance decode speed, and what the whole pool delivered recently
+                "tokens_per_sec": self._tokens / self._busy_seconds if self._busy_seconds else 0.0,
+                "throughput_tokens_per_sec": recent / self.window_seconds,
+                # Streaming requests: prompt evaluation until the first generated token
+                "avg_ttft_ms": 1000 * self._ttft_total / self._ttft_count if self._ttft_count else 0.0,
+                "prefix_tokens": len(self._prefix_tokens),
+            }
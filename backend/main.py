@@ -1,8 +1,13 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from typing import List, Optional
 import os
+import json
+import asyncio
 import uvicorn
 import uuid
 from contextlib import asynccontextmanager
@@ -11,11 +16,24 @@ from contextlib import asynccontextmanager
 from backend.ingestion import DocumentProcessor
 from backend.rag_engine import RAGEngine
 from backend.models import ChatRequest, ChatResponse, DocumentResponse, LoginRequest, User
+from backend.jobs import IngestionJobManager, IngestionJob, EXTRACTING, INDEXING
+from backend.executor import BoundedExecutor, QueueFullError
+from backend import config
+from backend import metrics
+
+# Model libraries (torch, llama_cpp) are imported by the engine while loading, not here
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
 # Global RAG Engine instance
 rag_engine = None
 doc_processor = DocumentProcessor()
 
+# Background ingestion (extraction, chunking, embedding, indexing) for /upload
+ingestion_jobs = IngestionJobManager(max_workers=config.INGEST_WORKERS)
+
+# Retrieval + generation for /chat and /chat/stream run here, off the event loop
+llm_executor = BoundedExecutor(max_workers=config.LLM_WORKERS, max_queue=config.LLM_QUEUE_SIZE)
+
 # Mock Users DB
 USERS_DB = {
     "admin": "admin", # password
@@ -30,13 +48,24 @@ USER_ROLES = {
 async def lifespan(app: FastAPI):
     # Startup: Load models and index
     global rag_engine
-    print("Startup: Loading RAG Engine...")
-    rag_engine = RAGEngine()
+    rag_engine = RAGEngine(defer_loading=True)
+    rag_engine.startup_timings["imports"] = IMPORT_SECONDS
+    register_gauges()
+    if config.BACKGROUND_LOADING:
+        # Accept requests right away; "/" reports readiness once indexes and models are in
+        print("Startup: Loading RAG Engine in the background...")
+        rag_engine.load_in_background()
+    else:
+        print("Startup: Loading RAG Engine...")
+        rag_engine.load_models()
     yield
     # Shutdown
+    print("Shutdown: Waiting for ingestion jobs...")
+    ingestion_jobs.shutdown(wait=True)
+    llm_executor.shutdown(wait=False)
     print("Shutdown: Saving index...")
-    if rag_engine:
-        rag_engine.save_index()
+    if rag_engine and rag_engine.ready.is_set():
+        rag_engine.save_index(final=True)
 
 app = FastAPI(title="Offline RAG API", lifespan=lifespan)
 
@@ -76,17 +105,96 @@ def login(creds: LoginRequest):
 
 # --- Routes ---
 
+def _llm_busy() -> int:
+    # No pool while the models are loading or when no GGUF model was found
+    stats = rag_engine.llm_stats() if rag_engine else None
+    return stats["busy"] if stats else 0
+
+def register_gauges():
+    # Read at scrape time, so they always reflect the current engine and queue
+    metrics.INDEX_BLOCKS.set_function(lambda: rag_engine.block_index.ntotal if rag_engine.block_index is not None else 0)
+    metrics.INDEX_CHUNKS.set_function(lambda: rag_engine.chunk_store.ntotal)
+    metrics.LEXICAL_ROWS.set_function(lambda: rag_engine.lexical_index.nrows)
+    metrics.CHUNK_CACHE_BYTES.set_function(lambda: rag_engine.chunk_indexes.current_bytes)
+    metrics.CHAT_QUEUE_DEPTH.set_function(lambda: llm_executor.queue_depth)
+    metrics.CHAT_IN_FLIGHT.set_function(lambda: llm_executor.in_flight)
+    metrics.LLM_BUSY.set_function(_llm_busy)
+
+def engine_ready() -> bool:
+    return rag_engine is not None and rag_engine.ready.is_set()
+
 @app.get("/")
 def health_check():
+    # Liveness: answering at all means the process is up. Readiness is reported separately.
     global rag_engine
     model_loaded = (rag_engine is not None and rag_engine.llm is not None)
     return {
         "status": "ok", 
+        "ready": engine_ready(),
+        "startup": rag_engine.startup_status() if rag_engine is not None else None,
         "offline_mode": True,
-        "model_loaded": model_loaded
+        "model_loaded": model_loaded,
+        "chat_queue": llm_executor.stats(),
+        "llm": rag_engine.llm_stats() if rag_engine is not None else None
     }
 
-@app.post("/upload")
+@app.get("/metrics")
+def metrics_endpoint():
+    if not metrics.REGISTRY.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (RAG_METRICS=0)")
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+def readiness_check():
+    # For load balancers / orchestrators: route traffic only once models and indexes are loaded
+    if not engine_ready():
+        raise HTTPException(status_code=503, detail=rag_engine.startup_status() if rag_engine else "Starting")
+    return {"ready": True}
+
+def run_ingestion(job: IngestionJob, file_path: str, replaces: Optional[str] = None):
+    # The uploaded copy belongs to this job alone and is removed however the job ends
+    try:
+        _ingest_file(job, file_path, replaces)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+def _ingest_file(job: IngestionJob, file_path: str, replaces: Optional[str] = None):
+    # Runs on an ingestion worker thread, never on the event loop.
+    # Pages -> chunks -> embeddings -> blocks are streamed: one block's chunks are in flight,
+    # and committed blocks wait in the store's pending segment until the document is flushed.
+    job.update(status=EXTRACTING)
+
+    def pages():
+        started = time.perf_counter()
+        for page in doc_processor.iter_pages(file_path):
+            metrics.INGEST_STAGE_SECONDS.observe(time.perf_counter() - started, stage="extract")
+            job.update(pages_extracted=job.pages_extracted + 1)
+            yield page
+            started = time.perf_counter()
+
+    def chunks():
+        for c in doc_processor.iter_chunks(pages()):
+            c["source"] = job.filename
+            job.update(chunks_total=job.chunks_total + 1)
+            yield c
+
+    # Add to index (uploads accepted during startup wait here for the engine to load)
+    if rag_engine:
+        rag_engine.wait_until_ready()
+        with metrics.ingest_stage("document"):
+            rag_engine.add_document_stream(
+                job.doc_id, job.filename, chunks(),
+                progress=lambda **counts: job.update(status=INDEXING, **counts)
+            )
+        # A replacement is fully indexed before the old version is removed, so the
+        # document never disappears from search in between
+        if replaces:
+            if job.doc_id not in {d["id"] for d in rag_engine.list_documents()}:
+                raise ValueError(f"No text could be extracted from {job.filename}; the previous version was kept")
+            rag_engine.delete_document(replaces)
+
+@app.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_document(
     file: UploadFile = File(...), 
     user_token: Optional[str] = None # Expecting token in query or header in real app
@@ -97,77 +205,142 @@ async def upload_document(
     if not current_user or current_user.role != "admin":
          raise HTTPException(status_code=403, detail="Admin access required")
 
-    global rag_engine
     try:
         file_path = await doc_processor.save_file(file)
-        chunks = doc_processor.extract_text(file_path)
-        
-        # Process chunks
-        processed_chunks = doc_processor.chunk_text(chunks)
-        
-        # Add source info & Generate ID
-        doc_id = str(uuid.uuid4())
-        doc_name = file.filename
-        
-        for c in processed_chunks:
-            c["source"] = doc_name
-            
-        # Add to index
-        if rag_engine:
-            rag_engine.add_document(doc_id, doc_name, processed_chunks)
-            
-        return {
-            "filename": doc_name, 
-            "id": doc_id, 
-            "status": "uploaded_and_indexed", 
-            "chunks": len(processed_chunks),
-            "estimated_blocks": (len(processed_chunks) > 0)
-        }
     except Exception as e:
         print(f"Upload Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    # Generate ID and hand the heavy work to the ingestion workers
+    doc_id = str(uuid.uuid4())
+    job = ingestion_jobs.submit(file.filename, doc_id, lambda j: run_ingestion(j, file_path))
+    return job.to_dict()
+
+def require_admin_token(user_token: Optional[str]):
+    current_user = get_current_user(user_token)
+    if not current_user or current_user.role != "admin":
+         raise HTTPException(status_code=403, detail="Admin access required")
+
+def require_engine_ready():
+    if not engine_ready():
+        raise HTTPException(status_code=503, detail="Models are still loading", headers={"Retry-After": "5"})
+
+@app.delete("/documents/{doc_id}")
+def delete_document(doc_id: str, user_token: Optional[str] = None):
+    require_admin_token(user_token)
+    require_engine_ready()
+    result = rag_engine.delete_document(doc_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return result
+
+@app.put("/documents/{doc_id}", status_code=status.HTTP_202_ACCEPTED)
+async def replace_document(doc_id: str, file: UploadFile = File(...), user_token: Optional[str] = None):
+    # The new version is ingested under a new id; the old one is deleted once it is indexed
+    require_admin_token(user_token)
+    require_engine_ready()
+    if doc_id not in {d["id"] for d in rag_engine.list_documents()}:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    try:
+        file_path = await doc_processor.save_file(file)
+    except Exception as e:
+        print(f"Upload Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    new_doc_id = str(uuid.uuid4())
+    job = ingestion_jobs.submit(file.filename, new_doc_id, lambda j: run_ingestion(j, file_path, replaces=doc_id))
+    return dict(job.to_dict(), replaces=doc_id)
+
+@app.post("/admin/purge")
+def purge_deleted(user_token: Optional[str] = None):
+    # Reclaims the space of deleted documents now instead of waiting for the automatic purge
+    require_admin_token(user_token)
+    require_engine_ready()
+    return rag_engine.purge_deleted()
+
+@app.get("/jobs/{job_id}")
+def ingestion_job_status(job_id: str, user_token: Optional[str] = None):
+    current_user = get_current_user(user_token)
+    if not current_user or current_user.role != "admin":
+         raise HTTPException(status_code=403, detail="Admin access required")
+
+    job = ingestion_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+def server_busy(e: QueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=f"Server busy ({e.queue_depth} requests queued), retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     global rag_engine
     if not rag_engine:
          raise HTTPException(status_code=503, detail="RAG Engine not initialized")
-    
-    response = rag_engine.generate_answer(request.message)
+    if not engine_ready():
+         metrics.CHAT_REQUESTS.inc(endpoint="chat", outcome="unavailable")
+         raise HTTPException(status_code=503, detail="Models are still loading", headers={"Retry-After": "5"})
+
+    try:
+        response = await llm_executor.run(rag_engine.generate_answer, request.message, timeout=config.LLM_TIMEOUT)
+    except QueueFullError as e:
+        metrics.CHAT_REQUESTS.inc(endpoint="chat", outcome="rejected")
+        raise server_busy(e)
+    except asyncio.TimeoutError:
+        metrics.CHAT_REQUESTS.inc(endpoint="chat", outcome="timeout")
+        raise HTTPException(status_code=504, detail="Answer generation timed out")
+    metrics.CHAT_REQUESTS.inc(endpoint="chat", outcome="ok" if response.get("citations") else "refused")
     return response
 
 @app.get("/documents")
 def list_documents():
-    # Return unique documents from RAG engine metadata
+    # Return unique (live) documents from RAG engine metadata
     global rag_engine
     if rag_engine:
-        # block_metadata contains one entry per block. 
-        # We need to group by doc_id to show unique documents in frontend.
-        unique_docs = {}
-        for block in rag_engine.block_metadata:
-            doc_id = block.get("doc_id")
-            if doc_id and doc_id not in unique_docs:
-                unique_docs[doc_id] = {
-                    "id": doc_id,
-                    "name": block.get("name"),
-                    "page_range": block.get("page_range") # Just show first block range or omit
-                }
-        return list(unique_docs.values())
+        return rag_engine.list_documents()
     return []
 
 @app.post("/chat/stream")
-def chat_stream_endpoint(request: ChatRequest):
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
     global rag_engine
-    if not rag_engine:
+    if not engine_ready():
+        metrics.CHAT_REQUESTS.inc(endpoint="stream", outcome="unavailable")
         # If engine not ready, yield a basic error stream
         def error_gen():
             yield "data: {\"token\": \"System is starting...\"}\n\n"
         return StreamingResponse(error_gen(), media_type="text/event-stream")
-    
-    return StreamingResponse(
-        rag_engine.generate_answer_stream(request.message),
-        media_type="text/event-stream"
-    )
+
+    # Admission is checked before the response starts so a full queue is a real 429
+    try:
+        events = llm_executor.stream(
+            lambda: rag_engine.generate_answer_stream(request.message),
+            timeout=config.LLM_TIMEOUT,
+            is_disconnected=http_request.is_disconnected,
+            on_queued=lambda position: f"event: queued\ndata: {json.dumps({'position': position})}\n\n"
+        )
+    except QueueFullError as e:
+        metrics.CHAT_REQUESTS.inc(endpoint="stream", outcome="rejected")
+        raise server_busy(e)
+
+    async def body():
+        outcome = "ok"
+        try:
+            async for event in events:
+                yield event
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            yield f"data: {json.dumps({'token': ' [Generation timed out]'})}\n\n"
+        finally:
+            metrics.CHAT_REQUESTS.inc(endpoint="stream", outcome=outcome)
+            # Stops generation on the worker when the client goes away
+            await events.aclose()
+
+    return StreamingResponse(body(), media_type="text/event-stream")
 
 if __name__ == "__main__":
     # If run from root as "python -m backend.main" or "python backend/main.py" (with pythonpath adjustment)
@@ -0,0 +1,246 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from backend import config
+
+# Seconds, from sub-millisecond index lookups to multi-second generations
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Tokens per second of a single generation
+RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+
+_NOOP = nullcontext()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labels: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, value: float = 1.0, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Set explicitly, or computed at scrape time by set_function()."""
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(self._function())}"]
+            except Exception:
+                return []  # Source not available yet (e.g. engine still loading)
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}  # per bucket, last one is +Inf
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[i] += 1
+            self._sums[key] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            return sum(self._counts.get(self._key(labels), ()))
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(c), self._sums[k]) for k, c in self._counts.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Minimal Prometheus-style registry (text exposition format 0.0.4). Recording is a
+    lock plus a dict update, cheap enough to leave on; with enabled=False every
+    recording call returns immediately.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self, name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help, labels, buckets=buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry(enabled=config.METRICS)
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Latency of each query stage (query_embedding, block_search, chunk_search, "
+    "lexical_search, rerank, prompt_build, generation)", labels=("stage",))
+INGEST_STAGE_SECONDS = REGISTRY.histogram(
+    "rag_ingest_stage_seconds", "Latency of ingestion stages (extract per page, embed per batch, "
+    "index per block, persist per save, document per upload)", labels=("stage",))
+LLM_TTFT_SECONDS = REGISTRY.histogram(
+    "rag_llm_time_to_first_token_seconds", "Prompt evaluation until the first streamed token")
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "rag_llm_generation_tokens_per_second", "Decode speed of each generation", buckets=RATE_BUCKETS)
+LLM_PROMPT_TOKENS = REGISTRY.counter("rag_llm_prompt_tokens_total", "Prompt tokens sent to the LLM")
+LLM_GENERATED_TOKENS = REGISTRY.counter("rag_llm_generated_tokens_total", "Tokens generated by the LLM")
+REFUSALS = REGISTRY.counter(
+    "rag_refusals_total", "Answers refused: no retrieved context, rejected by the re-ranker, "
+    "no chunk fitting the prompt budget (no LLM call for these), or by the model", labels=("reason",))
+CHAT_REQUESTS = REGISTRY.counter(
+    "rag_chat_requests_total", "Chat requests by endpoint and outcome", labels=("endpoint", "outcome"))
+
+# Index sizes and queue state, read at scrape time (wired up in backend.main)
+INDEX_BLOCKS = REGISTRY.gauge("rag_index_blocks", "Blocks in the stage-1 index")
+INDEX_CHUNKS = REGISTRY.gauge("rag_index_chunks", "Chunk vectors in the store")
+LEXICAL_ROWS = REGISTRY.gauge("rag_lexical_index_rows", "Chunks in the BM25 index")
+CHUNK_CACHE_BYTES = REGISTRY.gauge("rag_chunk_cache_bytes", "Resident chunk-level index bytes")
+CHAT_QUEUE_DEPTH = REGISTRY.gauge("rag_chat_queue_depth", "Chat requests waiting for a worker")
+CHAT_IN_FLIGHT = REGISTRY.gauge("rag_chat_in_flight", "Chat requests admitted (running or queued)")
+LLM_BUSY = REGISTRY.gauge("rag_llm_busy_instances", "LLM instances currently generating")
+
+_trace = threading.local()
+
+
+@contextmanager
+def trace() -> Iterator[Dict[str, float]]:
+    """Collects the stage timings recorded on this thread into a dict (ms), for one request."""
+    timings: Dict[str, float] = {}
+    previous = getattr(_trace, "timings", None)
+    _trace.timings = timings
+    try:
+        yield timings
+    finally:
+        _trace.timings = previous
+
+
+@contextmanager
+def _timed(histogram: Histogram, name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, stage=name)
+        timings = getattr(_trace, "timings", None)
+        if timings is not None:
+            timings[name] = round(timings.get(name, 0.0) + 1000 * elapsed, 3)
+
+
+def stage(name: str):
+    """Times a query stage into rag_stage_seconds and the current trace()."""
+    return _timed(STAGE_SECONDS, name) if REGISTRY.enabled else _NOOP
+
+
+def ingest_stage(name: str):
+    return _timed(INGEST_STAGE_SECONDS, name) if REGISTRY.enabled else _NOOP
@@ -28,3 +28,5 @@ class ChatResponse(BaseModel):
     answer: str
     citations: List[Citation]
     error: Optional[str] = None
+    usage: Optional[dict] = None # Prompt token counts (see PromptBuilder.build)
+    timings: Optional[dict] = None # Milliseconds per stage (see metrics.trace)
@@ -0,0 +1,139 @@
+from typing import Callable, List, Optional, Tuple
+
+# ChatML Formatting for Phi-3
+SYSTEM_INSTRUCTION = """You are a precise and honest assistant. Your task is to answer the user's question using ONLY the provided context.
+Instructions:
+1. The User Question may contain typos. Match distinct words in the context (e.g. "Marigin" matches "Margin").
+2. Answer the question using ONLY the provided context.
+3. If the context does not contain the answer, output the exact phrase: "The requested information is not available in the uploaded documents."
+4. CRITICAL: Do NOT use outside knowledge. Do NOT explain concepts (like "Softmax") not found in the context."""
+
+# Identical for every request, so its KV state is computed once and reused (see LLMPool.warm_prefix)
+PROMPT_PREFIX = f"<|user|>\n{SYSTEM_INSTRUCTION}\n\n"
+
+# Shortest suffix/prefix match treated as chunk overlap rather than coincidence
+MIN_OVERLAP_CHARS = 16
+
+
+def render_context(item: dict) -> str:
+    return f"Document: {item['document_name']} (Page {item['page']})\nContent: {item['text']}"
+
+
+def build_prompt(context_items: List[dict], query: str) -> str:
+    context_str = "\n\n".join([render_context(c) for c in context_items])
+    user_content = f"Context:\n{context_str}\n\nUser Question: {query}"
+    return f"{PROMPT_PREFIX}{user_content}<|end|>\n<|assistant|>"
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough fallback when no tokenizer is loaded (~4 characters per token)
+    return len(text) // 4 + 1
+
+
+def _overlap(left: str, right: str, max_chars: int) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right`."""
+    for k in range(min(len(left), len(right), max_chars), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:k]):
+            return k
+    return 0
+
+
+class PromptBuilder:
+    """
+    Packs retrieved chunks, most relevant first, into an explicit token budget:
+    n_ctx minus the answer allowance minus the instruction/question overhead.
+
+    Consecutive chunks overlap by `overlap` characters (see DocumentProcessor.iter_chunks).
+    When two selected chunks from the same page overlap, they are merged into one
+    context entry so the shared text is only paid for once.
+    """
+
+    def __init__(self, count_tokens: Optional[Callable[[str], int]] = None, n_ctx: int = 4096,
+                 max_answer_tokens: int = 512, overlap: int = 50):
+        self.count_tokens = count_tokens or estimate_tokens
+        self.n_ctx = n_ctx
+        self.max_answer_tokens = max_answer_tokens
+        # Chunks can overlap by a little more than `overlap` once whitespace is normalised
+        self.max_overlap_chars = overlap * 2
+
+    def build(self, context_items: List[dict], query: str) -> Tuple[str, List[dict], dict]:
+        """
+        Returns (prompt, used_items, usage). used_items are the original chunks that
+        made it into the prompt (in relevance order) and are the ones to cite.
+        """
+        budget = self.n_ctx - self.max_answer_tokens - self.count_tokens(build_prompt([], query))
+        entries: List[dict] = []  # merged context entries, in relevance order
+        used: List[dict] = []
+        spent = 0
+        merged = dropped = truncated = 0
+
+        for item in context_items:
+            entry, text = self._merge_target(entries, item)
+            if entry is not None and text is None:
+                used.append(item)  # Fully contained in a chunk already packed
+                merged += 1
+                continue
+
+            candidate = dict(entry) if entry is not None else dict(item)
+            if entry is not None:
+                candidate["text"] = text
+            cost = self.count_tokens("\n\n" + render_context(candidate))
+            previous = self.count_tokens("\n\n" + render_context(entry)) if entry is not None else 0
+
+            if spent + cost - previous > budget:
+                if entries or budget <= 0:
+                    dropped += 1
+                    continue
+                # Even the best chunk alone is too large: keep as much of it as fits
+                candidate["text"] = self._truncate(candidate, budget)
+                cost = self.count_tokens("\n\n" + render_context(candidate))
+                truncated += 1
+
+            if entry is not None:
+                entry["text"] = candidate["text"]
+                merged += 1
+            else:
+                entries.append(candidate)
+            spent += cost - previous
+            used.append(item)
+
+        prompt = build_prompt(entries, query)
+        usage = {
+            "prompt_tokens": self.count_tokens(prompt),
+            "context_tokens": spent,
+            "context_budget": budget,
+            "chunks_retrieved": len(context_items),
+            "chunks_used": len(used),
+            "chunks_merged": merged,
+            "chunks_dropped": dropped,
+            "chunks_truncated": truncated,
+        }
+        return prompt, used, usage
+
+    def _merge_target(self, entries: List[dict], item: dict):
+        """
+        Finds a packed entry from the same page that `item` duplicates or overlaps.
+        Returns (entry, merged_text); merged_text is None when nothing new is added,
+        and (None, None) when the item stands alone.
+        """
+        for entry in entries:
+            if entry["document_name"] != item["document_name"] or entry["page"] != item["page"]:
+                continue
+            if item["text"] in entry["text"]:
+                return entry, None
+            k = _overlap(entry["text"], item["text"], self.max_overlap_chars)
+            if k:
+                return entry, entry["text"] + item["text"][k:]
+            k = _overlap(item["text"], entry["text"], self.max_overlap_chars)
+            if k:
+                return entry, item["text"] + entry["text"][k:]
+        return None, None
+
+    def _truncate(self, item: dict, budget: int) -> str:
+        text = item["text"]
+        while text:
+            candidate = dict(item, text=text)
+            if self.count_tokens("\n\n" + render_context(candidate)) <= budget:
+                return text
+            text = text[:int(len(text) * 0.9)]
+        return text
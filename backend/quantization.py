@@ -0,0 +1,87 @@
+import faiss
+import numpy as np
+from typing import Optional, Tuple
+
+# Chunk-level vector compression modes
+NONE = "none"  # float32 IndexFlatL2 (exact)
+FP16 = "fp16"  # 2 bytes / dim scalar quantizer
+SQ8 = "sq8"    # 1 byte / dim scalar quantizer
+PQ = "pq"      # product quantizer, shared codebook trained once per store
+QUANTIZATION_MODES = (NONE, FP16, SQ8, PQ)
+
+# Minimum training points per PQ centroid suggested by FAISS
+_PQ_POINTS_PER_CENTROID = 39
+
+
+def storage_dtype(mode: str) -> str:
+    # Compressed modes only ever re-rank a shortlist, for which fp16 rows are plenty
+    return "float32" if mode == NONE else "float16"
+
+
+def pq_subquantizers(dimension: int) -> int:
+    # 8 dims per sub-quantizer (shared by chunk PQ and the IVF-PQ block index); dimension must be divisible by m
+    for m in (dimension // 8, 48, 32, 24, 16, 8, 4, 2, 1):
+        if m and dimension % m == 0:
+            return m
+    return 1
+
+
+def train_pq_template(dimension: int, sample: np.ndarray) -> Optional[faiss.Index]:
+    """
+    Trains an empty IndexPQ on `sample`. Every block index is cloned from it, so
+    all blocks share one codebook. Returns None when there is not enough data.
+    """
+    sample = np.ascontiguousarray(sample, dtype="float32")
+    for nbits in (8, 6, 4):
+        if len(sample) >= _PQ_POINTS_PER_CENTROID * (1 << nbits):
+            template = faiss.IndexPQ(dimension, pq_subquantizers(dimension), nbits)
+            template.train(sample)
+            return template
+    return None
+
+
+def build_chunk_index(mode: str, dimension: int, vectors: np.ndarray,
+                      pq_template: Optional[faiss.Index] = None) -> faiss.Index:
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown chunk quantization '{mode}'. Expected one of {QUANTIZATION_MODES}")
+
+    vectors = np.ascontiguousarray(vectors, dtype="float32").reshape(-1, dimension)
+
+    if mode == PQ and pq_template is not None:
+        index = faiss.clone_index(pq_template)
+    elif mode in (SQ8, PQ):
+        # PQ without a trained codebook (tiny corpus) degrades to SQ8
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit)
+    elif mode == FP16:
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16)
+    else:
+        index = faiss.IndexFlatL2(dimension)
+
+    if not index.is_trained:
+        index.train(vectors)
+    if len(vectors):
+        index.add(vectors)
+    return index
+
+
+def rerank_exact(vectors: np.ndarray, query_vectors: np.ndarray, candidate_ids: np.ndarray,
+                 k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Re-scores an approximate shortlist with exact squared L2 against the stored
+    rows. Returns (distances, ids) shaped like a FAISS search result with k columns.
+    """
+    n_queries = len(query_vectors)
+    out_d = np.full((n_queries, k), np.inf, dtype="float32")
+    out_i = np.full((n_queries, k), -1, dtype="int64")
+
+    for q in range(n_queries):
+        # Sorted ids keep memory-mapped row reads sequential
+        ids = np.sort(candidate_ids[q][candidate_ids[q] >= 0])
+        if not len(ids):
+            continue
+        rows = np.asarray(vectors[ids], dtype="float32")
+        dists = ((rows - query_vectors[q]) ** 2).sum(axis=1)
+        order = np.argsort(dists)[:k]
+        out_d[q, :len(order)] = dists[order]
+        out_i[q, :len(order)] = ids[order]
+    return out_d, out_i
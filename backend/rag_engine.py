@@ -1,49 +1,280 @@
 import os
+import time
+import threading
 import faiss
 import numpy as np
-from typing import List, Optional, Dict
-from sentence_transformers import SentenceTransformer
-from llama_cpp import Llama
+from contextlib import contextmanager
+from typing import Callable, Iterable, List, Optional, Dict, Tuple
 from backend.models import Citation
+from backend.chunk_store import ChunkStore, records_nbytes
+from backend.concurrency import ReadWriteLock
+from backend.llm_pool import LLMPool
+from backend.prompt_builder import PROMPT_PREFIX, PromptBuilder, estimate_tokens
+from backend.lexical_index import BM25Index
+from backend.reranker import Reranker
+from backend.cache import LRUCache, EmbeddingCache, SemanticCache
+from backend import quantization
+from backend import metrics
+from backend.block_index import (FLAT, build_block_index, excluding, index_kind, set_search_params, save_block_index,
+                                 load_block_index)
+from backend import config
+
+# sentence-transformers (torch) and llama_cpp take seconds to import, so they are
+# imported on first use in load_models rather than when the server module loads.
+SentenceTransformer = None
+Llama = None
+
+
+def _sentence_transformer_cls():
+    global SentenceTransformer
+    if SentenceTransformer is None:
+        from sentence_transformers import SentenceTransformer
+    return SentenceTransformer
+
+
+def _llama_cls():
+    global Llama
+    if Llama is None:
+        from llama_cpp import Llama
+    return Llama
+
+
+def _citation_dict(citation: Citation) -> dict:
+    # pydantic v2 renamed .dict() to .model_dump()
+    return citation.model_dump() if hasattr(citation, "model_dump") else citation.dict()
+
+
+def _index_nbytes(index: faiss.Index) -> int:
+    # Approximate resident size of a chunk-level index (vector codes only)
+    code_size = getattr(index, "code_size", index.d * 4)
+    return int(index.ntotal) * int(code_size)
+
+
+def _chunk_cache_nbytes(value) -> int:
+    # The chunk cache holds both chunk-level indexes and the store's decoded chunk dicts
+    return _index_nbytes(value) if isinstance(value, faiss.Index) else records_nbytes(value)
+
 
 class RAGEngine:
-    def __init__(self, models_dir: str = "models"):
+    def __init__(self, models_dir: str = "models", chunk_cache_mb: Optional[int] = None,
+                 block_index_type: Optional[str] = None, block_index_threshold: Optional[int] = None,
+                 chunk_quantization: Optional[str] = None, embedding_cache: Optional[bool] = None,
+                 hybrid_search: Optional[bool] = None,
+                 defer_loading: bool = False):
+        """
+        With defer_loading, the constructor only sets up state and the caller starts
+        load_models() (e.g. via load_in_background()); `ready` is set once it finishes.
+        """
         self.models_dir = models_dir
         self.indexes_dir = os.path.join(models_dir, "indexes")
         self.embedding_model = None
-        self.llm = None
+        self.embedding_model_id = None # Part of the embedding cache key
+        self.llm = None # LLMPool of one or more Llama instances
+
+        # Packs retrieved chunks into n_ctx - max_tokens, counted with the model's tokenizer
+        self.prompt_builder = PromptBuilder(self._count_tokens, n_ctx=config.LLM_CONTEXT,
+                                            max_answer_tokens=config.LLM_MAX_TOKENS)
         
         # Hierarchical Indexing
         self.block_index = None # Global index for document blocks
+
+        # Searches hold the read side while touching block_index / block_metadata / chunk
+        # store offsets; committing a block holds the write side for the in-memory swap only.
+        # Ingestion work (embedding, disk flushes, ANN training) runs outside it, serialized
+        # between concurrent uploads by _ingest_lock.
+        self._index_lock = ReadWriteLock()
+        self._ingest_lock = threading.Lock()
+
+        # Stage-1 index backend. Stays exact (flat) until the block count crosses the threshold.
+        self.block_index_type = block_index_type or config.BLOCK_INDEX
+        self.block_index_threshold = block_index_threshold if block_index_threshold is not None else config.BLOCK_INDEX_THRESHOLD
+        self.block_nprobe = config.BLOCK_NPROBE
+        self.block_ef_search = config.BLOCK_EF_SEARCH
+        self._block_index_trained_at = 0 # Block count when the ANN index was last trained
         
-        # Map block_id -> Index (Chunk level). block_id = "{doc_id}_block_{i}"
-        self.chunk_indexes: Dict[str, faiss.Index] = {} 
+        # LRU cache of block_id -> Index (Chunk level). block_id = "{doc_id}_block_{i}"
+        # Populated lazily from the chunk store on first hit, bounded by a memory budget
+        # that also covers the chunk dicts the store decodes (keyed ("chunks", block_id)).
+        if chunk_cache_mb is None:
+            chunk_cache_mb = config.CHUNK_CACHE_MB
+        self.chunk_indexes = LRUCache(max_bytes=chunk_cache_mb * 1024 * 1024, sizeof=_chunk_cache_nbytes)
+
+        # Optional compressed chunk indexes (fp16 / sq8 / pq) with exact re-ranking of a shortlist
+        self.chunk_quantization = chunk_quantization or config.CHUNK_QUANTIZATION
+        if self.chunk_quantization not in quantization.QUANTIZATION_MODES:
+            raise ValueError(f"Unknown chunk quantization '{self.chunk_quantization}'")
+        self.chunk_rerank_factor = config.CHUNK_RERANK_FACTOR
+
+        # Results must score within this factor of the best match (L2, lower is better)
+        self.score_margin = 1.1
+        self._pq_template = None # Shared PQ codebook, trained once per store
+        self._pq_untrained_rows: Optional[int] = None # Store size when training last lacked data
+
+        # Optional cross-encoder over the stage-2 candidates (loaded with the models)
+        self.reranker: Optional[Reranker] = None
+        self.rerank_candidates = config.RERANK_CANDIDATES
+
+        # Chunks embedded per encode() call while ingesting
+        self.embed_batch_size = config.EMBED_BATCH_SIZE
         
         # List of dicts matching block_index. Each item has: {block_id, doc_id, page_range, ...}
         self.block_metadata = [] 
 
-        # Map block_id -> List of chunks (chunk metadata)
-        self.chunk_metadata: Dict[str, List[dict]] = {} 
+        # Deleted documents keep their block_index rows until a purge; searches skip them.
+        # doc_id -> positions in block_metadata (live documents only)
+        self._doc_blocks: Dict[str, List[int]] = {}
+        self._deleted_positions: set = set()
+        self._block_params = None  # (block index, index generation, FAISS params excluding deleted blocks)
+        self.purge_deleted_fraction = config.PURGE_DELETED_FRACTION
+        self._purge_thread: Optional[threading.Thread] = None
         
         self.dimension = 384 
 
         # Paths
         self.block_index_path = os.path.join(models_dir, "block_index.bin")
         self.metadata_path = os.path.join(models_dir, "block_metadata.npy")
+
+        # Append-only segment store for blocks + chunk embeddings (memory-mapped)
+        self.chunk_store = ChunkStore(os.path.join(models_dir, "store"), self.dimension,
+                                      vector_dtype=quantization.storage_dtype(self.chunk_quantization),
+                                      cache=self.chunk_indexes)
+        self.pq_template_path = os.path.join(self.chunk_store.store_dir, "chunk_pq.faiss")
+
+        # BM25 index over chunk texts (global store rows), fused with dense results by RRF
+        self.hybrid_search = config.HYBRID_SEARCH if hybrid_search is None else hybrid_search
+        self.lexical_index = BM25Index()
+        self.lexical_index_path = os.path.join(self.chunk_store.store_dir, "bm25.npy")
+        self.lexical_min_coverage = config.LEXICAL_MIN_COVERAGE
+        self.rrf_k = config.RRF_K
+        self._lexical_saved_rows = 0
+        self.block_ann_path = os.path.join(self.chunk_store.store_dir, "block_index.faiss")
+        self.block_ann_info_path = os.path.join(self.chunk_store.store_dir, "block_index.json")
         
-        os.makedirs(self.indexes_dir, exist_ok=True)
-        
-        self.load_models()
+        os.makedirs(self.models_dir, exist_ok=True)
+
+        # Persistent chunk embedding cache keyed by (model id, normalized text)
+        if embedding_cache is None:
+            embedding_cache = config.EMBEDDING_CACHE
+        self.embedding_cache = None
+        if embedding_cache:
+            self.embedding_cache = EmbeddingCache(os.path.join(models_dir, "embedding_cache.sqlite"), self.dimension,
+                                                  max_bytes=config.EMBEDDING_CACHE_MB * 1024 * 1024)
+
+        # Repeated-question caches. Search results are keyed by the index generation,
+        # which add_document bumps, so they never outlive the index they came from.
+        self.index_generation = 0
+        self.query_embedding_cache = LRUCache(max_items=config.QUERY_CACHE_SIZE, ttl=config.QUERY_CACHE_TTL)
+        self.search_cache = LRUCache(max_items=config.QUERY_CACHE_SIZE, ttl=config.QUERY_CACHE_TTL)
+        self.semantic_cache = None
+        if config.SEMANTIC_CACHE_DISTANCE > 0:
+            self.semantic_cache = SemanticCache(config.SEMANTIC_CACHE_DISTANCE, config.SEMANTIC_CACHE_SIZE)
 
-    def load_models(self):
+        # Phased startup: seconds spent per phase, the phase in progress, and readiness
+        self.startup_timings: Dict[str, float] = {}
+        self.startup_phase: Optional[str] = None
+        self.load_error: Optional[str] = None
+        self.ready = threading.Event()
+        self._load_done = threading.Event()
+        self._created_at = time.perf_counter()
+
+        if not defer_loading:
+            self.load_models()
+
+    @contextmanager
+    def _timed_phase(self, name: str):
+        self.startup_phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[name] = time.perf_counter() - start
+            self.startup_phase = None
+
+    def load_models(self, ingestion_only: bool = False):
+        """
+        Loads the indexes, the embedding model and the LLM, timing each phase.
+        Indexes come first so /documents is served while the models are still loading.
+        ingestion_only skips the re-ranker and the LLM (offline indexing tools).
+        """
+        try:
+            with self._timed_phase("indexes"):
+                self._load_indexes()
+            with self._timed_phase("embedding_model"):
+                self._load_embedding_model()
+            if not ingestion_only:
+                if config.RERANKER:
+                    with self._timed_phase("reranker"):
+                        self._load_reranker()
+                with self._timed_phase("llm"):
+                    self._load_llm()
+                if isinstance(self.llm, LLMPool) and config.LLM_PREFIX_CACHE:
+                    with self._timed_phase("llm_prefix"):
+                        self.llm.warm_prefix(PROMPT_PREFIX)
+        except Exception as e:
+            self.load_error = f"{type(e).__name__}: {e}"
+            print(f"Startup failed: {self.load_error}")
+            raise
+        finally:
+            self._load_done.set()
+
+        self.startup_timings["total"] = time.perf_counter() - self._created_at
+        self.ready.set()
+        print("Startup: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.startup_timings.items()))
+
+    def load_in_background(self) -> threading.Thread:
+        def run():
+            try:
+                self.load_models()
+            except Exception:
+                pass  # Reported through load_error / startup_status()
+
+        thread = threading.Thread(target=run, name="rag-startup", daemon=True)
+        thread.start()
+        return thread
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until loading finishes; raises if it failed."""
+        self._load_done.wait(timeout)
+        if self.load_error:
+            raise RuntimeError(f"RAG engine failed to load: {self.load_error}")
+        return self.ready.is_set()
+
+    def startup_status(self) -> dict:
+        if self.ready.is_set():
+            state = "ready"
+        elif self.load_error:
+            state = "failed"
+        else:
+            state = "loading"
+        return {
+            "state": state,
+            "phase": self.startup_phase,
+            "error": self.load_error,
+            "timings_s": {name: round(seconds, 3) for name, seconds in self.startup_timings.items()},
+        }
+
+    def _load_embedding_model(self):
+        SentenceTransformer = _sentence_transformer_cls()
         print("Loading Embedding Model...")
         embed_path = os.path.join(self.models_dir, "embedding_model")
         if os.path.exists(embed_path):
             self.embedding_model = SentenceTransformer(embed_path)
+            self.embedding_model_id = f"local:{os.path.abspath(embed_path)}"
         else:
             print("Local embedding model not found, using default.")
             self.embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+            self.embedding_model_id = 'sentence-transformers/all-MiniLM-L6-v2'
 
+    def _load_reranker(self):
+        from sentence_transformers import CrossEncoder
+        print("Loading Re-ranker...")
+        local_path = os.path.join(self.models_dir, "reranker_model")
+        model = CrossEncoder(local_path if os.path.exists(local_path) else config.RERANKER_MODEL)
+        self.reranker = Reranker(model, batch_size=config.RERANK_BATCH_SIZE, cache_size=config.RERANK_CACHE_SIZE,
+                                 scale=config.RERANK_SCALE, bias=config.RERANK_BIAS,
+                                 min_relevance=config.RERANK_MIN_RELEVANCE)
+
+    def _load_llm(self):
         print("Loading LLM...")
         if os.path.exists(self.models_dir):
             gguf_files = [f for f in os.listdir(self.models_dir) if f.endswith(".gguf")]
@@ -61,151 +292,649 @@ class RAGEngine:
                 
             if model_file:
                 model_path = os.path.join(self.models_dir, model_file)
-                self.llm = Llama(
-                    model_path=model_path, 
-                    n_ctx=4096,
-                    n_gpu_layers=0, 
-                    n_threads=6,     
-                    verbose=True     
+                Llama = _llama_cls()
+                # RAG_LLM_THREADS cores are split across RAG_LLM_INSTANCES independent instances.
+                # Weights are mmap'd rather than read into memory: loading is page-cache bound
+                # and every instance shares the same resident pages.
+                self.llm = LLMPool(
+                    lambda n_threads: Llama(
+                        model_path=model_path, 
+                        n_ctx=config.LLM_CONTEXT,
+                        n_gpu_layers=0, 
+                        n_threads=n_threads,     
+                        use_mmap=True,
+                        verbose=False
+                    ),
+                    instances=config.LLM_INSTANCES,
+                    total_threads=config.LLM_THREADS
                 )
+                print(f"LLM pool: {self.llm.instances} instance(s) x {self.llm.threads_per_instance} threads")
             else:
                 print("WARNING: No GGUF model found.")
                 self.llm = None
         else:
             self.llm = None
 
+    def _load_indexes(self):
         # Initialize Block Index
-        if os.path.exists(self.block_index_path) and os.path.exists(self.metadata_path):
+        if self.chunk_store.load():
+            print("Loading Chunk store...")
+            self.block_metadata = self.chunk_store.blocks
+            self.block_index = self._load_block_index(self.chunk_store.block_vectors())
+        elif os.path.exists(self.block_index_path) and os.path.exists(self.metadata_path):
             print("Loading Block FAISS index...")
             self.block_index = faiss.read_index(self.block_index_path)
             self.block_metadata = np.load(self.metadata_path, allow_pickle=True).tolist()
-            
-            print("Loading Chunk indexes...")
-            # Load ALL chunk indexes. 
-            # In a real heavy production system, you might lazy load these or use a disk-based index.
-            for meta in self.block_metadata:
-                block_id = meta.get("block_id")
-                if block_id:
-                    self._load_chunk_index(block_id)
+            self._migrate_legacy_indexes()
         else:
             print("Creating new Block FAISS index...")
             self.block_index = faiss.IndexFlatL2(self.dimension)
             self.block_metadata = []
 
-    def _load_chunk_index(self, block_id: str):
-        index_path = os.path.join(self.indexes_dir, f"{block_id}.bin")
-        meta_path = os.path.join(self.indexes_dir, f"{block_id}_meta.npy")
-        
-        if os.path.exists(index_path) and os.path.exists(meta_path):
-            self.chunk_indexes[block_id] = faiss.read_index(index_path)
-            self.chunk_metadata[block_id] = np.load(meta_path, allow_pickle=True).tolist()
+        self._index_documents()
+        if self.hybrid_search:
+            self._load_lexical_index()
 
-    def save_index(self):
-        if not os.path.exists(self.models_dir):
-            os.makedirs(self.models_dir)
-            
-        # Save Global Block Index
-        faiss.write_index(self.block_index, self.block_index_path)
-        np.save(self.metadata_path, self.block_metadata)
-        
-        # Save Local Chunk Indexes (for each block)
-        for block_id, index in self.chunk_indexes.items():
+        # Chunk indexes are not loaded here; search() pulls them into the LRU cache on demand.
+
+    def _index_documents(self):
+        doc_blocks: Dict[str, List[int]] = {}
+        deleted = set()
+        for position, meta in enumerate(self.block_metadata):
+            if meta.get("block_id") in self.chunk_store.tombstones:
+                deleted.add(position)
+            elif meta.get("doc_id"):
+                doc_blocks.setdefault(meta["doc_id"], []).append(position)
+        self._doc_blocks = doc_blocks
+        self._deleted_positions = deleted
+
+    def _load_lexical_index(self):
+        index = BM25Index.load(self.lexical_index_path)
+        if index is None or index.nrows > self.chunk_store.ntotal:
+            index = BM25Index()
+        saved_rows = index.nrows
+        # The file is saved periodically; index whatever was committed after it
+        if index.nrows < self.chunk_store.ntotal:
+            index.add(index.nrows, (c["text"] for c in self.chunk_store.iter_chunks(index.nrows)))
+            print(f"BM25 index: caught up {index.nrows - saved_rows} chunks from the store.")
+        # Deletions made after the last save
+        for start, end in self.chunk_store.tombstones.values():
+            rows = [r for r in range(start, end) if r not in index.removed]
+            if rows:
+                index.remove(rows, [c["text"] for c in self.chunk_store.get_rows(rows)[1]])
+        self.lexical_index = index
+        self._lexical_saved_rows = saved_rows
+
+    def _save_lexical_index(self, force: bool = False):
+        # Rewriting the whole file is O(corpus), so only do it once the index grew by 10%
+        # (rows missing from the file are re-indexed from the store at load)
+        unsaved = self.lexical_index.nrows - self._lexical_saved_rows
+        if unsaved and (force or unsaved >= max(1000, self._lexical_saved_rows // 10)):
+            with self._index_lock.read_locked():
+                self.lexical_index.save(self.lexical_index_path)
+                self._lexical_saved_rows = self.lexical_index.nrows
+
+    def _load_block_index(self, block_vectors: np.ndarray) -> faiss.Index:
+        if self.block_index_type != FLAT:
+            index, info = load_block_index(self.block_ann_path, self.block_ann_info_path)
+            if index is not None and info["kind"] == self.block_index_type and index.ntotal <= len(block_vectors):
+                print(f"Loaded {info['kind']} block index ({index.ntotal} blocks).")
+                # Blocks committed after the index was last persisted are appended without retraining
+                if len(block_vectors) > index.ntotal:
+                    index.add(block_vectors[index.ntotal:])
+                self._block_index_trained_at = info.get("trained_at", index.ntotal)
+                set_search_params(index, self.block_nprobe, self.block_ef_search)
+                return index
+        return self._rebuild_block_index(block_vectors)
+
+    def _rebuild_block_index(self, block_vectors: np.ndarray) -> faiss.Index:
+        kind = self.block_index_type if len(block_vectors) >= self.block_index_threshold else FLAT
+        index = build_block_index(kind, self.dimension, block_vectors)
+        set_search_params(index, self.block_nprobe, self.block_ef_search)
+        if kind != FLAT:
+            self._block_index_trained_at = len(block_vectors)
+            save_block_index(index, self.block_ann_path, self.block_ann_info_path,
+                             {"trained_at": self._block_index_trained_at})
+            print(f"Built {kind} block index over {len(block_vectors)} blocks.")
+        return index
+
+    def _maybe_rebuild_block_index(self):
+        # Switch to ANN once the threshold is crossed, and retrain when the corpus has
+        # doubled since the last training so IVF centroids do not go stale.
+        if self.block_index_type == FLAT:
+            return
+        with self._ingest_lock:
+            n_blocks = self.block_index.ntotal
+            if index_kind(self.block_index) == FLAT:
+                needs_rebuild = n_blocks >= self.block_index_threshold
+            else:
+                needs_rebuild = n_blocks >= 2 * self._block_index_trained_at
+            if needs_rebuild:
+                # Train without blocking searches, then swap the new index in
+                index = self._rebuild_block_index(self.chunk_store.block_vectors())
+                with self._index_lock.write_locked():
+                    self.block_index = index
+
+    def _migrate_legacy_indexes(self):
+        # Older layouts kept block_index.bin + block_metadata.npy next to either one
+        # FAISS file + .npy per block under indexes/, or a single chunk_embeddings.npy.
+        # Copy them into one store segment; the legacy files are left untouched.
+        consolidated = {}
+        if self.chunk_store.has_legacy_store(self.models_dir):
+            consolidated = self.chunk_store.load_legacy_store(self.models_dir)
+
+        migrated = 0
+        for i, meta in enumerate(self.block_metadata):
+            block_id = meta.get("block_id")
+            if not block_id:
+                continue
             index_path = os.path.join(self.indexes_dir, f"{block_id}.bin")
             meta_path = os.path.join(self.indexes_dir, f"{block_id}_meta.npy")
-            faiss.write_index(index, index_path)
-            np.save(meta_path, self.chunk_metadata[block_id])
+            if block_id in consolidated:
+                vectors, chunks = consolidated[block_id]
+            elif os.path.exists(index_path) and os.path.exists(meta_path):
+                legacy_index = faiss.read_index(index_path)
+                vectors = legacy_index.reconstruct_n(0, legacy_index.ntotal)
+                chunks = np.load(meta_path, allow_pickle=True).tolist()
+            else:
+                continue
+            block_vector = self.block_index.reconstruct(i)
+            self.chunk_store.add_block(meta, block_vector, vectors, chunks)
+            migrated += 1
+
+        if migrated:
+            self.chunk_store.flush()
+            print(f"Migrated {migrated} legacy blocks into the chunk store.")
+
+    def _load_chunk_index(self, block_id: str) -> Optional[faiss.Index]:
+        # Cache hit: index already resident
+        index = self.chunk_indexes.get(block_id)
+        if index is not None:
+            return index
+
+        # Cache miss: build from the memory-mapped chunk store slice
+        vectors = self.chunk_store.get_vectors(block_id)
+        if vectors is None:
+            return None
+        index = self._build_chunk_index(vectors)
+        self.chunk_indexes.put(block_id, index)
+        return index
+
+    # Chunk rows the store must grow by before PQ training is retried
+    PQ_RETRY_ROWS = 1024
+
+    def _build_chunk_index(self, vectors: np.ndarray) -> faiss.Index:
+        if self.chunk_quantization == quantization.PQ and self._pq_template is None and (
+                self._pq_untrained_rows is None
+                or self.chunk_store.ntotal >= self._pq_untrained_rows + self.PQ_RETRY_ROWS):
+            self._pq_template = self._load_or_train_pq_template()
+        return quantization.build_chunk_index(self.chunk_quantization, self.dimension, vectors, self._pq_template)
+
+    def _load_or_train_pq_template(self) -> Optional[faiss.Index]:
+        if os.path.exists(self.pq_template_path):
+            return faiss.read_index(self.pq_template_path)
+        # Train on a sample of stored chunk vectors (pending rows included)
+        sample_rows = []
+        for seg in self.chunk_store.segments + [self.chunk_store.pending]:
+            sample_rows.append(np.asarray(seg.vectors[:20000], dtype="float32"))
+        sample = np.concatenate(sample_rows, axis=0)[:20000] if sample_rows else np.zeros((0, self.dimension))
+        template = quantization.train_pq_template(self.dimension, sample)
+        if template is None:
+            self._pq_untrained_rows = self.chunk_store.ntotal
+            print("Not enough chunk vectors to train PQ yet; using sq8 for now.")
+            return None
+        os.makedirs(self.chunk_store.store_dir, exist_ok=True)
+        faiss.write_index(template, self.pq_template_path)
+        print(f"Trained PQ codebook on {len(sample)} chunk vectors.")
+        return template
+
+    def chunk_cache_stats(self) -> dict:
+        return self.chunk_indexes.stats()
+
+    def save_index(self, final: bool = False):
+        if not os.path.exists(self.models_dir):
+            os.makedirs(self.models_dir)
             
-        print("Indexes saved.")
+        # Append blocks added since the last save as a new segment.
+        # Existing segments are never rewritten, so this is O(new data).
+        # Blocks of other documents keep being committed meanwhile, so flush under the ingest lock.
+        with metrics.ingest_stage("persist"), self._ingest_lock:
+            segment = self.chunk_store.flush()
+            if segment:
+                print(f"Indexes saved (segment {segment}).")
+
+            if self.hybrid_search:
+                self._save_lexical_index(force=final)
 
-    def add_document(self, doc_id: str, doc_name: str, chunks: List[dict]):
+        if self.chunk_store.needs_compaction():
+            self.chunk_store.compact_async()
+
+    BLOCK_SIZE_PAGES = 20
+
+    def add_document(self, doc_id: str, doc_name: str, chunks: List[dict],
+                     progress: Optional[Callable[..., None]] = None):
+        """
+        Indexes a document's chunks in 20-page blocks. `progress`, if given, is called
+        after each block with running chunks_embedded / blocks_indexed counts.
+        """
         if not chunks:
             return
             
-        # 1. GROUP CHUNKS INTO 20-PAGE BLOCKS
-        # Sort chunks first by page
+        # Sort chunks first by page, then stream them through the block pipeline
         chunks.sort(key=lambda x: x["page"])
-        
-        blocks = {} # key: block_index, value: list of chunks
-        
+        self.add_document_stream(doc_id, doc_name, chunks, progress=progress)
+
+    def add_documents(self, documents: List[Tuple[str, str, List[dict]]], batch_size: Optional[int] = None) -> int:
+        """
+        Bulk form of add_document for (doc_id, doc_name, chunks) tuples. The chunks of all
+        documents are embedded together, `batch_size` per encode call, and blocks are
+        committed without the per-document save_index(); the caller persists with
+        save_index(final=True) at its own checkpoints. Returns the number of blocks added.
+        """
+        documents = [(doc_id, name, sorted(chunks, key=lambda x: x["page"])) for doc_id, name, chunks in documents if chunks]
+        texts = [c["text"] for _, _, chunks in documents for c in chunks]
+        if not texts:
+            return 0
+
+        batch_size = batch_size or self.embed_batch_size
+        batches = []
+        reuse = {"reused": 0, "total": 0}
+        for start in range(0, len(texts), batch_size):
+            with metrics.ingest_stage("embed"):
+                batches.append(self._encode_chunks(texts[start:start + batch_size], reuse))
+        vectors = np.concatenate(batches, axis=0)
+        self._report_cache_reuse(f"{len(documents)} documents", reuse)
+
+        n_blocks = 0
+        row = 0
+        for doc_id, doc_name, chunks in documents:
+            block_rows = {}
+            for i, chunk in enumerate(chunks):
+                block_rows.setdefault((chunk.get("page", 1) - 1) // self.BLOCK_SIZE_PAGES, []).append(i)
+            for b_idx, rows in block_rows.items():
+                self._commit_block(doc_id, doc_name, b_idx, [chunks[i] for i in rows],
+                                   vectors[row + rows[0]:row + rows[-1] + 1])
+                n_blocks += 1
+            row += len(chunks)
+        self._maybe_rebuild_block_index()
+        return n_blocks
+
+    def add_document_stream(self, doc_id: str, doc_name: str, chunks: Iterable[dict],
+                            progress: Optional[Callable[..., None]] = None):
+        """
+        Streaming variant of add_document. `chunks` must arrive in page order; they
+        are embedded in micro-batches and each 20-page block is committed (searchable)
+        as soon as the first chunk of the next block arrives. The store is flushed once,
+        when the document is complete. If anything fails part-way (extraction,
+        embedding, indexing), the blocks already committed are deleted again before
+        the error propagates, so a document is either fully searchable or absent.
+        """
         # Block 0: Pages 1-20
         # Block 1: Pages 21-40
         # ...
-        BLOCK_SIZE_PAGES = 20
-        
-        for chunk in chunks:
-            page = chunk.get("page", 1)
-            # page 1..20 -> block 0
-            # page 21..40 -> block 1
-            block_idx = (page - 1) // BLOCK_SIZE_PAGES
-            
-            if block_idx not in blocks:
-                blocks[block_idx] = []
-            blocks[block_idx].append(chunk)
+        current_block = None
+        block_chunks: List[dict] = []
+        block_vectors: List[np.ndarray] = []
+        pending_texts: List[str] = []
+        counts = {"chunks_embedded": 0, "blocks_indexed": 0}
+        reuse = {"reused": 0, "total": 0}
+        existed = doc_id in self._doc_blocks
 
-        # 2. PROCESS EACH BLOCK
-        for b_idx, block_chunks in blocks.items():
-            block_id = f"{doc_id}_block_{b_idx}"
-            
-            # Determine page range for metadata
-            start_page = (b_idx * BLOCK_SIZE_PAGES) + 1
-            end_page = (b_idx + 1) * BLOCK_SIZE_PAGES
-            
-            # --- Chunk Level (Local Index) ---
-            chunk_texts = [c["text"] for c in block_chunks]
-            chunk_embeddings = self.embedding_model.encode(chunk_texts)
-            
-            local_index = faiss.IndexFlatL2(self.dimension)
-            local_index.add(np.array(chunk_embeddings).astype('float32'))
-            
-            self.chunk_indexes[block_id] = local_index
-            self.chunk_metadata[block_id] = block_chunks
-            
-            # --- Block Level (Global Index) ---
-            # Representative embedding = Mean of chunks
-            block_embedding = np.mean(chunk_embeddings, axis=0).reshape(1, -1)
-            
-            self.block_index.add(np.array(block_embedding).astype('float32'))
-            self.block_metadata.append({
-                "block_id": block_id,
-                "doc_id": doc_id,
-                "name": doc_name,
-                "page_range": f"{start_page}-{end_page}",
-                "chunk_count": len(block_chunks)
-            })
-            
-            print(f"Index: Added Block {b_idx} for {doc_name} (Pages {start_page}-{end_page})")
-        
+        def embed_pending():
+            if pending_texts:
+                with metrics.ingest_stage("embed"):
+                    block_vectors.append(self._encode_chunks(pending_texts, reuse))
+                counts["chunks_embedded"] += len(pending_texts)
+                pending_texts.clear()
+
+        def commit_block():
+            embed_pending()
+            self._commit_block(doc_id, doc_name, current_block, block_chunks, np.concatenate(block_vectors, axis=0))
+            counts["blocks_indexed"] += 1
+            if progress:
+                progress(**counts)
+
+        try:
+            for chunk in chunks:
+                page = chunk.get("page", 1)
+                # page 1..20 -> block 0
+                # page 21..40 -> block 1
+                block_idx = (page - 1) // self.BLOCK_SIZE_PAGES
+
+                if block_idx != current_block:
+                    if current_block is not None:
+                        if block_idx < current_block:
+                            raise ValueError("add_document_stream expects chunks in page order")
+                        commit_block()
+                    current_block = block_idx
+                    block_chunks, block_vectors = [], []
+
+                block_chunks.append(chunk)
+                pending_texts.append(chunk["text"])
+                if len(pending_texts) >= self.embed_batch_size:
+                    embed_pending()
+
+            if current_block is None:
+                return
+            commit_block()
+        except Exception:
+            if not existed and doc_id in self._doc_blocks:
+                print(f"Index: Rolling back {counts['blocks_indexed']} committed blocks of {doc_name}")
+                self.delete_document(doc_id)
+            raise
+        self._maybe_rebuild_block_index()
         self.save_index()
+        self._report_cache_reuse(doc_name, reuse)
 
-    def search(self, query: str, top_k_blocks: int = 3, top_k_chunks: int = 5, score_threshold: float = 1.35):
-        query_vector = self.embedding_model.encode([query]).astype('float32')
+    def _commit_block(self, doc_id: str, doc_name: str, b_idx: int, block_chunks: List[dict], chunk_embeddings: np.ndarray):
+        block_id = f"{doc_id}_block_{b_idx}"
+        
+        # Determine page range for metadata
+        start_page = (b_idx * self.BLOCK_SIZE_PAGES) + 1
+        end_page = (b_idx + 1) * self.BLOCK_SIZE_PAGES
+        
+        # --- Chunk Level (Local Index) ---
+        index_started = time.perf_counter()
+        local_index = self._build_chunk_index(chunk_embeddings)
         
+        # --- Block Level (Global Index) ---
+        # Representative embedding = Mean of chunks
+        block_embedding = np.mean(chunk_embeddings, axis=0).reshape(1, -1)
+        
+        block_meta = {
+            "block_id": block_id,
+            "doc_id": doc_id,
+            "name": doc_name,
+            "page_range": f"{start_page}-{end_page}",
+            "chunk_count": len(block_chunks)
+        }
+        with self._ingest_lock:
+            # Publish the block atomically with respect to searches
+            with self._index_lock.write_locked():
+                self.chunk_store.add_block(block_meta, block_embedding, chunk_embeddings, block_chunks)
+                self.block_index.add(np.array(block_embedding).astype('float32'))
+                self.block_metadata.append(block_meta)
+                self._doc_blocks.setdefault(doc_id, []).append(len(self.block_metadata) - 1)
+                if self.hybrid_search:
+                    self.lexical_index.add(self.chunk_store.offsets[block_id][0], [c["text"] for c in block_chunks])
+                self.chunk_indexes.put(block_id, local_index)
+                self._invalidate_query_caches()
+            metrics.INGEST_STAGE_SECONDS.observe(time.perf_counter() - index_started, stage="index")
+            
+            print(f"Index: Added Block {b_idx} for {doc_name} (Pages {start_page}-{end_page})")
+
+    # --- Deletion ---
+
+    def list_documents(self) -> List[dict]:
+        documents = []
+        with self._index_lock.read_locked():
+            for doc_id, positions in self._doc_blocks.items():
+                first = self.block_metadata[positions[0]]
+                documents.append({"id": doc_id, "name": first.get("name"), "page_range": first.get("page_range"),
+                                  "blocks": len(positions)})
+        return documents
+
+    def delete_document(self, doc_id: str) -> Optional[dict]:
+        """
+        Removes a document from search. Its blocks are tombstoned in the chunk store
+        and its chunks dropped from the BM25 postings, so the cost is proportional to
+        the document, not the corpus. Rows are reclaimed later by purge_deleted().
+        Returns counts, or None for an unknown doc_id.
+        """
+        with self._ingest_lock:
+            positions = self._doc_blocks.get(doc_id)
+            if positions is None:
+                return None
+            # Tombstones must only refer to rows already on disk
+            self.chunk_store.flush()
+            block_ids = [self.block_metadata[p]["block_id"] for p in positions]
+            texts = {}
+            if self.hybrid_search:
+                for block_id in block_ids:
+                    texts[block_id] = [c["text"] for c in self.chunk_store.get_block(block_id)[1]]
+
+            chunks = 0
+            with self._index_lock.write_locked():
+                for block_id in block_ids:
+                    start, end = self.chunk_store.delete_block(block_id)
+                    chunks += end - start
+                    if self.hybrid_search:
+                        self.lexical_index.remove(range(start, end), texts[block_id])
+                    self.chunk_indexes.pop(block_id)
+                self._deleted_positions = self._deleted_positions | set(positions)
+                del self._doc_blocks[doc_id]
+                self._invalidate_query_caches()
+            print(f"Index: Deleted document {doc_id} ({len(block_ids)} blocks, {chunks} chunks)")
+
+        if self.chunk_store.deleted_rows > self.purge_deleted_fraction * max(1, self.chunk_store.ntotal):
+            self.purge_deleted_async()
+        return {"doc_id": doc_id, "blocks_deleted": len(block_ids), "chunks_deleted": chunks}
+
+    def purge_deleted(self) -> dict:
+        """
+        Rewrites the chunk store without deleted blocks and rebuilds the block index
+        from the remaining block vectors. The O(corpus) copy and the index build run
+        without the ingest lock, so uploads, deletions and searches continue; only the
+        swap is exclusive. It appends blocks committed meanwhile to the new block index
+        and renumbers BM25 rows.
+        """
+        with self._ingest_lock:
+            # Tombstones must only refer to rows already on disk
+            self.chunk_store.flush()
+        plan = self.chunk_store.prepare_purge()
+        if plan is None:
+            return {"blocks_purged": 0, "chunks_purged": 0}
+        blocks_purged = len(plan["tombstones"])
+        chunks_purged = int((plan["row_map"] < 0).sum())
+
+        try:
+            block_vectors = plan["block_vectors"]
+            kind = self.block_index_type if len(block_vectors) >= self.block_index_threshold else FLAT
+            block_index = build_block_index(kind, self.dimension, block_vectors)
+            set_search_params(block_index, self.block_nprobe, self.block_ef_search)
+        except Exception:
+            self.chunk_store.abort_purge()
+            raise
+
+        with self._ingest_lock:
+            # Files keyed by the old row / block numbering are rebuilt at load if we crash mid-swap
+            for path in (self.block_ann_path, self.block_ann_info_path, self.lexical_index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            with self._index_lock.write_locked():
+                row_map = self.chunk_store.commit_purge(plan)
+                self.block_metadata = self.chunk_store.blocks
+                added = self.chunk_store.block_vectors()[len(block_vectors):]
+                if len(added):
+                    block_index.add(added)
+                self.block_index = block_index
+                if self.hybrid_search:
+                    self.lexical_index = self.lexical_index.remap(row_map, self.chunk_store.ntotal)
+                self._index_documents()
+                self._invalidate_query_caches()
+
+            if kind != FLAT:
+                self._block_index_trained_at = len(block_vectors)
+                save_block_index(block_index, self.block_ann_path, self.block_ann_info_path,
+                                 {"trained_at": self._block_index_trained_at})
+            if self.hybrid_search:
+                self._lexical_saved_rows = 0
+                self._save_lexical_index(force=True)
+        print(f"Chunk store purged {blocks_purged} deleted blocks ({chunks_purged} chunks).")
+        return {"blocks_purged": blocks_purged, "chunks_purged": chunks_purged}
+
+    def purge_deleted_async(self):
+        if self._purge_thread is not None and self._purge_thread.is_alive():
+            return
+        self._purge_thread = threading.Thread(target=self.purge_deleted, daemon=True)
+        self._purge_thread.start()
+
+    def wait_for_purge(self):
+        if self._purge_thread is not None:
+            self._purge_thread.join()
+
+    def _invalidate_query_caches(self):
+        self.index_generation += 1
+        self.search_cache.clear()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
+
+    def _encode_chunks(self, texts: List[str], reuse: Optional[dict] = None) -> np.ndarray:
+        """
+        Embeds chunk texts, reusing cached vectors and encoding only the misses.
+        `reuse`, if given, accumulates reused/total counts for one report per document.
+        """
+        if self.embedding_cache is None:
+            return np.asarray(self.embedding_model.encode(texts)).astype('float32')
+
+        keys = [self.embedding_cache.key(self.embedding_model_id, t) for t in texts]
+        cached = self.embedding_cache.get_many(keys)
+
+        # Encode each distinct missing key once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            encoded = np.asarray(self.embedding_model.encode(list(missing.values()))).astype('float32')
+            fresh = dict(zip(missing.keys(), encoded))
+            self.embedding_cache.put_many(fresh)
+            cached.update(fresh)
+
+        if reuse is not None:
+            reuse["reused"] += len(texts) - len(missing)
+            reuse["total"] += len(texts)
+        return np.stack([cached[k] for k in keys]).astype('float32')
+
+    def _report_cache_reuse(self, what: str, reuse: dict):
+        if self.embedding_cache is not None and reuse["total"]:
+            print(f"Embedding cache: {reuse['reused']}/{reuse['total']} chunks reused for {what}")
+
+    def embedding_cache_stats(self) -> dict:
+        return self.embedding_cache.stats() if self.embedding_cache else {}
+
+    def search(self, query: str, top_k_blocks: int = 3, top_k_chunks: int = 5, score_threshold: float = 1.35,
+               score_margin: Optional[float] = None):
+        return self.search_batch([query], top_k_blocks, top_k_chunks, score_threshold, score_margin)[0]
+
+    def search_batch(self, queries: List[str], top_k_blocks: int = 3, top_k_chunks: int = 5, score_threshold: float = 1.35,
+                     score_margin: Optional[float] = None) -> List[List[dict]]:
+        """
+        Runs the two-stage search for many queries at once: one encode call, one
+        block-level search, and one chunk-level search per routed block.
+        Returns one result list per query, in input order. `score_margin` overrides
+        self.score_margin (results must score within that factor of the best match).
+        """
+        if not queries:
+            return []
+        if score_margin is None:
+            score_margin = self.score_margin
+
+        # Serve repeated questions from the result cache; search only the rest
+        params = (top_k_blocks, top_k_chunks, score_threshold, score_margin)
+        results: List[Optional[List[dict]]] = [self.search_cache.get((self.index_generation, q) + params) for q in queries]
+        todo = [i for i, r in enumerate(results) if r is None]
+
+        if todo:
+            query_vectors = self._encode_queries([queries[i] for i in todo])
+            # Both stages see one consistent index generation
+            with self._index_lock.read_locked():
+                generation = self.index_generation
+                fresh = self._search_vectors(query_vectors, top_k_blocks, top_k_chunks, score_threshold, score_margin)
+            if self.hybrid_search:
+                with metrics.stage("lexical_search"):
+                    fresh = self._fuse_lexical([queries[i] for i in todo], query_vectors, fresh, top_k_chunks)
+            for i, result in zip(todo, fresh):
+                self.search_cache.put((generation, queries[i]) + params, result)
+                results[i] = result
+
+        # Hand out copies so callers cannot mutate cached entries
+        return [[dict(c) for c in result] for result in results]
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        vectors = {}
+        missing = []
+        for q in dict.fromkeys(queries):
+            vector = self.query_embedding_cache.get(q)
+            if vector is None:
+                missing.append(q)
+            else:
+                vectors[q] = vector
+        if missing:
+            with metrics.stage("query_embedding"):
+                encoded = np.asarray(self.embedding_model.encode(missing)).astype('float32')
+            for q, vector in zip(missing, encoded):
+                self.query_embedding_cache.put(q, vector)
+                vectors[q] = vector
+        return np.stack([vectors[q] for q in queries]).astype('float32')
+
+    def query_cache_stats(self) -> dict:
+        stats = {
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "search_results": self.search_cache.stats(),
+        }
+        if self.semantic_cache is not None:
+            stats["semantic_answers"] = self.semantic_cache.stats()
+        return stats
+
+    def _search_vectors(self, query_vectors: np.ndarray, top_k_blocks: int, top_k_chunks: int, score_threshold: float,
+                        score_margin: float) -> List[List[dict]]:
+        n_queries = len(query_vectors)
+
         # STAGE 1: Block Search
         if self.block_index.ntotal == 0:
-            return []
+            return [[] for _ in range(n_queries)]
             
-        k_blocks = min(top_k_blocks, self.block_index.ntotal)
-        block_dists, block_indices = self.block_index.search(query_vector, k_blocks)
+        # Deleted blocks still in the index are excluded inside FAISS
+        k_blocks = min(top_k_blocks, self.block_index.ntotal - len(self._deleted_positions))
+        if k_blocks <= 0:
+            return [[] for _ in range(n_queries)]
+        with metrics.stage("block_search"):
+            block_dists, block_indices = self.block_index.search(query_vectors, k_blocks,
+                                                                 params=self._block_search_params())
         
-        relevant_block_ids = []
-        for i, idx in enumerate(block_indices[0]):
-            if idx != -1 and idx < len(self.block_metadata):
-                relevant_block_ids.append(self.block_metadata[idx]["block_id"])
-                
-        # STAGE 2: Chunk Search within relevant BLOCKS
-        all_candidates = []
+        # Group queries by the blocks they routed to: block_id -> [query positions]
+        routed: Dict[str, List[int]] = {}
+        for q, row in enumerate(block_indices):
+            for idx in row:
+                if idx != -1 and idx < len(self.block_metadata):
+                    routed.setdefault(self.block_metadata[idx]["block_id"], []).append(q)
+
+        with metrics.stage("chunk_search"):
+            return self._search_chunks(query_vectors, routed, top_k_chunks, score_threshold, score_margin)
+
+    def _block_search_params(self):
+        # Rebuilt only when the block index or the deleted set changes
+        index, generation = self.block_index, self.index_generation
+        cached = self._block_params
+        if cached is None or cached[0] is not index or cached[1] != generation:
+            cached = self._block_params = (index, generation, excluding(index, self._deleted_positions))
+        return cached[2]
+
+    def _search_chunks(self, query_vectors: np.ndarray, routed: Dict[str, List[int]],
+                       top_k_chunks: int, score_threshold: float, score_margin: float) -> List[List[dict]]:
+        # STAGE 2: Chunk Search within relevant BLOCKS (each block searched once)
+        all_candidates: List[List[dict]] = [[] for _ in range(len(query_vectors))]
         
-        for block_id in relevant_block_ids:
-            if block_id in self.chunk_indexes:
-                idx = self.chunk_indexes[block_id]
-                meta = self.chunk_metadata[block_id]
-                
-                k_chunks = min(top_k_chunks, idx.ntotal)
-                dists, indices = idx.search(query_vector, k_chunks)
-                
-                for j, match_idx in enumerate(indices[0]):
+        for block_id, query_ids in routed.items():
+            idx = self._load_chunk_index(block_id)
+            if idx is None:
+                continue
+            block_vectors, meta = self.chunk_store.get_block(block_id)
+            
+            k_chunks = min(top_k_chunks, idx.ntotal)
+            if self.chunk_quantization == quantization.NONE:
+                dists, indices = idx.search(query_vectors[query_ids], k_chunks)
+            else:
+                # Approximate shortlist from compressed codes, then exact distances from stored rows
+                shortlist = min(k_chunks * self.chunk_rerank_factor, idx.ntotal)
+                _, candidates = idx.search(query_vectors[query_ids], shortlist)
+                dists, indices = quantization.rerank_exact(block_vectors, query_vectors[query_ids], candidates, k_chunks)
+            
+            for row, q in enumerate(query_ids):
+                for j, match_idx in enumerate(indices[row]):
                     if match_idx != -1 and match_idx < len(meta):
-                        distance = float(dists[0][j])
+                        distance = float(dists[row][j])
                         
                         # STRICT THRESHOLD CHECK
                         # L2 Distance 1.35 approx equates to Cosine Sim ~0.32
@@ -213,13 +942,69 @@ class RAGEngine:
                             continue
                             
                         item = meta[match_idx]
-                        all_candidates.append({
+                        all_candidates[q].append({
                             "text": item["text"],
                             "page": item.get("page", 1),
                             "score": distance,
                             "document_name": item.get("source", "unknown")
                         })
         
+        return [self._select_results(candidates, top_k_chunks, score_margin) for candidates in all_candidates]
+
+    def _fuse_lexical(self, queries: List[str], query_vectors: np.ndarray, dense: List[List[dict]],
+                      top_k_chunks: int) -> List[List[dict]]:
+        """
+        Reciprocal-rank fusion of each query's dense results with BM25 hits over all
+        chunks. BM25 scoring runs without the index lock, so it never holds up
+        ingestion; only reading the hit rows takes it (and rescoring, in the rare case
+        a purge renumbered the rows meanwhile).
+        """
+        index = self.lexical_index
+        hits = [index.search(q, k=top_k_chunks * 2) for q in queries]
+        with self._index_lock.read_locked():
+            if self.lexical_index is not index:
+                index = self.lexical_index
+                hits = [index.search(q, k=top_k_chunks * 2) for q in queries]
+            return [
+                self._fuse_hits([h for h in query_hits if h[0] not in index.removed], query_vector, results, top_k_chunks)
+                for query_hits, query_vector, results in zip(hits, query_vectors, dense)
+            ]
+
+    def _fuse_hits(self, hits: List[tuple], query_vector: np.ndarray, dense: List[dict], top_k_chunks: int) -> List[dict]:
+        """
+        BM25 hits bypass the dense score threshold only when they cover at least
+        `lexical_min_coverage` of the query's (idf-weighted) terms, so exact terms,
+        codes and typos found lexically are kept while weak partial matches are not.
+        """
+        hits = [h for h in hits if h[2] >= self.lexical_min_coverage]
+        if not hits:
+            return dense
+
+        def key(item):
+            return (item["document_name"], item["page"], item["text"])
+
+        fused: Dict[tuple, float] = {}
+        items: Dict[tuple, dict] = {}
+        for rank, item in enumerate(dense):
+            items[key(item)] = item
+            fused[key(item)] = 1.0 / (self.rrf_k + rank + 1)
+
+        vectors, chunks = self.chunk_store.get_rows([row for row, _, _ in hits])
+        distances = ((vectors - query_vector) ** 2).sum(axis=1)
+        for rank, (chunk, distance) in enumerate(zip(chunks, distances)):
+            item = {
+                "text": chunk["text"],
+                "page": chunk.get("page", 1),
+                "score": float(distance),
+                "document_name": chunk.get("source", "unknown"),
+            }
+            items.setdefault(key(item), item)
+            fused[key(item)] = fused.get(key(item), 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        ranked = sorted(fused, key=lambda k: -fused[k])[:top_k_chunks]
+        return [items[k] for k in ranked]
+
+    def _select_results(self, all_candidates: List[dict], top_k_chunks: int, score_margin: float) -> List[dict]:
         # Sort by score (L2 distance ascending) and take top K global
         all_candidates.sort(key=lambda x: x["score"])
         
@@ -228,22 +1013,94 @@ class RAGEngine:
         final_results = []
         if all_candidates:
             best_score = all_candidates[0]["score"]
+            limit = best_score * score_margin if np.isfinite(score_margin) else np.inf
             # Allow a small margin (e.g. 10-15% worse than best is okay)
             # Since L2 score: Lower is better. 
             # If best is 0.5, allow up to 0.55. If best is 1.0, allow 1.1.
-            score_margin = 1.1 
-            
             for c in all_candidates:
-                if c["score"] <= best_score * score_margin:
+                if c["score"] <= limit:
                     final_results.append(c)
                 else:
                     break # Since sorted, we can stop early
         
         return final_results[:top_k_chunks]
 
+    def _retrieve(self, query: str, top_k_chunks: int = 5) -> List[dict]:
+        """search(), then the optional re-ranker. An empty result means refuse without generating."""
+        if self.reranker is None:
+            context_items = self.search(query, top_k_chunks=top_k_chunks)
+            if not context_items:
+                metrics.REFUSALS.inc(reason="retrieval")
+            return context_items
+
+        # The cross-encoder replaces the adaptive margin, so it sees every candidate under the threshold
+        candidates = self.search(query, top_k_chunks=self.rerank_candidates, score_margin=float("inf"))
+        if not candidates:
+            metrics.REFUSALS.inc(reason="retrieval")
+            return []
+        with metrics.stage("rerank"):
+            context_items = self.reranker.rerank(query, candidates, top_k_chunks)
+        if not context_items:
+            metrics.REFUSALS.inc(reason="reranker")
+            print(f"Refusal: re-ranker found no relevant candidate among {len(candidates)} for query '{query}'")
+        return context_items
+
+    def _count_tokens(self, text: str) -> int:
+        if isinstance(self.llm, LLMPool):
+            return self.llm.count_tokens(text)
+        return estimate_tokens(text)
+
+    def _pack_prompt(self, context_items: List[dict], query: str):
+        with metrics.stage("prompt_build"):
+            prompt, used_items, usage = self.prompt_builder.build(context_items, query)
+        if self.llm:
+            metrics.LLM_PROMPT_TOKENS.inc(usage["prompt_tokens"])
+        print(f"Prompt: {usage['prompt_tokens']} tokens, context {usage['context_tokens']}/{usage['context_budget']} "
+              f"({usage['chunks_used']}/{usage['chunks_retrieved']} chunks, {usage['chunks_merged']} merged, "
+              f"{usage['chunks_dropped']} dropped)")
+        return prompt, used_items, usage
+
+    def llm_stats(self) -> Optional[dict]:
+        return self.llm.stats() if isinstance(self.llm, LLMPool) else None
+
+    def _semantic_lookup(self, query: str):
+        # Returns (cached_response, query_vector); cached_response is None on a miss
+        query_vector = self._encode_queries([query])[0]
+        return self.semantic_cache.lookup(query_vector), query_vector
+
+    def _semantic_store(self, query: str, query_vector: np.ndarray, generation: int, response: dict):
+        # Skip answers produced without an LLM or against an index that changed meanwhile
+        if self.llm is None or generation != self.index_generation:
+            return
+        self.semantic_cache.put(query, query_vector, {
+            "answer": response["answer"],
+            "citations": [c if isinstance(c, dict) else _citation_dict(c) for c in response["citations"]],
+        })
+
     def generate_answer(self, query: str) -> dict:
-        # Retrieve with threshold
-        context_items = self.search(query)
+        # Stage timings (ms) recorded while answering are returned with the response
+        with metrics.trace() as timings:
+            response = self._answer_with_cache(query)
+        if timings:
+            response["timings"] = timings
+        return response
+
+    def _answer_with_cache(self, query: str) -> dict:
+        if self.semantic_cache is None:
+            return self._generate_answer(query)
+
+        generation = self.index_generation
+        cached, query_vector = self._semantic_lookup(query)
+        if cached is not None:
+            return {"answer": cached["answer"], "citations": list(cached["citations"])}
+
+        response = self._generate_answer(query)
+        self._semantic_store(query, query_vector, generation, response)
+        return response
+
+    def _generate_answer(self, query: str) -> dict:
+        # Retrieve with threshold (and re-rank, if enabled)
+        context_items = self._retrieve(query)
         
         if not context_items:
             print(f"Refusal: No context items passed threshold for query '{query}'")
@@ -252,35 +1109,32 @@ class RAGEngine:
                 "citations": []
             }
 
-        # Build Context
-        context_str = "\n\n".join([f"Document: {c['document_name']} (Page {c['page']})\nContent: {c['text']}" for c in context_items])
-        
-        # ChatML Formatting for Phi-3
-        system_instruction = """You are a precise and honest assistant. Your task is to answer the user's question using ONLY the provided context.
-Instructions:
-1. The User Question may contain typos. Match distinct words in the context (e.g. "Marigin" matches "Margin").
-2. Answer the question using ONLY the provided context.
-3. If the context does not contain the answer, output the exact phrase: "The requested information is not available in the uploaded documents."
-4. CRITICAL: Do NOT use outside knowledge. Do NOT explain concepts (like "Softmax") not found in the context."""
-
-        user_content = f"Context:\n{context_str}\n\nUser Question: {query}"
-        
-        prompt = f"<|user|>\n{system_instruction}\n\n{user_content}<|end|>\n<|assistant|>"
+        prompt, context_items, usage = self._pack_prompt(context_items, query)
+        if not context_items:
+            # The question and answer allowance leave no room for any retrieved chunk
+            metrics.REFUSALS.inc(reason="prompt_budget")
+            print(f"Refusal: no retrieved chunk fits the prompt budget for query '{query}'")
+            return {
+                "answer": "The requested information is not available in the uploaded documents.",
+                "citations": []
+            }
 
         answer = ""
         if self.llm:
-            output = self.llm(
-                prompt, 
-                max_tokens=512, 
-                stop=["User Question:", "\n\n"], 
-                echo=False
-            )
+            with metrics.stage("generation"):
+                output = self.llm(
+                    prompt, 
+                    max_tokens=self.prompt_builder.max_answer_tokens, 
+                    stop=["User Question:", "\n\n"], 
+                    echo=False
+                )
             answer = output['choices'][0]['text'].strip()
         else:
             answer = "⚠️ **System Notice**: LLM not loaded. Displaying retrieved context only."
 
         # Double check model refusal
         if "information is not available" in answer.lower() or "context does not contain" in answer.lower():
+            metrics.REFUSALS.inc(reason="model")
             return {
                 "answer": "The requested information is not available in the uploaded documents.",
                 "citations": []
@@ -297,19 +1151,65 @@ Instructions:
 
         return {
             "answer": answer,
-            "citations": citations
+            "citations": citations,
+            "usage": usage
         }
 
     def generate_answer_stream(self, query: str):
+        if self.semantic_cache is None:
+            yield from self._generate_answer_stream(query)
+            return
+
+        import json
+        generation = self.index_generation
+        cached, query_vector = self._semantic_lookup(query)
+        if cached is not None:
+            # Replay the cached answer in the same event format
+            if not cached["citations"]:
+                yield "data: " + json.dumps({"answer": cached["answer"], "citations": []}) + "\n\n"
+                return
+            yield f"event: citations\ndata: {json.dumps(cached['citations'])}\n\n"
+            yield f"data: {json.dumps({'token': cached['answer']})}\n\n"
+            return
+
+        tokens = []
+        citations = []
+        refused = False
+        for event in self._generate_answer_stream(query):
+            if event.startswith("event: citations"):
+                citations = json.loads(event.split("data: ", 1)[1])
+            elif '"token"' in event:
+                tokens.append(json.loads(event[len("data: "):])["token"])
+            else:
+                refused = True
+            yield event
+
+        if refused:
+            answer = "The requested information is not available in the uploaded documents."
+        else:
+            answer = "".join(tokens).strip()
+        self._semantic_store(query, query_vector, generation, {"answer": answer, "citations": citations})
+
+    def _generate_answer_stream(self, query: str):
         # Retrieve
-        context_items = self.search(query, top_k_chunks=3)
+        context_items = self._retrieve(query, top_k_chunks=3)
         
+        refusal = "data: " + str({"answer": "The requested information is not available in the uploaded documents.", "citations": []}).replace("'", '"') + "\n\n"
+
         # 1. Handle No Context (Refusal)
         if not context_items:
-            yield "data: " + str({"answer": "The requested information is not available in the uploaded documents.", "citations": []}).replace("'", '"') + "\n\n"
+            yield refusal
             return
 
-        # 2. Yield Citations First
+        # 2. Pack the prompt; only chunks that made it in are cited
+        prompt, context_items, _ = self._pack_prompt(context_items, query)
+        if not context_items:
+            metrics.REFUSALS.inc(reason="prompt_budget")
+            print(f"Refusal: no retrieved chunk fits the prompt budget for query '{query}'")
+            yield refusal
+            return
+
+        # 3. Yield Citations First
         citations = [
             {
                 "document_name": c['document_name'],
@@ -323,35 +1223,21 @@ Instructions:
         import json
         yield f"event: citations\ndata: {json.dumps(citations)}\n\n"
 
-        # 3. Prepare Prompt
-        context_str = "\n\n".join([f"Document: {c['document_name']} (Page {c['page']})\nContent: {c['text']}" for c in context_items])
-        
-        # ChatML Formatting for Phi-3
-        system_instruction = """You are a precise and honest assistant. Your task is to answer the user's question using ONLY the provided context.
-Instructions:
-1. The User Question may contain typos. Match distinct words in the context (e.g. "Marigin" matches "Margin").
-2. Answer the question using ONLY the provided context.
-3. If the context does not contain the answer, output the exact phrase: "The requested information is not available in the uploaded documents."
-4. CRITICAL: Do NOT use outside knowledge. Do NOT explain concepts (like "Softmax") not found in the context."""
-
-        user_content = f"Context:\n{context_str}\n\nUser Question: {query}"
-        
-        prompt = f"<|user|>\n{system_instruction}\n\n{user_content}<|end|>\n<|assistant|>"
-
         # 4. Stream Tokens
         if self.llm:
             stream = self.llm(
                 prompt,
-                max_tokens=512,
+                max_tokens=self.prompt_builder.max_answer_tokens,
                 stop=["User Question:", "\n\n"],
                 stream=True,
                 echo=False
             )
             
-            for output in stream:
-                token = output['choices'][0]['text']
-                # clean up partial tokens if needed, but usually fine
-                event_data = json.dumps({"token": token})
-                yield f"data: {event_data}\n\n"
+            with metrics.stage("generation"):
+                for output in stream:
+                    token = output['choices'][0]['text']
+                    # clean up partial tokens if needed, but usually fine
+                    event_data = json.dumps({"token": token})
+                    yield f"data: {event_data}\n\n"
         else:
             yield f"data: {json.dumps({'token': '⚠️ LLM not loaded.'})}\n\n"
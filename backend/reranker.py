@@ -0,0 +1,124 @@
+"""
+Cross-encoder re-ranking of stage-2 candidates, with a calibrated relevance
+probability used to refuse before generation.
+
+Calibrate the probability on your own documents from a JSONL file of judged
+pairs ({"query": ..., "text": ..., "relevant": true/false}):
+
+    python -m backend.reranker labels.jsonl
+
+and set RAG_RERANK_SCALE / RAG_RERANK_BIAS to the printed values.
+"""
+import sys
+import json
+import hashlib
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+from backend.cache import LRUCache
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def fit_platt(logits: Sequence[float], labels: Sequence[bool], iterations: int = 100) -> Tuple[float, float]:
+    """
+    Platt scaling: fits p = sigmoid(scale * logit + bias) to binary relevance labels
+    by Newton's method on the log-loss. Returns (scale, bias).
+    """
+    x = np.asarray(logits, dtype="float64")
+    y = np.asarray(labels, dtype="float64")
+    # Platt's smoothed targets keep the fit finite when the classes separate perfectly
+    n_pos, n_neg = y.sum(), len(y) - y.sum()
+    t = np.where(y > 0, (n_pos + 1) / (n_pos + 2), 1 / (n_neg + 2))
+    scale, bias = 1.0, 0.0
+    for _ in range(iterations):
+        p = _sigmoid(scale * x + bias)
+        w = p * (1 - p) + 1e-12
+        grad = np.array([np.sum((p - t) * x), np.sum(p - t)])
+        hess = np.array([[np.sum(w * x * x), np.sum(w * x)], [np.sum(w * x), np.sum(w)]])
+        step = np.linalg.solve(hess + 1e-9 * np.eye(2), grad)
+        scale, bias = scale - step[0], bias - step[1]
+        if np.abs(step).max() < 1e-8:
+            break
+    return float(scale), float(bias)
+
+
+class Reranker:
+    """
+    Scores (query, chunk text) pairs with a cross-encoder (e.g. sentence-transformers'
+    CrossEncoder). Pairs not already cached are scored in one batched predict() call;
+    raw logits are cached per (query, text) so repeated and overlapping questions
+    skip inference.
+
+    relevance = sigmoid(scale * logit + bias). Candidates below `min_relevance` are
+    dropped; if none are left the caller refuses without running the LLM.
+    """
+
+    def __init__(self, model, batch_size: int = 32, cache_size: int = 4096,
+                 scale: float = 1.0, bias: float = 0.0, min_relevance: float = 0.1):
+        self.model = model
+        self.batch_size = batch_size
+        self.scale = scale
+        self.bias = bias
+        self.min_relevance = min_relevance
+        self.cache = LRUCache(max_items=cache_size)
+
+    @staticmethod
+    def _key(query: str, text: str) -> tuple:
+        return (query.strip().lower(), hashlib.sha1(text.encode("utf-8")).hexdigest())
+
+    def logits(self, query: str, texts: List[str]) -> np.ndarray:
+        keys = [self._key(query, t) for t in texts]
+        scores = [self.cache.get(k) for k in keys]
+        missing = {}
+        for key, text, score in zip(keys, texts, scores):
+            if score is None and key not in missing:
+                missing[key] = text
+        if missing:
+            predicted = self.model.predict([(query, t) for t in missing.values()], batch_size=self.batch_size)
+            for key, logit in zip(missing, np.asarray(predicted, dtype="float64").reshape(-1)):
+                self.cache.put(key, float(logit))
+            scores = [self.cache.get(k) if s is None else s for k, s in zip(keys, scores)]
+        return np.asarray(scores, dtype="float64")
+
+    def relevance(self, query: str, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros(0)
+        return _sigmoid(self.scale * self.logits(query, texts) + self.bias)
+
+    def rerank(self, query: str, items: List[dict], top_k: int) -> List[dict]:
+        """Returns up to top_k items ordered by relevance, each with a "relevance" key; [] means refuse."""
+        relevance = self.relevance(query, [item["text"] for item in items])
+        order = np.argsort(-relevance, kind="stable")
+        kept = []
+        for i in order[:top_k]:
+            if relevance[i] < self.min_relevance:
+                break
+            kept.append(dict(items[i], relevance=float(relevance[i])))
+        return kept
+
+    def stats(self) -> dict:
+        return {"cache": self.cache.stats(), "min_relevance": self.min_relevance}
+
+
+def main(path: str, model_name: Optional[str] = None):
+    from sentence_transformers import CrossEncoder
+    from backend import config
+
+    pairs, labels = [], []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                pairs.append((row["query"], row["text"]))
+                labels.append(bool(row["relevant"]))
+    model = CrossEncoder(model_name or config.RERANKER_MODEL)
+    logits = np.asarray(model.predict(pairs, batch_size=config.RERANK_BATCH_SIZE), dtype="float64").reshape(-1)
+    scale, bias = fit_platt(logits, labels)
+    print(json.dumps({"pairs": len(pairs), "positives": int(sum(labels)), "RAG_RERANK_SCALE": round(scale, 4),
+                      "RAG_RERANK_BIAS": round(bias, 4)}, indent=2))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -18,6 +18,14 @@ def setup_models():
     model.save(os.path.join(models_dir, "embedding_model"))
     print("Embedding Model saved to models/embedding_model")
 
+    # Optional cross-encoder re-ranker (RAG_RERANKER=1)
+    from backend import config
+    if config.RERANKER:
+        from sentence_transformers import CrossEncoder
+        print(f"Downloading Re-ranker: {config.RERANKER_MODEL}...")
+        CrossEncoder(config.RERANKER_MODEL).save(os.path.join(models_dir, "reranker_model"))
+        print("Re-ranker saved to models/reranker_model")
+
     # 3. Download LLM (Phi-3-mini-4k-instruct-GGUF)
     # Repo: bartowski is reliable for GGUFs
     repo_id = "bartowski/Phi-3-mini-4k-instruct-GGUF"
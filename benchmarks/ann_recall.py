@@ -0,0 +1,74 @@
+"""
+Recall@k / latency of the ANN block-index backends against exact flat search.
+
+Usage:
+    python -m benchmarks.ann_recall --blocks 50000 --queries 500 --k 3
+"""
+import sys
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+from backend.block_index import BLOCK_INDEX_TYPES, FLAT, build_block_index, set_search_params, recall_at_k
+
+
+def synthetic_block_vectors(n_blocks: int, dimension: int, n_topics: int, seed: int) -> np.ndarray:
+    # Block vectors are means of chunk embeddings, so they cluster by topic
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dimension)).astype("float32")
+    assignment = rng.integers(0, n_topics, n_blocks)
+    vectors = topics[assignment] + 0.5 * rng.standard_normal((n_blocks, dimension)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def run(args) -> dict:
+    vectors = synthetic_block_vectors(args.blocks, args.dim, args.topics, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.integers(0, args.blocks, args.queries)
+    queries = vectors[picks] + 0.3 * rng.standard_normal((args.queries, args.dim)).astype("float32")
+    queries = np.ascontiguousarray(queries / np.linalg.norm(queries, axis=1, keepdims=True), dtype="float32")
+
+    flat = build_block_index(FLAT, args.dim, vectors)
+    report = {"blocks": args.blocks, "queries": args.queries, "k": args.k, "results": []}
+
+    for kind in args.kinds:
+        start = time.perf_counter()
+        index = build_block_index(kind, args.dim, vectors)
+        build_s = time.perf_counter() - start
+        set_search_params(index, nprobe=args.nprobe, ef_search=args.ef_search)
+
+        start = time.perf_counter()
+        index.search(queries, args.k)
+        search_s = time.perf_counter() - start
+
+        report["results"].append({
+            "kind": kind,
+            "build_s": round(build_s, 4),
+            "search_ms_per_query": round(1000 * search_s / args.queries, 4),
+            "recall_at_k": round(recall_at_k(index, flat, queries, args.k), 4),
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Block index recall@k vs flat baseline")
+    parser.add_argument("--blocks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--kinds", nargs="+", default=list(BLOCK_INDEX_TYPES), choices=BLOCK_INDEX_TYPES)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Memory saved vs recall lost for the chunk-level quantization modes.
+
+Builds one index per block over synthetic chunk embeddings, exactly as the
+engine does, and compares stage-2 top-k (with and without exact re-ranking)
+against the float32 flat baseline.
+
+Usage:
+    python -m benchmarks.chunk_quantization --blocks 200 --chunks-per-block 120
+"""
+import sys
+import os
+import json
+import argparse
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+from backend import quantization
+
+
+def run(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    dim = args.dim
+    blocks = []
+    for _ in range(args.blocks):
+        center = rng.standard_normal(dim).astype("float32")
+        vectors = center + 0.8 * rng.standard_normal((args.chunks_per_block, dim)).astype("float32")
+        blocks.append(vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+
+    queries = []
+    for _ in range(args.queries):
+        block = blocks[rng.integers(0, args.blocks)]
+        q = block[rng.integers(0, len(block))] + 0.3 * rng.standard_normal(dim).astype("float32")
+        queries.append(q / np.linalg.norm(q))
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    routing = rng.integers(0, args.blocks, args.queries)
+
+    sample = np.concatenate(blocks, axis=0)[:20000]
+    pq_template = quantization.train_pq_template(dim, sample)
+    report = {"blocks": args.blocks, "chunks_per_block": args.chunks_per_block, "k": args.k, "results": []}
+
+    baseline = None
+    for mode in quantization.QUANTIZATION_MODES:
+        index_bytes = 0
+        hits_raw = hits_reranked = 0
+        topk = []
+        for q, b in enumerate(routing):
+            stored = blocks[b].astype(quantization.storage_dtype(mode))
+            index = quantization.build_chunk_index(mode, dim, blocks[b], pq_template)
+            _, raw = index.search(queries[q:q + 1], args.k)
+            shortlist = min(args.k * args.rerank_factor, index.ntotal)
+            _, candidates = index.search(queries[q:q + 1], shortlist)
+            _, reranked = quantization.rerank_exact(stored, queries[q:q + 1], candidates, args.k)
+            topk.append((set(raw[0].tolist()), set(reranked[0].tolist())))
+        for index in [quantization.build_chunk_index(mode, dim, blk, pq_template) for blk in blocks]:
+            index_bytes += index.ntotal * index.code_size
+
+        if baseline is None:
+            baseline = [raw for raw, _ in topk]
+        for (raw, reranked), exact in zip(topk, baseline):
+            hits_raw += len(raw & exact)
+            hits_reranked += len(reranked & exact)
+
+        total = float(args.k * args.queries)
+        report["results"].append({
+            "mode": mode,
+            "index_mb": round(index_bytes / 1e6, 3),
+            "storage_dtype": quantization.storage_dtype(mode),
+            "recall_at_k_no_rerank": round(hits_raw / total, 4),
+            "recall_at_k_reranked": round(hits_reranked / total, 4),
+        })
+
+    flat_mb = report["results"][0]["index_mb"]
+    for row in report["results"]:
+        row["memory_saved_pct"] = round(100 * (1 - row["index_mb"] / flat_mb), 1) if flat_mb else 0.0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk quantization memory/recall report")
+    parser.add_argument("--blocks", type=int, default=100)
+    parser.add_argument("--chunks-per-block", type=int, default=120)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
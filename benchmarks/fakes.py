@@ -0,0 +1,69 @@
+"""
+Deterministic stand-ins for the models so benchmarks (and the test suite) run offline and repeatably.
+"""
+import time
+import zlib
+import numpy as np
+
+
+class HashEmbedder:
+    """
+    Bag-of-words embedder: every token maps to a fixed random vector (seeded by its
+    crc32) and a text is the normalized sum. Texts sharing words land close together,
+    which is enough structure for retrieval benchmarks.
+    """
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+        self._cache = {}
+
+    def _token_vector(self, token: str) -> np.ndarray:
+        vector = self._cache.get(token)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(token.encode("utf-8")))
+            vector = self._cache[token] = rng.standard_normal(self.dimension).astype("float32")
+        return vector
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), self.dimension), dtype="float32")
+        for i, text in enumerate(texts):
+            for token in text.lower().split():
+                vectors[i] += self._token_vector(token)
+            norm = np.linalg.norm(vectors[i])
+            if norm > 0:
+                vectors[i] /= norm
+        return vectors
+
+
+class FakeLlama:
+    """
+    Stand-in for llama_cpp.Llama that "generates" at a fixed speed without a model.
+    Prompt evaluation costs 1 / prompt_tokens_per_sec per (whitespace) token, then
+    `answer_tokens` tokens are emitted at `tokens_per_sec`. Sleeping releases the GIL,
+    so several instances in an LLMPool overlap like real llama.cpp threads.
+    """
+
+    def __init__(self, n_threads: int = 1, tokens_per_sec: float = 20.0, prompt_tokens_per_sec: float = 500.0,
+                 answer_tokens: int = 48):
+        self.n_threads = n_threads
+        self.tokens_per_sec = tokens_per_sec
+        self.prompt_tokens_per_sec = prompt_tokens_per_sec
+        self.answer_tokens = answer_tokens
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False):
+        return [zlib.crc32(word) for word in text.split()]
+
+    def _generate(self, prompt: str, max_tokens: int):
+        time.sleep(len(prompt.split()) / self.prompt_tokens_per_sec)
+        for i in range(min(self.answer_tokens, max_tokens or self.answer_tokens)):
+            time.sleep(1.0 / self.tokens_per_sec)
+            yield {"choices": [{"text": f" token{i}"}]}
+
+    def __call__(self, prompt: str, max_tokens: int = 512, stream: bool = False, **kwargs):
+        if stream:
+            return self._generate(prompt, max_tokens)
+        outputs = list(self._generate(prompt, max_tokens))
+        return {
+            "choices": [{"text": "".join(o["choices"][0]["text"] for o in outputs)}],
+            "usage": {"completion_tokens": len(outputs)},
+        }
@@ -0,0 +1,288 @@
+"""
+Load test for the FastAPI service under a mixed chat / stream / upload workload.
+
+By default the app (backend.main:app) is served in-process by uvicorn on a local
+socket, with a fake embedder and a fake LLM generating at a fixed speed, so it
+runs without the GGUF model or any download. Pass --url to drive an already
+running server instead (then the real models are whatever that server loaded).
+
+Reports throughput, latency percentiles, time-to-first-token for /chat/stream,
+rejections (429) and error rates per operation, plus the server's queue and LLM
+stats, as JSON.
+
+Usage:
+    python -m benchmarks.load_test --users 16 --duration 30 --mix chat=5,stream=4,upload=1
+    python -m benchmarks.load_test --llm-instances 2 --llm-tokens-per-sec 15 --output load.json
+"""
+import sys
+import os
+import json
+import time
+import socket
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+import numpy as np
+import httpx
+
+sys.path.append(os.getcwd())
+
+from benchmarks.fakes import HashEmbedder, FakeLlama
+
+CHAT = "chat"
+STREAM = "stream"
+UPLOAD = "upload"
+OPERATIONS = (CHAT, STREAM, UPLOAD)
+
+TOPICS = ["turbine", "gearbox", "hydraulic", "voltage", "filter", "bearing", "coolant", "sensor", "valve", "pump"]
+
+
+def topic_text(rng, topic: str, words: int) -> str:
+    vocab = [f"{topic}{i}" for i in range(30)] + [topic, "maintenance", "inspection", "procedure"]
+    return " ".join(rng.choice(vocab, words))
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{name}' in --mix; expected {OPERATIONS}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_local_server(args, workdir: str) -> str:
+    """Serves backend.main:app in a background thread with fake models; returns its base URL."""
+    import uvicorn
+    import backend.main as main
+    import backend.rag_engine as rag_engine_module
+    from backend.executor import BoundedExecutor
+    from backend.ingestion import DocumentProcessor
+    from backend.llm_pool import LLMPool
+
+    rag_engine_module.SentenceTransformer = lambda *a, **kw: HashEmbedder()
+    engine = rag_engine_module.RAGEngine(models_dir=os.path.join(workdir, "models"), embedding_cache=False)
+    engine.llm = LLMPool(
+        lambda n_threads: FakeLlama(n_threads, tokens_per_sec=args.llm_tokens_per_sec,
+                                    prompt_tokens_per_sec=args.llm_prompt_tokens_per_sec,
+                                    answer_tokens=args.llm_answer_tokens),
+        instances=args.llm_instances,
+        total_threads=args.llm_instances
+    )
+
+    # Seed a corpus so chats retrieve context and reach the LLM
+    rng = np.random.default_rng(args.seed)
+    for d in range(args.seed_docs):
+        topic = TOPICS[d % len(TOPICS)]
+        chunks = [{"text": topic_text(rng, topic, 60), "page": p, "source": f"seed{d}.txt"}
+                  for p in range(1, 41) for _ in range(3)]
+        engine.add_document(f"seed{d}", f"seed{d}.txt", chunks)
+
+    main.rag_engine = engine
+    main.doc_processor = DocumentProcessor(upload_dir=os.path.join(workdir, "uploads"))
+    main.llm_executor = BoundedExecutor(max_workers=args.workers or args.llm_instances, max_queue=args.queue_size)
+    main.register_gauges()
+
+    port = free_port()
+    # The engine is injected above, so the app's own lifespan (which loads real models) stays off
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, lifespan="off",
+                                           log_level="warning", timeout_keep_alive=30))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("Local server did not start")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {op: [] for op in OPERATIONS}
+
+    def add(self, op: str, status: int, latency: float, **extra):
+        self.samples[op].append(dict(status=status, latency=latency, **extra))
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return None
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {"p50": round(float(p50), 1), "p95": round(float(p95), 1), "p99": round(float(p99), 1),
+                "max": round(float(max(values)), 1)}
+
+    def report(self, elapsed: float) -> dict:
+        out = {}
+        for op, samples in self.samples.items():
+            if not samples:
+                continue
+            ok = [s for s in samples if s["status"] in (200, 202) and not s.get("error")]
+            rejected = [s for s in samples if s["status"] == 429]
+            errors = len(samples) - len(ok) - len(rejected)
+            entry = {
+                "requests": len(samples),
+                "ok": len(ok),
+                "rejected_429": len(rejected),
+                "errors": errors,
+                "error_rate": round(errors / len(samples), 4),
+                "throughput_rps": round(len(ok) / elapsed, 2),
+                "latency_ms": self._percentiles([1000 * s["latency"] for s in ok]),
+            }
+            if op == STREAM:
+                entry["ttft_ms"] = self._percentiles([1000 * s["ttft"] for s in ok if s.get("ttft") is not None])
+                tokens = sum(s.get("tokens", 0) for s in ok)
+                entry["tokens_streamed"] = tokens
+                entry["tokens_per_sec"] = round(tokens / elapsed, 1)
+            if op == UPLOAD:
+                entry["indexed_ms"] = self._percentiles([1000 * s["indexed"] for s in ok if s.get("indexed")])
+            out[op] = entry
+        return out
+
+
+def retry_after(response) -> float:
+    # Rejected users back off as a well-behaved client would
+    if response.status_code != 429:
+        return 0.0
+    return float(response.headers.get("Retry-After", 1))
+
+
+async def do_chat(client, rec, rng):
+    t0 = time.perf_counter()
+    topic = TOPICS[rng.integers(len(TOPICS))]
+    r = await client.post("/chat", json={"message": f"{topic} procedure {topic}{rng.integers(30)}"})
+    rec.add(CHAT, r.status_code, time.perf_counter() - t0)
+    return retry_after(r)
+
+
+async def do_stream(client, rec, rng):
+    t0 = time.perf_counter()
+    topic = TOPICS[rng.integers(len(TOPICS))]
+    ttft, tokens, status, error = None, 0, 0, None
+    async with client.stream("POST", "/chat/stream", json={"message": f"{topic} inspection {topic}{rng.integers(30)}"}) as r:
+        status = r.status_code
+        async for line in r.aiter_lines():
+            if line.startswith("data: ") and ('"token"' in line or '"answer"' in line):
+                if ttft is None:
+                    ttft = time.perf_counter() - t0
+                tokens += 1
+                if "timed out" in line:
+                    error = "timeout"
+        rec.add(STREAM, status, time.perf_counter() - t0, ttft=ttft, tokens=tokens, error=error)
+        return retry_after(r)
+
+
+async def do_upload(client, rec, rng, args):
+    t0 = time.perf_counter()
+    topic = TOPICS[rng.integers(len(TOPICS))]
+    text = "\n".join(topic_text(rng, topic, 80) for _ in range(args.upload_paragraphs))
+    r = await client.post("/upload?user_token=admin", files={"file": (f"load_{topic}.txt", text.encode())})
+    accepted = time.perf_counter() - t0
+    indexed, error = None, None
+    if r.status_code == 202 and args.wait_for_index:
+        job_id = r.json()["job_id"]
+        while True:
+            job = (await client.get(f"/jobs/{job_id}?user_token=admin")).json()
+            if job["status"] in ("completed", "failed"):
+                indexed = time.perf_counter() - t0
+                error = job["error"] if job["status"] == "failed" else None
+                break
+            await asyncio.sleep(0.05)
+    rec.add(UPLOAD, r.status_code, accepted, indexed=indexed, error=error)
+    return retry_after(r)
+
+
+async def virtual_user(uid, client, rec, args, weights, stop_at):
+    rng = np.random.default_rng(args.seed + 1000 + uid)
+    ops = list(weights)
+    probs = np.array([weights[o] for o in ops]) / sum(weights.values())
+    while time.perf_counter() < stop_at:
+        op = ops[rng.choice(len(ops), p=probs)]
+        backoff = 0.0
+        try:
+            if op == CHAT:
+                backoff = await do_chat(client, rec, rng)
+            elif op == STREAM:
+                backoff = await do_stream(client, rec, rng)
+            else:
+                backoff = await do_upload(client, rec, rng, args)
+        except httpx.HTTPError as e:
+            rec.add(op, 0, 0.0, error=type(e).__name__)
+        if backoff:
+            await asyncio.sleep(backoff)
+        if args.think_time:
+            await asyncio.sleep(rng.exponential(args.think_time))
+
+
+async def drive(base_url: str, args) -> dict:
+    weights = parse_mix(args.mix)
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+        start = time.perf_counter()
+        stop_at = start + args.duration
+        await asyncio.gather(*(virtual_user(u, client, rec, args, weights, stop_at) for u in range(args.users)))
+        elapsed = time.perf_counter() - start
+        server = (await client.get("/")).json()
+
+    return {
+        "config": {
+            "users": args.users, "duration_s": args.duration, "mix": weights, "url": args.url or "local",
+            "llm_instances": args.llm_instances, "llm_tokens_per_sec": args.llm_tokens_per_sec,
+            "queue_size": args.queue_size,
+        },
+        "elapsed_s": round(elapsed, 2),
+        "operations": rec.report(elapsed),
+        "server": {"chat_queue": server.get("chat_queue"), "llm": server.get("llm")},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mixed-workload load test for the RAG API")
+    parser.add_argument("--url", default=None, help="Drive an existing server instead of a local fake one")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds to generate load")
+    parser.add_argument("--mix", default="chat=5,stream=4,upload=1", help="Operation weights")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a user's requests (s)")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--wait-for-index", type=int, default=1, help="Poll upload jobs until indexed")
+    parser.add_argument("--upload-paragraphs", type=int, default=20)
+    # Local fake server
+    parser.add_argument("--seed-docs", type=int, default=5)
+    parser.add_argument("--llm-instances", type=int, default=1)
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=20.0)
+    parser.add_argument("--llm-prompt-tokens-per-sec", type=float, default=500.0)
+    parser.add_argument("--llm-answer-tokens", type=int, default=48)
+    parser.add_argument("--workers", type=int, default=None, help="Chat executor workers (default: LLM instances)")
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rag_load_")
+    try:
+        # Server logs go to stderr so stdout is only the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            base_url = args.url or start_local_server(args, workdir)
+            report = asyncio.run(drive(base_url, args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+End-to-end retrieval benchmark on a synthetic corpus, fully offline.
+
+Ingests a generated corpus through RAGEngine.add_document with a deterministic
+hash embedder, then reports ingest throughput, on-disk index size, RSS,
+RAGEngine startup time on the persisted store, p50/p95/p99 search latency, and
+recall@k against exhaustive flat search over every chunk vector.
+
+Usage:
+    python -m benchmarks.retrieval --docs 20 --pages-per-doc 200 --queries 300
+    python -m benchmarks.retrieval --docs 50 --top-k-blocks 20 --output run.json
+"""
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+import resource
+import contextlib
+import tempfile
+import numpy as np
+
+sys.path.append(os.getcwd())
+
+import backend.rag_engine as rag_engine_module
+from backend.rag_engine import RAGEngine
+from benchmarks.fakes import HashEmbedder
+
+VOCABULARY_SIZE = 5000
+TOPICS_PER_DOC = 8
+TOPIC_WORDS = 40
+
+
+def make_corpus(args):
+    """Yields (doc_id, doc_name, chunks). Each chunk mixes its doc's topic words with a unique code."""
+    rng = np.random.default_rng(args.seed)
+    vocabulary = [f"w{i}" for i in range(VOCABULARY_SIZE)]
+    for d in range(args.docs):
+        topics = [rng.choice(vocabulary, TOPIC_WORDS, replace=False) for _ in range(TOPICS_PER_DOC)]
+        chunks = []
+        for page in range(1, args.pages_per_doc + 1):
+            for c in range(args.chunks_per_page):
+                topic = topics[rng.integers(TOPICS_PER_DOC)]
+                words = list(rng.choice(topic, args.words_per_chunk - 1)) + [f"code{d}x{page}x{c}"]
+                chunks.append({"text": " ".join(words), "page": page, "source": f"doc{d}.pdf"})
+        yield f"doc{d}", f"doc{d}.pdf", chunks
+
+
+def make_queries(engine: RAGEngine, n: int, seed: int):
+    # A query is a random chunk with a third of its words dropped
+    rng = np.random.default_rng(seed + 1)
+    chunks = list(engine.chunk_store.iter_chunks())
+    queries = []
+    for i in rng.choice(len(chunks), n, replace=len(chunks) < n):
+        words = chunks[i]["text"].split()
+        keep = rng.choice(len(words), max(1, 2 * len(words) // 3), replace=False)
+        queries.append(" ".join(words[j] for j in sorted(keep)))
+    return queries
+
+
+def exact_top_k(engine: RAGEngine, query_vectors: np.ndarray, k: int):
+    """Exhaustive flat search over every stored chunk vector: top-k chunk texts per query."""
+    texts = [c["text"] for c in engine.chunk_store.iter_chunks()]
+    segments = engine.chunk_store.segments + [engine.chunk_store.pending]
+    matrix = np.concatenate([np.asarray(s.vectors, dtype="float32") for s in segments if s.nrows], axis=0)
+    dists = (
+        (query_vectors ** 2).sum(axis=1)[:, None]
+        - 2.0 * query_vectors @ matrix.T
+        + (matrix ** 2).sum(axis=1)[None, :]
+    )
+    top = np.argsort(dists, axis=1)[:, :k]
+    return [[texts[i] for i in row] for row in top]
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return 0.0
+
+
+def percentiles(samples_ms):
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3), "p99": round(float(p99), 3),
+            "mean": round(float(np.mean(samples_ms)), 3)}
+
+
+def engine_kwargs(args, models_dir: str) -> dict:
+    return {
+        "models_dir": models_dir,
+        "block_index_type": args.block_index,
+        "chunk_quantization": args.chunk_quantization,
+        "hybrid_search": args.hybrid == 1,
+        "embedding_cache": False,
+    }
+
+
+def run(args) -> dict:
+    rag_engine_module.SentenceTransformer = lambda *a, **kw: HashEmbedder()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag_bench_")
+    models_dir = os.path.join(workdir, "models")
+    shutil.rmtree(models_dir, ignore_errors=True)
+
+    try:
+        # --- Ingest ---
+        engine = RAGEngine(**engine_kwargs(args, models_dir))
+        n_chunks = n_pages = 0
+        start = time.perf_counter()
+        for doc_id, doc_name, chunks in make_corpus(args):
+            engine.add_document(doc_id, doc_name, chunks)
+            n_chunks += len(chunks)
+            n_pages += args.pages_per_doc
+        engine.save_index(final=True)
+        engine.chunk_store.wait_for_compaction()
+        ingest_seconds = time.perf_counter() - start
+        del engine
+
+        # --- Startup on the persisted store ---
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        engine = RAGEngine(**engine_kwargs(args, models_dir))
+        startup_seconds = time.perf_counter() - start
+        rss_after = current_rss_mb()
+
+        # --- Latency (query embedding excluded: it is cached before timing) ---
+        queries = make_queries(engine, args.queries, args.seed)
+        query_vectors = engine._encode_queries(queries)
+        for q in queries[:min(20, len(queries))]:
+            engine.search(q, top_k_blocks=args.top_k_blocks, top_k_chunks=args.k)  # warm chunk indexes
+        latencies = []
+        for q in queries:
+            engine.search_cache.clear()
+            t0 = time.perf_counter()
+            engine.search(q, top_k_blocks=args.top_k_blocks, top_k_chunks=args.k)
+            latencies.append(1000 * (time.perf_counter() - t0))
+
+        # --- Recall@k vs exhaustive flat (threshold and adaptive margin disabled) ---
+        engine.search_cache.clear()
+        engine.score_margin = 1e9
+        found = engine.search_batch(queries, top_k_blocks=args.top_k_blocks, top_k_chunks=args.k, score_threshold=1e9)
+        truth = exact_top_k(engine, query_vectors, args.k)
+        hits = sum(len({c["text"] for c in f} & set(t)) for f, t in zip(found, truth))
+
+        return {
+            "config": {
+                "docs": args.docs, "pages": n_pages, "chunks": n_chunks,
+                "blocks": len(engine.block_metadata), "queries": len(queries), "k": args.k,
+                "top_k_blocks": args.top_k_blocks, "block_index": engine.block_index_type,
+                "chunk_quantization": engine.chunk_quantization,
+                "hybrid": engine.hybrid_search, "seed": args.seed,
+            },
+            "ingest": {
+                "seconds": round(ingest_seconds, 3),
+                "chunks_per_sec": round(n_chunks / ingest_seconds, 1),
+                "pages_per_sec": round(n_pages / ingest_seconds, 1),
+            },
+            "index_size_mb": {
+                "store": round(dir_size(engine.chunk_store.store_dir) / (1024 * 1024), 3),
+                "total": round(dir_size(models_dir) / (1024 * 1024), 3),
+            },
+            "memory_mb": {
+                "rss_after_startup": round(rss_after, 1),
+                "startup_delta": round(rss_after - rss_before, 1),
+                "peak_rss": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            },
+            "startup_seconds": round(startup_seconds, 3),
+            "search_latency_ms": percentiles(latencies),
+            "recall_at_k": round(hits / float(args.k * len(queries)), 4),
+        }
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic-corpus retrieval benchmark (offline)")
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--pages-per-doc", type=int, default=100)
+    parser.add_argument("--chunks-per-page", type=int, default=4)
+    parser.add_argument("--words-per-chunk", type=int, default=60)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--top-k-blocks", type=int, default=3)
+    parser.add_argument("--block-index", default="flat")
+    parser.add_argument("--chunk-quantization", default="none")
+    parser.add_argument("--hybrid", type=int, default=0, help="1 to fuse BM25 results (lowers recall vs dense flat by design)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="Keep the store here instead of a temp dir")
+    parser.add_argument("--keep", action="store_true", help="Do not delete the temp store")
+    parser.add_argument("--output", default=None, help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Engine progress logs go to stderr so stdout is only the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
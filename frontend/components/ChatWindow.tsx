@@ -12,6 +12,7 @@ interface Message {
     role: 'user' | 'assistant';
     content: string;
     citations?: Citation[];
+    status?: string;
 }
 
 export default function ChatWindow() {
@@ -44,6 +45,15 @@ export default function ChatWindow() {
                 body: JSON.stringify({ message: userMsg }),
             });
 
+            if (res.status === 429) {
+                // Every generation worker is busy and the wait queue is full
+                setMessages(prev => {
+                    const newMsg = [...prev];
+                    newMsg[newMsg.length - 1].content = "Server is busy. Please try again in a moment.";
+                    return newMsg;
+                });
+                return;
+            }
             if (!res.body) throw new Error("No body");
 
             const reader = res.body.getReader();
@@ -62,7 +72,18 @@ export default function ChatWindow() {
                 buffer = lines.pop() || ''; // Keep incomplete line in buffer
 
                 for (const line of lines) {
-                    if (line.trim().startsWith('event: citations')) {
+                    if (line.trim().startsWith('event: queued')) {
+                        // Waiting for a generation worker; replaced by the first token
+                        const dataLine = line.split('\n')[1];
+                        if (dataLine && dataLine.startsWith('data: ')) {
+                            const { position } = JSON.parse(dataLine.replace('data: ', ''));
+                            setMessages(prev => {
+                                const newMsg = [...prev];
+                                newMsg[newMsg.length - 1].status = `Queued (position ${position})...`;
+                                return newMsg;
+                            });
+                        }
+                    } else if (line.trim().startsWith('event: citations')) {
                         // Handle metadata event
                         // Format: "event: citations\ndata: [...]"
                         const dataLine = line.split('\n')[1]; // get data: line
@@ -137,7 +158,7 @@ export default function ChatWindow() {
                             ? 'bg-indigo-600 text-white border-transparent rounded-br-none'
                             : 'bg-slate-900 border-slate-800 text-slate-200 rounded-bl-none shadow-lg'
                             }`}>
-                            <p className="leading-relaxed whitespace-pre-wrap">{msg.content}</p>
+                            <p className="leading-relaxed whitespace-pre-wrap">{msg.content || msg.status}</p>
 
                             {msg.citations && msg.citations.length > 0 && (
                                 <div className="mt-4 pt-4 border-t border-slate-800">
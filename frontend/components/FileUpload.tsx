@@ -1,10 +1,14 @@
 "use client";
 import React, { useState, useRef, useEffect } from 'react';
 
+// Large PDFs can index for a long time; stop polling (and report it) after this
+const JOB_POLL_TIMEOUT_MS = 30 * 60 * 1000;
+
 export default function FileUpload() {
     const [isDragging, setIsDragging] = useState(false);
     const [uploading, setUploading] = useState(false);
     const [status, setStatus] = useState<string | null>(null);
+    const [isError, setIsError] = useState(false);
     const [isAdmin, setIsAdmin] = useState(false);
     const [token, setToken] = useState<string | null>(null);
     const fileInputRef = useRef<HTMLInputElement>(null);
@@ -26,10 +30,16 @@ export default function FileUpload() {
         setIsDragging(false);
     };
 
+    const showError = (message: string) => {
+        setIsError(true);
+        setStatus(message);
+    };
+
     const uploadFile = async (file: File) => {
         if (!isAdmin || !token) return;
         setUploading(true);
         setStatus(null);
+        setIsError(false);
         const formData = new FormData();
         formData.append('file', file);
 
@@ -40,14 +50,40 @@ export default function FileUpload() {
                 body: formData,
             });
             if (res.ok) {
-                setStatus(`Success`);
+                // Indexing runs in the background; poll the job until it finishes
+                const job = await res.json();
+                setStatus('Indexing...');
+                let current = job;
+                const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+                while (current.status !== 'completed') {
+                    if (current.status === 'failed') {
+                        showError(`Indexing failed: ${current.error}`);
+                        return;
+                    }
+                    if (Date.now() > deadline) {
+                        showError('Indexing is taking too long; check the document list later');
+                        return;
+                    }
+                    await new Promise((resolve) => setTimeout(resolve, 1000));
+                    const jobRes = await fetch(`http://127.0.0.1:8000/jobs/${job.job_id}?user_token=${token}`);
+                    if (!jobRes.ok) {
+                        // e.g. 404 once the server restarted and forgot the job
+                        showError(`Indexing status unavailable: ${jobRes.status} ${jobRes.statusText}`);
+                        return;
+                    }
+                    current = await jobRes.json();
+                    if (current.status === 'indexing') {
+                        setStatus(`Indexing ${current.chunks_embedded}/${current.chunks_total} chunks`);
+                    }
+                }
+                setStatus('Success');
                 setTimeout(() => setStatus(null), 3000);
             } else {
-                setStatus('Upload failed: ' + res.statusText);
+                showError('Upload failed: ' + res.statusText);
             }
         } catch (error) {
             console.error(error);
-            setStatus('Connection Failed');
+            showError('Connection Failed');
         } finally {
             setUploading(false);
         }
@@ -115,7 +151,7 @@ export default function FileUpload() {
             <p className="text-xs text-slate-500 mt-1">or drag & drop PDF</p>
 
             {status && (
-                <span className="absolute inset-x-0 bottom-2 text-xs font-bold text-green-400">
+                <span className={`absolute inset-x-0 bottom-2 text-xs font-bold ${isError ? 'text-red-400' : 'text-green-400'}`}>
                     {status}
                 </span>
             )}
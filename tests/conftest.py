@@ -0,0 +1,65 @@
+import pytest
+
+import backend.rag_engine as rag_engine_module
+from backend.rag_engine import RAGEngine
+from benchmarks.fakes import HashEmbedder
+
+
+@pytest.fixture
+def make_engine(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_engine_module, "SentenceTransformer", lambda *args, **kwargs: HashEmbedder())
+
+    engines = []
+
+    def _make(**kwargs):
+        kwargs.setdefault("models_dir", str(tmp_path / "models"))
+        # Like a server restart: the previous engine's background compaction / purge
+        # finishes before another engine opens the same directory
+        for engine in engines:
+            engine.chunk_store.wait_for_compaction()
+            engine.wait_for_purge()
+        engines.append(RAGEngine(**kwargs))
+        return engines[-1]
+
+    return _make
+
+
+def write_pdf(path, texts):
+    """Writes a minimal PDF with one line of text per page."""
+    n = len(texts)
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(n))
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {n} >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(texts):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for off in offsets:
+        out += f"{off:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    def _make(texts, name="doc.pdf"):
+        path = tmp_path / name
+        write_pdf(path, texts)
+        return str(path)
+
+    return _make
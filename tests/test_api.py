@@ -0,0 +1,280 @@
+import time
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.main as main
+from backend.ingestion import DocumentProcessor
+
+
+@pytest.fixture
+def api(make_engine, tmp_path, monkeypatch):
+    engine = make_engine()
+    monkeypatch.setattr(main, "rag_engine", engine)
+    monkeypatch.setattr(main, "doc_processor", DocumentProcessor(upload_dir=str(tmp_path / "uploads")))
+    return TestClient(main.app), engine
+
+
+def wait_for_job(client, job_id, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/jobs/{job_id}?user_token=admin").json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_upload_returns_job_and_indexes_in_background(api):
+    client, engine = api
+    text = " ".join(f"word{i}" for i in range(400))
+    response = client.post("/upload?user_token=admin", files={"file": ("notes.txt", text.encode())})
+
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] in ("queued", "extracting", "indexing", "completed")
+
+    job = wait_for_job(client, job["job_id"])
+    assert job["status"] == "completed", job["error"]
+    assert job["pages_extracted"] == 1
+    assert job["chunks_total"] == job["chunks_embedded"] > 0
+    assert job["blocks_indexed"] == 1
+
+    docs = client.get("/documents").json()
+    assert [d["name"] for d in docs] == ["notes.txt"]
+
+
+def test_failed_ingestion_is_reported(api):
+    client, _ = api
+    response = client.post("/upload?user_token=admin", files={"file": ("broken.pdf", b"not a pdf")})
+    job = wait_for_job(client, response.json()["job_id"])
+    assert job["status"] == "failed"
+    assert job["error"]
+
+
+def test_job_status_requires_admin_and_known_id(api):
+    client, _ = api
+    assert client.get("/jobs/unknown?user_token=user").status_code == 403
+    assert client.get("/jobs/unknown?user_token=admin").status_code == 404
+
+
+@pytest.fixture
+def chat_api(api, monkeypatch):
+    client, engine = api
+    executor = main.BoundedExecutor(max_workers=1, max_queue=0)
+    monkeypatch.setattr(main, "llm_executor", executor)
+    yield client, engine
+    executor.shutdown(wait=False)
+
+
+def test_full_chat_queue_returns_429(chat_api, monkeypatch):
+    client, engine = chat_api
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_answer(query):
+        started.set()
+        release.wait(5)
+        return {"answer": "done", "citations": []}
+
+    monkeypatch.setattr(engine, "generate_answer", slow_answer)
+    first = {}
+    worker = threading.Thread(target=lambda: first.update(r=client.post("/chat", json={"message": "q"})))
+    worker.start()
+    assert started.wait(5)
+
+    # Health checks stay responsive while the only worker is generating
+    assert client.get("/").json()["chat_queue"]["in_flight"] == 1
+    busy = client.post("/chat", json={"message": "q"})
+    assert busy.status_code == 429
+    assert "Retry-After" in busy.headers
+    assert client.post("/chat/stream", json={"message": "q"}).status_code == 429
+
+    release.set()
+    worker.join(5)
+    assert first["r"].status_code == 200
+    assert first["r"].json()["answer"] == "done"
+
+
+def test_chat_timeout_returns_504(chat_api, monkeypatch):
+    client, engine = chat_api
+    monkeypatch.setattr(main.config, "LLM_TIMEOUT", 0.1)
+    monkeypatch.setattr(engine, "generate_answer", lambda query: time.sleep(1))
+    assert client.post("/chat", json={"message": "q"}).status_code == 504
+
+
+def test_stream_stops_generation_when_consumer_leaves():
+    executor = main.BoundedExecutor(max_workers=1, max_queue=0)
+    closed = threading.Event()
+
+    def tokens():
+        try:
+            while True:
+                time.sleep(0.01)
+                yield "token"
+        finally:
+            closed.set()
+
+    async def consume():
+        events = executor.stream(tokens, timeout=5)
+        received = []
+        async for event in events:
+            received.append(event)
+            if len(received) == 3:
+                break
+        await events.aclose()
+        return received
+
+    assert asyncio.run(consume()) == ["token"] * 3
+    assert closed.wait(5)
+    deadline = time.time() + 5
+    while executor.in_flight and time.time() < deadline:
+        time.sleep(0.01)
+    assert executor.in_flight == 0
+    executor.shutdown()
+
+
+
+def test_chat_stream_relays_engine_events(chat_api, monkeypatch):
+    client, engine = chat_api
+
+    def fake_stream(query):
+        yield 'event: citations\ndata: []\n\n'
+        for token in ("Hello", " world"):
+            yield f'data: {{"token": "{token}"}}\n\n'
+
+    monkeypatch.setattr(engine, "generate_answer_stream", fake_stream)
+    response = client.post("/chat/stream", json={"message": "q"})
+    assert response.status_code == 200
+    assert response.text == 'event: citations\ndata: []\n\ndata: {"token": "Hello"}\n\ndata: {"token": " world"}\n\n'
+
+
+def test_deferred_loading_reports_readiness_separately(make_engine, tmp_path, monkeypatch):
+    engine = make_engine(defer_loading=True)
+    monkeypatch.setattr(main, "rag_engine", engine)
+    monkeypatch.setattr(main, "doc_processor", DocumentProcessor(upload_dir=str(tmp_path / "uploads")))
+    client = TestClient(main.app)
+
+    # Live but not ready: chat is refused, uploads are accepted and wait for the engine
+    health = client.get("/").json()
+    assert health["status"] == "ok"
+    assert health["ready"] is False
+    assert health["startup"]["state"] == "loading"
+    assert client.get("/ready").status_code == 503
+    assert client.post("/chat", json={"message": "q"}).status_code == 503
+    job = client.post("/upload?user_token=admin", files={"file": ("notes.txt", b"alpha beta gamma " * 50)}).json()
+
+    engine.load_in_background().join(10)
+    assert client.get("/ready").status_code == 200
+    startup = client.get("/").json()["startup"]
+    assert startup["state"] == "ready"
+    assert {"indexes", "embedding_model", "llm", "total"} <= set(startup["timings_s"])
+    assert wait_for_job(client, job["job_id"])["status"] == "completed"
+
+
+def test_queued_uploads_with_the_same_name_keep_their_own_file(make_engine, tmp_path, monkeypatch):
+    engine = make_engine(defer_loading=True)
+    uploads = tmp_path / "uploads"
+    monkeypatch.setattr(main, "rag_engine", engine)
+    monkeypatch.setattr(main, "doc_processor", DocumentProcessor(upload_dir=str(uploads)))
+    client = TestClient(main.app)
+
+    # Both jobs wait for the engine, so the second upload lands before the first is read
+    first = client.post("/upload?user_token=admin", files={"file": ("notes.txt", b"alpha turbine notes " * 50)}).json()
+    second = client.post("/upload?user_token=admin", files={"file": ("notes.txt", b"beta gearbox notes " * 50)}).json()
+    engine.load_in_background().join(10)
+    for job in (first, second):
+        assert wait_for_job(client, job["job_id"])["status"] == "completed"
+
+    assert engine.search("alpha turbine notes")[0]["document_name"] == "notes.txt"
+    assert "alpha" in engine.search("alpha turbine notes")[0]["text"]
+    assert "beta" in engine.search("beta gearbox notes")[0]["text"]
+    assert list(uploads.iterdir()) == []  # each job removes its copy
+
+
+def test_metrics_are_served_while_models_load(make_engine, monkeypatch):
+    monkeypatch.setattr(main, "rag_engine", make_engine(defer_loading=True))
+    main.register_gauges()
+    response = TestClient(main.app).get("/metrics")
+    assert response.status_code == 200
+    assert "rag_llm_busy_instances 0" in response.text
+    assert "rag_index_blocks 0" in response.text
+
+
+def test_failed_loading_is_reported(make_engine, monkeypatch):
+    engine = make_engine(defer_loading=True)
+
+    def broken():
+        raise OSError("model missing")
+
+    monkeypatch.setattr(engine, "_load_embedding_model", broken)
+    engine.load_in_background().join(10)
+    status = engine.startup_status()
+    assert status["state"] == "failed"
+    assert "model missing" in status["error"]
+    with pytest.raises(RuntimeError):
+        engine.wait_until_ready()
+
+
+def test_chat_reports_timings_and_metrics_endpoint(api):
+    client, engine = api
+    main.register_gauges()
+    text = " ".join(f"turbine{i % 7} maintenance procedure" for i in range(200))
+    job = client.post("/upload?user_token=admin", files={"file": ("manual.txt", text.encode())}).json()
+    assert wait_for_job(client, job["job_id"])["status"] == "completed"
+
+    response = client.post("/chat", json={"message": "turbine3 maintenance procedure"}).json()
+    assert {"query_embedding", "block_search", "chunk_search", "prompt_build"} <= set(response["timings"])
+
+    body = client.get("/metrics").text
+    assert 'rag_stage_seconds_count{stage="chunk_search"}' in body
+    assert 'rag_ingest_stage_seconds_count{stage="document"}' in body
+    assert 'rag_chat_requests_total{endpoint="chat",outcome="ok"}' in body
+    assert f"rag_index_blocks {engine.block_index.ntotal}" in body
+    assert f"rag_index_chunks {engine.chunk_store.ntotal}" in body
+
+
+def test_delete_and_replace_document(api):
+    client, engine = api
+    engine.purge_deleted_fraction = 1.0  # purge only on request
+    job = client.post("/upload?user_token=admin", files={"file": ("v1.txt", b"alpha turbine notes " * 100)}).json()
+    assert wait_for_job(client, job["job_id"])["status"] == "completed"
+    doc_id = client.get("/documents").json()[0]["id"]
+
+    assert client.delete(f"/documents/{doc_id}?user_token=user").status_code == 403
+    assert client.delete("/documents/unknown?user_token=admin").status_code == 404
+
+    # Replacing indexes the new file under a new id, then removes the old one
+    replace = client.put(f"/documents/{doc_id}?user_token=admin", files={"file": ("v2.txt", b"beta gearbox notes " * 100)})
+    assert replace.status_code == 202 and replace.json()["replaces"] == doc_id
+    assert wait_for_job(client, replace.json()["job_id"])["status"] == "completed"
+    docs = client.get("/documents").json()
+    assert [d["name"] for d in docs] == ["v2.txt"]
+
+    # A replacement without any text fails and keeps the current version
+    blank = client.put(f"/documents/{docs[0]['id']}?user_token=admin", files={"file": ("v3.txt", b"   \n")})
+    job = wait_for_job(client, blank.json()["job_id"])
+    assert job["status"] == "failed" and "previous version was kept" in job["error"]
+    assert client.get("/documents").json() == docs
+
+    deleted = client.delete(f"/documents/{docs[0]['id']}?user_token=admin")
+    assert deleted.status_code == 200 and deleted.json()["blocks_deleted"] == 1
+    assert client.get("/documents").json() == []
+    assert client.post("/admin/purge?user_token=admin").json()["blocks_purged"] == 2
+
+
+def test_replace_reports_a_failed_save(api, monkeypatch):
+    client, _ = api
+    job = client.post("/upload?user_token=admin", files={"file": ("v1.txt", b"alpha turbine notes " * 100)}).json()
+    assert wait_for_job(client, job["job_id"])["status"] == "completed"
+    doc_id = client.get("/documents").json()[0]["id"]
+
+    async def disk_full(file):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(main.doc_processor, "save_file", disk_full)
+    response = client.put(f"/documents/{doc_id}?user_token=admin", files={"file": ("v2.txt", b"beta")})
+    assert response.status_code == 500
+    assert response.json()["detail"] == "No space left on device"
@@ -80,8 +80,8 @@ def test_rag_hierarchical_logic():
     engine.add_document("doc1", "test_doc.pdf", chunks)
     
     assert engine.block_index.ntotal == 1
-    assert "doc1" in engine.chunk_indexes
-    assert engine.chunk_indexes["doc1"].ntotal == 10
+    assert "doc1_block_0" in engine.chunk_indexes
+    assert engine.chunk_indexes["doc1_block_0"].ntotal == 10
     
     # Search
     results = engine.search("query")
@@ -0,0 +1,56 @@
+import threading
+
+from backend import bulk_ingest
+
+
+def write_corpus(directory, n=5):
+    directory.mkdir()
+    for i in range(n):
+        (directory / f"manual_{i}.txt").write_text(f"maintenance manual {i} for pump model p{i} " * 40)
+    (directory / "empty.txt").write_text("")
+    (directory / "notes.md").write_text("not a supported type")
+    return directory
+
+
+def test_bulk_ingest_checkpoints_and_resumes(make_engine, make_pdf, tmp_path):
+    corpus = write_corpus(tmp_path / "docs")
+    make_pdf([f"Turbine page {i}" for i in range(1, 26)], name="docs/turbine.pdf")
+    engine = make_engine()
+    saves = []
+    save_index = engine.save_index
+    engine.save_index = lambda final=False: saves.append(final) or save_index(final)
+
+    paths = bulk_ingest.discover(str(corpus))
+    assert len(paths) == 7
+    report = bulk_ingest.ingest(engine, paths, workers=2, embed_batch_size=16, checkpoint_every=3, report_every=0)
+
+    assert report["indexed"] == 6 and report["empty"] == 1 and report["failed"] == []
+    assert report["blocks"] == 7  # the 25-page PDF spans two blocks
+    # One save per checkpoint, not one per block
+    assert len(saves) == report["checkpoints"] == 2
+    assert {d["name"] for d in engine.list_documents()} >= {"turbine.pdf", "manual_3.txt"}
+    assert engine.search("Turbine page 22")[0]["page"] == 22
+
+    # A restarted run finds everything already indexed
+    reloaded = make_engine(models_dir=engine.models_dir)
+    again = bulk_ingest.ingest(reloaded, paths, workers=1, report_every=0)
+    assert again["skipped"] == 6 and again["indexed"] == 0
+    assert len(reloaded.list_documents()) == 6
+
+
+def test_interrupted_run_saves_progress_and_resumes(make_engine, tmp_path):
+    corpus = write_corpus(tmp_path / "docs")
+    manifest = tmp_path / "files.txt"
+    manifest.write_text("# pumps\n" + "\n".join(f"docs/manual_{i}.txt" for i in range(5)) + "\ndocs/missing.txt\n")
+    paths = bulk_ingest.read_manifest(str(manifest))
+
+    stop = threading.Event()
+    stop.set()  # as if Ctrl-C arrived during the first document
+    engine = make_engine()
+    first = bulk_ingest.ingest(engine, paths, workers=1, checkpoint_every=100, report_every=0, stop=stop)
+    assert first["interrupted"] and first["indexed"] == 1 and first["checkpoints"] == 1
+    assert [f["path"] for f in first["failed"]] == [str(corpus / "missing.txt")]
+
+    resumed = bulk_ingest.ingest(make_engine(models_dir=engine.models_dir), paths, workers=1, report_every=0)
+    assert resumed["skipped"] == 1 and resumed["indexed"] == 4
+    assert not resumed["interrupted"]
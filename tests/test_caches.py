@@ -0,0 +1,128 @@
+import numpy as np
+
+
+def make_chunks(doc_name, pages, per_page=3):
+    return [
+        {"text": f"{doc_name} page {p} section {i}", "page": p, "source": doc_name}
+        for p in pages for i in range(per_page)
+    ]
+
+
+def count_encodes(engine):
+    calls = []
+    encode = engine.embedding_model.encode
+    engine.embedding_model.encode = lambda texts, **kw: calls.append(len(texts)) or encode(texts, **kw)
+    return calls
+
+
+def test_reingest_only_embeds_changed_chunks(make_engine, capsys):
+    engine = make_engine()
+    calls = count_encodes(engine)
+    engine.add_document("v1", "manual.pdf", make_chunks("manual", range(1, 11)))
+    assert calls == [30]
+
+    # Revised manual: same first 9 pages, rewritten page 10, plus whitespace noise
+    revised = make_chunks("manual", range(1, 10))
+    revised[0]["text"] = "  manual   page 1 section 0 "
+    revised += [{"text": f"manual page 10 revised {i}", "page": 10, "source": "manual"} for i in range(3)]
+
+    reloaded = make_engine()
+    reloaded.embed_batch_size = 8
+    calls = count_encodes(reloaded)
+    reloaded.add_document("v2", "manual.pdf", revised)
+
+    assert sum(calls) == 3
+    stats = reloaded.embedding_cache_stats()
+    assert stats["hits"] == 27 and stats["misses"] == 3
+    assert stats["entries"] == 33
+    # One cache report per document, not one per embedding micro-batch
+    out = capsys.readouterr().out
+    assert out.count("Embedding cache:") == 2
+    assert "27/30 chunks reused for manual.pdf" in out
+
+
+def test_embedding_cache_can_be_disabled(make_engine):
+    engine = make_engine(embedding_cache=False)
+    calls = count_encodes(engine)
+    engine.add_document("a", "a.pdf", make_chunks("a", [1]))
+    engine.add_document("b", "b.pdf", make_chunks("a", [1]))
+    assert calls == [3, 3]
+    assert engine.embedding_cache_stats() == {}
+
+
+def test_repeated_queries_hit_caches_until_index_changes(make_engine):
+    engine = make_engine(hybrid_search=False)  # dense results only, so counts are exact
+    engine.add_document("a", "a.pdf", make_chunks("alpha", range(1, 11)))
+    calls = count_encodes(engine)
+
+    first = engine.search("alpha page 4 section 1")
+    first[0]["text"] = "mutated by caller"
+    again = engine.search("alpha page 4 section 1")
+    assert calls == [1]
+    assert again[0]["text"] == "alpha page 4 section 1"
+    assert engine.query_cache_stats()["search_results"]["hits"] == 1
+
+    engine.add_document("b", "b.pdf", make_chunks("alpha", range(4, 5)))
+    calls.clear()
+    results = engine.search("alpha page 4 section 1")
+    assert calls == []  # query embedding is still cached; the search itself re-ran
+    assert len(results) == 2
+    assert engine.query_cache_stats()["search_results"]["misses"] == 2
+
+
+def test_lru_cache_ttl_expires_entries(monkeypatch):
+    from backend import cache
+
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    lru = cache.LRUCache(max_items=10, ttl=5)
+    lru.put("q", 1)
+    assert lru.get("q") == 1
+    now[0] += 6
+    assert lru.get("q") is None
+    assert len(lru) == 0
+
+
+def test_embedding_cache_deletes_the_oldest_rows_past_its_cap(tmp_path):
+    from backend.cache import EmbeddingCache
+
+    dimension = 4
+    row_bytes = dimension * 4 + EmbeddingCache.ROW_OVERHEAD
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite"), dimension, max_bytes=10 * row_bytes)
+    for i in range(25):
+        cache.put_many({f"k{i}": np.full(dimension, i, dtype="float32")})
+    assert len(cache) <= 10
+    assert cache.get_many(["k0", "k5"]) == {}
+    assert cache.get_many(["k24"])["k24"][0] == 24
+    assert cache.stats()["evictions"] == 25 - len(cache)
+
+    # The cap holds across restarts too
+    cache.close()
+    reopened = EmbeddingCache(str(tmp_path / "emb.sqlite"), dimension, max_bytes=5 * row_bytes)
+    reopened.put_many({"new": np.zeros(dimension, dtype="float32")})
+    assert len(reopened) <= 5 and "new" in reopened.get_many(["new"])
+
+
+def test_semantic_cache_reuses_answers_for_near_duplicate_questions(make_engine):
+    from backend.cache import SemanticCache
+
+    engine = make_engine()
+    engine.add_document("a", "a.pdf", make_chunks("alpha", range(1, 11)))
+    engine.semantic_cache = SemanticCache(max_distance=0.3)
+
+    prompts = []
+    engine.llm = lambda prompt, **kw: prompts.append(prompt) or {"choices": [{"text": "Section one."}]}
+
+    first = engine.generate_answer("alpha page 4 section 1")
+    second = engine.generate_answer("alpha  page 4 section 1 please")  # close, not identical
+    assert len(prompts) == 1
+    assert second["answer"] == first["answer"] == "Section one."
+    assert second["citations"][0]["page_number"] == 4
+
+    events = list(engine.generate_answer_stream("alpha page 4 section 1"))
+    assert len(prompts) == 1
+    assert events[-1] == 'data: {"token": "Section one."}\n\n'
+
+    engine.add_document("b", "b.pdf", make_chunks("beta", range(1, 3)))
+    engine.generate_answer("alpha page 4 section 1")
+    assert len(prompts) == 2
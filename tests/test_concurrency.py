@@ -0,0 +1,73 @@
+import random
+import threading
+
+from backend.concurrency import ReadWriteLock
+
+
+def make_chunks(doc_name, pages):
+    return [{"text": f"{doc_name} page {p} note", "page": p, "source": doc_name} for p in pages]
+
+
+def test_searches_run_consistently_during_ingestion(make_engine):
+    engine = make_engine()
+    engine.add_document("seed", "seed.pdf", make_chunks("seed", range(1, 41)))
+
+    errors = []
+    stop = threading.Event()
+
+    def searcher(seed):
+        rng = random.Random(seed)
+        try:
+            while not stop.is_set():
+                page = rng.randint(1, 40)
+                queries = [f"seed page {page} note", f"doc{rng.randint(0, 9)} page {page} note"]
+                for results in engine.search_batch(queries, top_k_blocks=4):
+                    for r in results:
+                        # Every hit must be internally consistent: text, page and source agree
+                        assert r["text"] == f"{r['document_name']} page {r['page']} note"
+        except Exception as e:  # pragma: no cover - surfaced below
+            errors.append(e)
+
+    def writer(doc_ids):
+        try:
+            for i in doc_ids:
+                engine.add_document(f"doc{i}", f"doc{i}.pdf", make_chunks(f"doc{i}", range(1, 61)))
+        except Exception as e:  # pragma: no cover - surfaced below
+            errors.append(e)
+
+    searchers = [threading.Thread(target=searcher, args=(i,)) for i in range(6)]
+    writers = [threading.Thread(target=writer, args=(ids,)) for ids in ([0, 2, 4, 6, 8], [1, 3, 5, 7, 9])]
+    for t in searchers + writers:
+        t.start()
+    for t in writers:
+        t.join()
+    stop.set()
+    for t in searchers:
+        t.join()
+
+    assert not errors, errors
+    assert engine.block_index.ntotal == 2 + 10 * 3
+    assert len(engine.block_metadata) == engine.block_index.ntotal
+    assert engine.chunk_store.ntotal == 40 + 10 * 60
+    assert engine.search("doc7 page 44 note")[0]["document_name"] == "doc7"
+
+    reloaded = make_engine()
+    assert [b["block_id"] for b in reloaded.block_metadata] == [b["block_id"] for b in engine.block_metadata]
+
+
+def test_read_write_lock_prefers_waiting_writer():
+    lock = ReadWriteLock()
+    order = []
+    lock.acquire_read()
+
+    writer = threading.Thread(target=lambda: (lock.acquire_write(), order.append("writer"), lock.release_write()))
+    writer.start()
+    while not lock._writers_waiting:
+        pass
+
+    reader = threading.Thread(target=lambda: (lock.acquire_read(), order.append("reader"), lock.release_read()))
+    reader.start()
+    lock.release_read()
+    writer.join()
+    reader.join()
+    assert order == ["writer", "reader"]
@@ -0,0 +1,168 @@
+import os
+import threading
+
+import backend.rag_engine as rag_engine_module
+
+
+def doc_chunks(name, word, pages=25):
+    # Two blocks per document (pages 1-20 and 21-25)
+    return [{"text": f"{word} procedure step {p} for {word} systems", "page": p, "source": name}
+            for p in range(1, pages + 1)]
+
+
+def load_corpus(engine):
+    engine.purge_deleted_fraction = 1.0  # purge only when a test asks for it
+    engine.add_document("doc_a", "a.pdf", doc_chunks("a.pdf", "turbine"))
+    engine.add_document("doc_b", "b.pdf", doc_chunks("b.pdf", "gearbox"))
+    engine.add_document("doc_c", "c.pdf", doc_chunks("c.pdf", "turbine"))
+    engine.save_index(final=True)
+
+
+def sources(results):
+    return {r["document_name"] for r in results}
+
+
+def test_delete_hides_document_without_rewriting_segments(make_engine):
+    engine = make_engine(hybrid_search=True)
+    load_corpus(engine)
+    segment_files = sorted(os.listdir(engine.chunk_store.store_dir))
+
+    result = engine.delete_document("doc_a")
+    assert result == {"doc_id": "doc_a", "blocks_deleted": 2, "chunks_deleted": 25}
+    assert engine.delete_document("doc_a") is None
+    assert {d["id"] for d in engine.list_documents()} == {"doc_b", "doc_c"}
+
+    # Only the manifest changed; the deleted rows wait for a purge
+    assert sorted(os.listdir(engine.chunk_store.store_dir)) == segment_files
+    assert "a.pdf" not in sources(engine.search("turbine procedure step", top_k_chunks=10))
+    assert "c.pdf" in sources(engine.search("turbine procedure step", top_k_chunks=10))
+    assert all(row >= 25 for row, _, _ in engine.lexical_index.search("turbine", k=100))
+
+
+def test_routing_skips_deleted_blocks(make_engine):
+    engine = make_engine(hybrid_search=False)
+    load_corpus(engine)
+    engine.delete_document("doc_a")
+    # The best-matching block belongs to the deleted document; the next live one is routed instead
+    requested = []
+    search = engine.block_index.search
+    engine.block_index.search = lambda x, k, **kw: requested.append(k) or search(x, k, **kw)
+    results = engine.search("turbine procedure step 3 for turbine systems", top_k_blocks=1)
+    assert sources(results) == {"c.pdf"}
+    assert requested == [1]  # deleted blocks are excluded inside FAISS, not over-fetched
+
+
+def test_deletion_survives_restart(make_engine):
+    engine = make_engine(hybrid_search=True)
+    load_corpus(engine)
+    engine.delete_document("doc_c")  # after the last BM25 save
+
+    reloaded = make_engine(models_dir=engine.models_dir, hybrid_search=True)
+    assert {d["id"] for d in reloaded.list_documents()} == {"doc_a", "doc_b"}
+    assert "c.pdf" not in sources(reloaded.search("turbine procedure step", top_k_chunks=10))
+    assert all(row < 50 for row, _, _ in reloaded.lexical_index.search("turbine", k=100))
+
+
+def test_purge_renumbers_rows_and_keeps_search_consistent(make_engine):
+    engine = make_engine(hybrid_search=True)
+    load_corpus(engine)
+    engine.delete_document("doc_a")
+
+    assert engine.purge_deleted() == {"blocks_purged": 2, "chunks_purged": 25}
+    assert engine.chunk_store.ntotal == 50
+    assert engine.chunk_store.tombstones == {}
+    assert len(engine.chunk_store.segments) == 1
+    assert engine.block_index.ntotal == len(engine.block_metadata) == 4
+
+    # BM25 rows follow the store's new numbering
+    for row, _, _ in engine.lexical_index.search("gearbox", k=100):
+        assert engine.chunk_store.get_rows([row])[1][0]["source"] == "b.pdf"
+    assert sources(engine.search("turbine procedure step", top_k_chunks=10)) == {"c.pdf"}
+
+    # New documents append after the purged rows and everything reloads
+    engine.add_document("doc_d", "d.pdf", doc_chunks("d.pdf", "hydraulic", pages=5))
+    engine.save_index(final=True)
+    reloaded = make_engine(models_dir=engine.models_dir, hybrid_search=True)
+    assert {d["id"] for d in reloaded.list_documents()} == {"doc_b", "doc_c", "doc_d"}
+    assert sources(reloaded.search("hydraulic procedure step")) == {"d.pdf"}
+
+
+def test_purge_rewrites_outside_the_ingest_lock(make_engine, monkeypatch):
+    engine = make_engine(hybrid_search=True)
+    load_corpus(engine)
+    engine.delete_document("doc_a")
+
+    # While the store is rewritten and the block index rebuilt, an upload and a
+    # deletion go through (they would deadlock if the purge held the ingest lock)
+    build = rag_engine_module.build_block_index
+
+    def build_during_uploads(*args):
+        def upload_and_delete():
+            engine.add_document("doc_d", "d.pdf", doc_chunks("d.pdf", "hydraulic", pages=5))
+            engine.delete_document("doc_c")
+
+        writer = threading.Thread(target=upload_and_delete, daemon=True)
+        writer.start()
+        writer.join(10)
+        assert not writer.is_alive(), "ingestion blocked by the purge"
+        return build(*args)
+
+    monkeypatch.setattr(rag_engine_module, "build_block_index", build_during_uploads)
+    assert engine.purge_deleted() == {"blocks_purged": 2, "chunks_purged": 25}
+    monkeypatch.setattr(rag_engine_module, "build_block_index", build)
+
+    # doc_c was deleted after the snapshot: it stays tombstoned under its new row numbers
+    assert engine.chunk_store.ntotal == 55 and engine.chunk_store.deleted_rows == 25
+    assert engine.chunk_store.tombstones["doc_c_block_0"] == (25, 45)
+    assert engine.block_index.ntotal == len(engine.block_metadata) == 5
+    assert {d["id"] for d in engine.list_documents()} == {"doc_b", "doc_d"}
+    assert engine.search("hydraulic procedure step 2")[0]["document_name"] == "d.pdf"
+    assert "c.pdf" not in sources(engine.search("turbine procedure step", top_k_chunks=10))
+    for row, _, _ in engine.lexical_index.search("hydraulic", k=100):
+        assert engine.chunk_store.get_rows([row])[1][0]["source"] == "d.pdf"
+
+    reloaded = make_engine(models_dir=engine.models_dir, hybrid_search=True)
+    assert {d["id"] for d in reloaded.list_documents()} == {"doc_b", "doc_d"}
+    assert reloaded.purge_deleted() == {"blocks_purged": 2, "chunks_purged": 25}
+    assert reloaded.search("gearbox procedure step 4")[0]["document_name"] == "b.pdf"
+
+
+def test_purge_runs_automatically_past_the_deleted_fraction(make_engine):
+    engine = make_engine()
+    load_corpus(engine)
+    engine.purge_deleted_fraction = 0.4
+    engine.delete_document("doc_a")  # 25 of 75 rows: below the threshold
+    engine.wait_for_purge()
+    assert engine.chunk_store.deleted_rows == 25
+
+    engine.delete_document("doc_b")
+    engine.wait_for_purge()
+    assert engine.chunk_store.deleted_rows == 0
+    assert engine.chunk_store.ntotal == 25
+
+
+def test_failed_ingestion_rolls_back_committed_blocks(make_engine):
+    engine = make_engine()
+    load_corpus(engine)
+    segments = len(engine.chunk_store.segments)
+
+    def broken_upload():
+        yield from doc_chunks("d.pdf", "compressor", pages=45)
+        raise OSError("extraction failed on page 46")
+
+    try:
+        engine.add_document_stream("doc_d", "d.pdf", broken_upload())
+        raise AssertionError("the extraction error must propagate")
+    except OSError:
+        pass
+
+    # Blocks 0 and 1 were searchable while block 2 was being read; none of them is now
+    assert "doc_d" not in {d["id"] for d in engine.list_documents()}
+    assert "d.pdf" not in sources(engine.search("compressor procedure step 7", top_k_chunks=10))
+    assert engine.chunk_store.deleted_rows == 40
+    reloaded = make_engine()
+    assert {d["id"] for d in reloaded.list_documents()} == {"doc_a", "doc_b", "doc_c"}
+
+    # A complete document is flushed once, not once per block
+    engine.add_document("doc_e", "e.pdf", doc_chunks("e.pdf", "valve", pages=65))
+    assert len(engine.chunk_store.segments) == segments + 2  # rolled-back rows + doc_e
@@ -0,0 +1,108 @@
+import os
+
+from backend.lexical_index import BM25Index
+
+
+def filler_chunks(doc, pages):
+    return [{"text": f"{doc} general notes for page {p} about routine maintenance", "page": p, "source": doc}
+            for p in pages]
+
+
+def load_manual(engine):
+    chunks = filler_chunks("manual.pdf", range(1, 40))
+    chunks.append({"text": "Replace filter cartridge XK-4471B every six months", "page": 40, "source": "manual.pdf"})
+    chunks.append({"text": "Soft margin classification allows some training points inside the margin",
+                   "page": 41, "source": "manual.pdf"})
+    engine.add_document("doc1", "manual.pdf", chunks)
+
+
+def test_bm25_ranks_rare_terms_and_expands_typos():
+    index = BM25Index()
+    index.add(0, ["the soft margin classifier", "the hard margin classifier", "the weather today"])
+
+    hits = index.search("soft margin")
+    assert hits[0][0] == 0 and hits[0][2] == 1.0
+    assert {row for row, _, _ in hits} == {0, 1}
+
+    assert index.expand("marigin") == [("marigin", [("margin", index.fuzzy_weight)])]
+    assert [row for row, _, _ in index.search("hard marigin")][0] == 1
+    assert index.search("zebra") == []
+
+
+def test_hybrid_search_finds_exact_codes_and_typos_dense_misses(make_engine):
+    engine = make_engine(hybrid_search=True)
+    load_manual(engine)
+
+    # A tight dense threshold rejects everything; the lexical hits still come through
+    code = engine.search("XK-4471B", score_threshold=0.5)
+    assert code[0]["page"] == 40
+    typo = engine.search("soft marigin classification", score_threshold=0.5)
+    assert typo[0]["page"] == 41
+
+    dense_only = make_engine(models_dir=engine.models_dir + "_dense", hybrid_search=False)
+    load_manual(dense_only)
+    assert dense_only.search("XK-4471B", score_threshold=0.5) == []
+
+
+def test_weak_partial_matches_do_not_bypass_the_threshold(make_engine):
+    engine = make_engine(hybrid_search=True)
+    load_manual(engine)
+    assert engine.search("cartridge pricing warranty refund policy", score_threshold=0.5) == []
+
+
+def test_bm25_index_is_persisted_and_caught_up_from_the_store(make_engine):
+    engine = make_engine(hybrid_search=True)
+    load_manual(engine)
+    engine.save_index(final=True)
+    assert os.path.exists(engine.lexical_index_path)
+    saved_rows = engine.lexical_index.nrows
+
+    # A document committed after the last BM25 save is re-indexed from the store at load
+    engine.add_document("doc2", "extra.pdf", [{"text": "Torque spec ZZ-9 is 40 Nm", "page": 1, "source": "extra.pdf"}])
+    reloaded = make_engine(hybrid_search=True)
+    assert reloaded.lexical_index.nrows == saved_rows + 1
+    assert reloaded.search("ZZ-9", score_threshold=0.5)[0]["document_name"] == "extra.pdf"
+    assert reloaded.search("XK-4471B", score_threshold=0.5)[0]["page"] == 40
+
+
+def test_common_terms_are_ignored_once_the_corpus_is_large_enough():
+    texts = ["the soft margin classifier", "the hard margin classifier", "the weather today", "the end"]
+    small = BM25Index()
+    small.add(0, texts)
+    assert len(small.search("the", k=10)) == 4  # below common_term_min_df every term counts
+
+    index = BM25Index(common_term_fraction=0.5, common_term_min_df=2)
+    index.add(0, texts)
+    assert index.search("the") == []
+    hits = index.search("the soft margin")
+    assert hits[0][0] == 0 and hits[0][2] == 1.0  # coverage ignores the common term
+
+
+def test_pruned_search_returns_the_exact_top_k():
+    index = BM25Index()
+    words = [f"w{i}" for i in range(40)]
+    texts = [" ".join(words[(row * 7 + j * j) % (5 + row % 35)] for j in range(12)) for row in range(600)]
+    for start in range(0, len(texts), 25):  # several postings segments
+        index.add(start, texts[start:start + 25])
+    index.remove(range(100, 150), texts[100:150])
+
+    for query in ("w1 w2 w3 w30", "w0 w34 w17", "w5 w6 w7 w8 w9 w10 w11 w33"):
+        everything = index.search(query, k=len(texts))
+        assert all(row not in range(100, 150) for row, _, _ in everything)
+        for k in (1, 3, 10):
+            assert [s for _, s, _ in index.search(query, k=k)] == [s for _, s, _ in everything[:k]]
+
+
+def test_bm25_scoring_does_not_hold_the_index_lock(make_engine, monkeypatch):
+    engine = make_engine(hybrid_search=True)
+    load_manual(engine)
+    search = engine.lexical_index.search
+    readers = []
+
+    def checked_search(query, k):
+        readers.append(engine._index_lock._readers)
+        return search(query, k)
+
+    monkeypatch.setattr(engine.lexical_index, "search", checked_search)
+    assert engine.search("XK-4471B", score_threshold=0.5)[0]["page"] == 40
+    assert readers == [0]
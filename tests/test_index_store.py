@@ -0,0 +1,221 @@
+import os
+
+import numpy as np
+
+from backend.chunk_store import ChunkStore, records_nbytes
+
+
+def make_chunks(doc_name, pages, per_page=2):
+    return [
+        {"text": f"{doc_name} page {p} part {i}", "page": p, "source": doc_name}
+        for p in pages for i in range(per_page)
+    ]
+
+
+def test_chunk_store_round_trip(make_engine):
+    engine = make_engine()
+    engine.add_document("doc1", "manual.pdf", make_chunks("manual", range(1, 45)))
+
+    assert engine.chunk_store.exists()
+    assert not os.path.exists(engine.indexes_dir)  # no per-block files anymore
+
+    reloaded = make_engine()
+    assert reloaded.block_index.ntotal == 3
+    assert reloaded.chunk_store.ntotal == 88
+    assert [b["block_id"] for b in reloaded.block_metadata] == [f"doc1_block_{i}" for i in range(3)]
+
+    vectors, chunks = reloaded.chunk_store.get_block("doc1_block_1")
+    assert vectors.shape == (40, 384)
+    assert chunks[0]["page"] == 21
+
+    results = reloaded.search("manual page 30 part 1")
+    assert results and results[0]["page"] == 30
+
+
+def test_add_document_appends_segment_without_rewriting(make_engine):
+    engine = make_engine()
+    engine.add_document("doc1", "a.pdf", make_chunks("alpha", range(1, 5)))
+    first = engine.chunk_store.segments[0]
+    first_path = os.path.join(engine.chunk_store.store_dir, f"{first.name}_chunks.npy")
+    first_mtime = os.stat(first_path).st_mtime_ns
+
+    engine.add_document("doc2", "b.pdf", make_chunks("beta", range(1, 5)))
+
+    assert len(engine.chunk_store.segments) == 2
+    assert os.stat(first_path).st_mtime_ns == first_mtime
+
+
+def test_uncommitted_segment_is_ignored_after_crash(make_engine):
+    engine = make_engine()
+    engine.add_document("doc1", "a.pdf", make_chunks("alpha", range(1, 5)))
+
+    # Simulate a crash after segment files were written but before the manifest swap
+    store = engine.chunk_store
+    store.add_block({"block_id": "ghost_block_0"}, np.zeros(384), np.zeros((2, 384)), [{}, {}])
+    store._write_segment("seg_999999", store.pending)
+    with open(store.manifest_path + ".tmp", "w") as f:
+        f.write("{truncated")
+
+    reloaded = make_engine()
+    assert "ghost_block_0" not in reloaded.chunk_store
+    assert reloaded.block_index.ntotal == 1
+
+
+def test_compaction_merges_segments(make_engine):
+    engine = make_engine()
+    engine.chunk_store.compact_after_segments = 100
+    for i in range(4):
+        engine.add_document(f"doc{i}", f"{i}.pdf", make_chunks(f"doc{i}", range(1, 3)))
+    assert len(engine.chunk_store.segments) == 4
+
+    engine.chunk_store.compact()
+    assert len(engine.chunk_store.segments) == 1
+    assert len(os.listdir(engine.chunk_store.store_dir)) == 6  # manifest + one segment (5 files)
+
+    reloaded = make_engine()
+    assert reloaded.block_index.ntotal == 4
+    vectors, chunks = reloaded.chunk_store.get_block("doc2_block_0")
+    assert chunks[0]["text"] == "doc2 page 1 part 0"
+    assert np.allclose(vectors, engine.embedding_model.encode([c["text"] for c in chunks]))
+
+
+def test_segment_files_still_in_use_are_removed_later(make_engine, monkeypatch):
+    import backend.chunk_store as chunk_store_module
+
+    engine = make_engine()
+    store = engine.chunk_store
+    store.compact_after_segments = 100
+    for i in range(3):
+        engine.add_document(f"doc{i}", f"{i}.pdf", make_chunks(f"doc{i}", range(1, 3)))
+    old_names = [seg.name for seg in store.segments]
+
+    # Windows refuses to delete files a reader still memory-maps
+    remove = os.remove
+
+    def locked_remove(path):
+        if any(os.path.basename(path).startswith(name) for name in old_names):
+            raise PermissionError(32, "The process cannot access the file", path)
+        remove(path)
+
+    monkeypatch.setattr(chunk_store_module.os, "remove", locked_remove)
+    store.compact()
+    assert len(store.segments) == 1
+    assert sorted(store._retired) == old_names
+    assert store.get_block("doc1_block_0")[1][0]["text"] == "doc1 page 1 part 0"
+
+    # Retried on the next flush once the readers let go
+    monkeypatch.setattr(chunk_store_module.os, "remove", remove)
+    engine.add_document("doc3", "3.pdf", make_chunks("doc3", range(1, 3)))
+    assert store._retired == set()
+    assert len(os.listdir(store.store_dir)) == 11  # manifest + two segments (5 files each)
+
+
+def test_orphaned_segment_files_are_removed_on_startup(make_engine):
+    engine = make_engine()
+    engine.add_document("doc1", "a.pdf", make_chunks("alpha", range(1, 5)))
+    store = engine.chunk_store
+    store.add_block({"block_id": "ghost_block_0"}, np.zeros(384), np.zeros((2, 384)), [{}, {}])
+    store._write_segment("seg_999999", store.pending)
+
+    reloaded = make_engine()
+    files = os.listdir(reloaded.chunk_store.store_dir)
+    assert not any(f.startswith("seg_999999") for f in files)
+    assert len(files) == 6
+    assert reloaded.search("alpha page 3 part 1")[0]["page"] == 3
+
+
+def test_tiered_compaction_leaves_large_segments_alone(make_engine):
+    engine = make_engine()
+    store = engine.chunk_store
+    store.compact_after_segments = 3
+
+    def add(doc_id, pages):
+        engine.add_documents([(doc_id, f"{doc_id}.pdf", make_chunks(doc_id, pages))])
+        engine.save_index(final=True)
+        store.wait_for_compaction()
+
+    add("big", range(1, 101))
+    big = store.segments[0].name
+    for i in range(9):
+        add(f"small{i}", range(1, 5))
+        if i == 2:
+            assert [seg.nrows for seg in store.segments] == [200, 24]
+    # [8, 8, 8] -> 24 twice, then [24, 24, 8] -> 56 (no segment is over half of that run);
+    # the 200-row segment is never rewritten
+    assert [seg.nrows for seg in store.segments] == [200, 56, 8, 8]
+    assert store.segments[0].name == big
+
+    reloaded = make_engine()
+    assert reloaded.search("small7 page 3 part 1")[0]["document_name"] == "small7"
+    assert reloaded.search("big page 88 part 0")[0]["page"] == 88
+
+
+def test_legacy_per_block_indexes_are_migrated(make_engine, tmp_path):
+    import faiss
+
+    models_dir = tmp_path / "models"
+    indexes_dir = models_dir / "indexes"
+    os.makedirs(indexes_dir)
+
+    chunks = make_chunks("legacy", [1, 2])
+    vectors = np.random.rand(len(chunks), 384).astype("float32")
+    chunk_index = faiss.IndexFlatL2(384)
+    chunk_index.add(vectors)
+    faiss.write_index(chunk_index, str(indexes_dir / "old_block_0.bin"))
+    np.save(indexes_dir / "old_block_0_meta.npy", chunks)
+
+    block_index = faiss.IndexFlatL2(384)
+    block_index.add(vectors.mean(axis=0, keepdims=True))
+    faiss.write_index(block_index, str(models_dir / "block_index.bin"))
+    np.save(models_dir / "block_metadata.npy", [{"block_id": "old_block_0", "doc_id": "old", "name": "old.pdf"}])
+
+    engine = make_engine()
+    assert engine.chunk_store.exists()
+    migrated_vectors, migrated_chunks = engine.chunk_store.get_block("old_block_0")
+    assert np.allclose(migrated_vectors, vectors)
+    assert migrated_chunks == chunks
+
+
+def test_chunk_indexes_load_lazily_with_lru_budget(make_engine):
+    engine = make_engine()
+    engine.add_document("doc1", "manual.pdf", make_chunks("manual", range(1, 81)))
+
+    # Per block: 40 chunks * 384 dims * 4 bytes of index, plus its decoded chunk dicts.
+    # The budget fits two blocks.
+    block_bytes = 40 * 384 * 4 + records_nbytes(make_chunks("manual", range(61, 81)))
+    reloaded = make_engine(chunk_cache_mb=0)
+    reloaded.chunk_indexes.max_bytes = 2 * block_bytes
+    assert len(reloaded.chunk_indexes) == 0
+    assert all(seg.chunks.__class__.__name__ == "ChunkRecords" for seg in reloaded.chunk_store.segments)
+
+    reloaded.search("manual page 5 part 0", top_k_blocks=1)
+    reloaded.search("manual page 5 part 1", top_k_blocks=1)
+    stats = reloaded.chunk_cache_stats()
+    # Index and chunk dicts: loaded once, then both served from the cache
+    assert stats["misses"] == 2 and stats["hits"] == 2
+    assert ("chunks", "doc1_block_0") in reloaded.chunk_indexes
+
+    for page in (25, 45, 65):
+        reloaded.search(f"manual page {page} part 0", top_k_blocks=1)
+    stats = reloaded.chunk_cache_stats()
+    assert stats["items"] == 4
+    assert stats["evictions"] == 4
+    assert stats["bytes"] <= 2 * block_bytes
+
+
+def test_legacy_format_segments_still_load(make_engine):
+    engine = make_engine()
+    engine.add_document("doc1", "manual.pdf", make_chunks("manual", range(1, 21)))
+    store = engine.chunk_store
+    # Rewrite the segment as format 1: chunk dicts pickled inside the segment meta
+    seg = store.segments[0]
+    _, _, meta_path, records_path, index_path = store._segment_paths(seg.name)
+    meta = np.load(meta_path, allow_pickle=True).item()
+    meta["chunks"] = list(seg.chunks)
+    np.save(meta_path, meta, allow_pickle=True)
+    os.remove(records_path)
+    os.remove(index_path)
+
+    reloaded = make_engine()
+    assert isinstance(reloaded.chunk_store.segments[0].chunks, list)
+    assert reloaded.search("manual page 7 part 1")[0]["page"] == 7
@@ -0,0 +1,48 @@
+from backend.ingestion import DocumentProcessor
+
+
+def test_parallel_pdf_extraction_preserves_page_order(make_pdf, tmp_path):
+    texts = [f"Page number {i}" for i in range(1, 41)]
+    texts[9] = ""  # blank page is skipped, like the serial path
+    pdf_path = make_pdf(texts)
+
+    serial = DocumentProcessor(upload_dir=str(tmp_path / "u"), pdf_workers=1).extract_text(pdf_path)
+    parallel = DocumentProcessor(upload_dir=str(tmp_path / "u"), pdf_workers=3, pdf_pages_per_task=4)
+    records = list(parallel.iter_pdf_pages(pdf_path))
+
+    assert records == serial
+    assert [r["page"] for r in records] == [p for p in range(1, 41) if p != 10]
+    assert records[-1]["text"] == "Page number 40"
+
+
+def test_streaming_pipeline_commits_blocks_as_they_complete(make_engine, make_pdf, tmp_path):
+    engine = make_engine()
+    processor = DocumentProcessor(upload_dir=str(tmp_path / "u"), pdf_workers=1)
+    pdf_path = make_pdf([f"Page number {i}" for i in range(1, 51)])
+
+    seen_blocks = []
+
+    def chunks():
+        for chunk in processor.iter_chunks(processor.iter_pages(pdf_path)):
+            # Pages 21+ only start once block 0 (pages 1-20) has been committed
+            if chunk["page"] == 22:
+                seen_blocks.append(engine.block_index.ntotal)
+            yield chunk
+
+    progress = []
+    engine.add_document_stream("doc", "doc.pdf", chunks(), progress=lambda **c: progress.append(c))
+
+    assert seen_blocks == [1]
+    assert engine.block_index.ntotal == 3
+    assert [p["blocks_indexed"] for p in progress] == [1, 2, 3]
+    assert progress[-1]["chunks_embedded"] == 50
+    assert engine.search("Page number 33")[0]["page"] == 33
+
+
+def test_streaming_pipeline_rejects_out_of_order_chunks(make_engine):
+    import pytest
+
+    engine = make_engine()
+    chunks = [{"text": "late", "page": 30}, {"text": "early", "page": 2}]
+    with pytest.raises(ValueError):
+        engine.add_document_stream("doc", "doc.pdf", iter(chunks))
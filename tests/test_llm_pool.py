@@ -0,0 +1,130 @@
+import threading
+import time
+
+from backend.llm_pool import LLMPool
+
+
+class FakeLlama:
+    """Generates `n_tokens` tokens at a fixed rate and records overlap with other instances."""
+
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def __init__(self, n_threads, n_tokens=5, delay=0.02):
+        self.n_threads = n_threads
+        self.n_tokens = n_tokens
+        self.delay = delay
+
+    def _tokens(self):
+        with FakeLlama.lock:
+            FakeLlama.active += 1
+            FakeLlama.peak = max(FakeLlama.peak, FakeLlama.active)
+        try:
+            for i in range(self.n_tokens):
+                time.sleep(self.delay)
+                yield {"choices": [{"text": f" t{i}"}]}
+        finally:
+            with FakeLlama.lock:
+                FakeLlama.active -= 1
+
+    def __call__(self, prompt, stream=False, **kwargs):
+        if stream:
+            return self._tokens()
+        text = "".join(out["choices"][0]["text"] for out in self._tokens())
+        return {"choices": [{"text": text}], "usage": {"completion_tokens": self.n_tokens}}
+
+
+def test_threads_are_partitioned_between_instances():
+    created = []
+    pool = LLMPool(lambda n: created.append(FakeLlama(n)) or created[-1], instances=3, total_threads=12)
+    assert [llm.n_threads for llm in created] == [4, 4, 4]
+    assert pool.stats()["threads_per_instance"] == 4
+
+
+def test_concurrent_requests_run_on_separate_instances():
+    FakeLlama.peak = 0
+    pool = LLMPool(FakeLlama, instances=2, total_threads=4)
+    threads = [threading.Thread(target=pool, args=("q",), kwargs={"max_tokens": 5}) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert FakeLlama.peak == 2
+    stats = pool.stats()
+    assert stats["requests"] == 4
+    assert stats["tokens_generated"] == 20
+    assert stats["tokens_per_sec"] > 0
+    assert stats["busy"] == stats["queue_depth"] == 0
+
+
+def test_stream_holds_instance_until_closed():
+    pool = LLMPool(FakeLlama, instances=1, total_threads=2)
+    stream = pool("q", stream=True)
+    next(stream)
+    assert pool.stats()["busy"] == 1
+
+    waiter = threading.Thread(target=pool, args=("q",))
+    waiter.start()
+    deadline = time.time() + 5
+    while pool.stats()["queue_depth"] != 1 and time.time() < deadline:
+        time.sleep(0.01)
+    assert pool.stats()["queue_depth"] == 1
+
+    stream.close()
+    waiter.join(5)
+    stats = pool.stats()
+    assert stats["busy"] == stats["queue_depth"] == 0
+    assert stats["requests"] == 2
+    assert stats["tokens_generated"] == 1 + 5
+
+
+class PrefixLlama(FakeLlama):
+    """Tracks which prompt tokens sit in its 'KV cache' like llama-cpp-python's Llama."""
+
+    def __init__(self, n_threads):
+        super().__init__(n_threads, n_tokens=2, delay=0)
+        self.input_ids = []
+        self.n_tokens = 0
+        self.evaluated = 0
+
+    def tokenize(self, text, add_bos=True, special=False):
+        return [hash(word) for word in text.decode("utf-8").split(" ")]
+
+    def reset(self):
+        self.n_tokens = 0
+
+    def eval(self, tokens):
+        self.input_ids = self.input_ids[:self.n_tokens] + list(tokens)
+        self.n_tokens = len(self.input_ids)
+        self.evaluated += len(tokens)
+
+    def __call__(self, prompt, stream=False, **kwargs):
+        # Reuse the longest cached token prefix, evaluate the rest
+        tokens = self.tokenize(prompt.encode("utf-8"))
+        reuse = 0
+        for a, b in zip(self.input_ids[:self.n_tokens], tokens):
+            if a != b:
+                break
+            reuse += 1
+        self.n_tokens = reuse
+        self.eval(tokens[reuse:])
+        return super().__call__(prompt, stream=stream, **kwargs)
+
+
+def test_warm_prefix_is_evaluated_once_and_kept_across_requests():
+    prefix = "You are a precise assistant. "
+    pool = LLMPool(PrefixLlama, instances=1, total_threads=2)
+    pool.warm_prefix(prefix)
+    with pool.acquire() as llm:
+        pass
+    prefix_tokens = pool.stats()["prefix_tokens"]
+    assert prefix_tokens > 0 and llm.evaluated == prefix_tokens
+
+    # Every prompt starts with the prefix, so llama.cpp's own prefix matching keeps it
+    for i, question in enumerate(["a", "b", "c"]):
+        suffix = f"Context: {i} User Question: {question}"
+        before = llm.evaluated
+        pool(prefix + suffix)
+        assert llm.evaluated - before <= len(llm.tokenize(suffix.encode("utf-8")))
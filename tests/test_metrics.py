@@ -0,0 +1,50 @@
+from backend import metrics
+from backend.metrics import MetricsRegistry
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", labels=("outcome",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    size = registry.gauge("size", "Size")
+    requests.inc(outcome="ok")
+    requests.inc(2, outcome="ok")
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+    size.set_function(lambda: 7)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{outcome="ok"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+    assert "latency_seconds_sum 5.55" in text
+    assert "size 7" in text
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+    requests = registry.counter("requests_total", "Requests")
+    latency = registry.histogram("latency_seconds", "Latency")
+    requests.inc()
+    latency.observe(1.0)
+    assert requests.value() == 0
+    assert latency.count() == 0
+
+
+def test_trace_collects_stage_timings():
+    with metrics.trace() as timings:
+        with metrics.stage("block_search"):
+            pass
+        with metrics.stage("block_search"):
+            pass
+    assert set(timings) == {"block_search"}
+    # Outside a trace, stages still feed the histogram but no dict
+    before = metrics.STAGE_SECONDS.count(stage="prompt_build")
+    with metrics.stage("prompt_build"):
+        pass
+    assert metrics.STAGE_SECONDS.count(stage="prompt_build") == before + 1
+
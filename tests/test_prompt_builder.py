@@ -0,0 +1,89 @@
+from backend import metrics
+from backend.ingestion import DocumentProcessor
+from backend.prompt_builder import PromptBuilder, build_prompt
+
+
+def word_count(text):
+    return len(text.split())
+
+
+def page_chunks(tmp_dir, text, page=1, source="doc.pdf"):
+    chunks = DocumentProcessor(upload_dir=str(tmp_dir)).chunk_text([{"text": text, "page": page}])
+    return [dict(c, document_name=source, score=0.1 * i) for i, c in enumerate(chunks)]
+
+
+def test_overlapping_chunks_are_merged_once(tmp_path):
+    text = " ".join(f"w{i}" for i in range(300))
+    chunks = page_chunks(tmp_path, text)[:3]
+    builder = PromptBuilder(word_count, n_ctx=4096, max_answer_tokens=512)
+
+    prompt, used, usage = builder.build(chunks, "question?")
+
+    assert used == chunks
+    assert usage["chunks_merged"] == 2
+    # The merged entry is the original page text, so the 50-char overlaps appear once
+    merged_text = text[:len(chunks[0]["text"]) + 2 * 450]
+    assert merged_text in prompt
+    assert prompt.count("Document: doc.pdf") == 1
+    assert usage["prompt_tokens"] == word_count(prompt)
+
+
+def test_duplicates_and_other_pages_are_not_merged():
+    a = {"text": "alpha beta gamma delta epsilon zeta eta theta", "page": 1, "document_name": "a.pdf", "score": 0.1}
+    same = dict(a, score=0.2)
+    other_page = dict(a, page=2, score=0.3)
+    prompt, used, usage = PromptBuilder(word_count).build([a, same, other_page], "q")
+
+    assert prompt.count("Content: alpha") == 2
+    assert len(used) == 3
+    assert usage["chunks_merged"] == 1
+
+
+def test_chunks_are_packed_by_relevance_into_the_budget():
+    chunks = [
+        {"text": " ".join(f"c{n}w{i}" for i in range(40)), "page": n, "document_name": "d.pdf", "score": n}
+        for n in range(5)
+    ]
+    overhead = word_count(build_prompt([], "q"))
+    # Room for two chunks (each ~46 words once rendered) but not three
+    builder = PromptBuilder(word_count, n_ctx=overhead + 100 + 10, max_answer_tokens=10)
+
+    prompt, used, usage = builder.build(chunks, "q")
+
+    assert [c["page"] for c in used] == [0, 1]
+    assert usage["chunks_dropped"] == 3
+    assert usage["context_tokens"] <= usage["context_budget"]
+    assert "c2w0" not in prompt
+
+
+def test_oversized_best_chunk_is_truncated_to_fit():
+    chunk = {"text": " ".join(f"w{i}" for i in range(1000)), "page": 1, "document_name": "d.pdf", "score": 0.1}
+    overhead = word_count(build_prompt([], "q"))
+    builder = PromptBuilder(word_count, n_ctx=overhead + 200 + 50, max_answer_tokens=50)
+
+    prompt, used, usage = builder.build([chunk], "q")
+
+    assert used == [chunk]
+    assert usage["chunks_truncated"] == 1
+    assert usage["context_tokens"] <= 200
+    assert word_count(prompt) <= 200 + overhead
+
+
+def test_engine_refuses_without_calling_the_llm_when_no_chunk_fits(make_engine):
+    engine = make_engine()
+    engine.add_document("doc1", "manual.pdf", [{"text": "margin notes " * 20, "page": 1, "source": "manual.pdf"}])
+    calls = []
+    engine.llm = lambda prompt, **kwargs: calls.append(prompt)
+    # The instruction and answer allowance alone overflow the window
+    overhead = word_count(build_prompt([], "margin notes"))
+    engine.prompt_builder = PromptBuilder(word_count, n_ctx=overhead + 10, max_answer_tokens=50)
+    query = "margin notes"
+    refused = metrics.REFUSALS.value(reason="prompt_budget")
+
+    response = engine.generate_answer(query)
+    assert response["citations"] == []
+    assert "not available" in response["answer"]
+    events = list(engine.generate_answer_stream(query))
+    assert len(events) == 1 and "not available" in events[0]
+    assert calls == []
+    assert metrics.REFUSALS.value(reason="prompt_budget") == refused + 2
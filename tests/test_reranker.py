@@ -0,0 +1,70 @@
+import numpy as np
+
+from backend.reranker import Reranker, fit_platt
+
+
+class KeywordCrossEncoder:
+    """Relevant (logit 6) when the chunk contains the keyword, else -6; counts predicted pairs."""
+
+    def __init__(self, keyword: str):
+        self.keyword = keyword
+        self.calls = []
+
+    def predict(self, pairs, batch_size=32):
+        self.calls.append(len(pairs))
+        return np.array([6.0 if self.keyword in text else -6.0 for _, text in pairs])
+
+
+class CountingLlm:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, prompt, **kwargs):
+        self.calls += 1
+        return {"choices": [{"text": "Use the torque wrench."}], "usage": {"completion_tokens": 5}}
+
+
+def load_manual(engine):
+    chunks = [{"text": f"pump maintenance notes page {p} routine inspection", "page": p, "source": "manual.pdf"}
+              for p in range(1, 30)]
+    chunks.append({"text": "pump maintenance torque settings for the impeller bolts", "page": 30, "source": "manual.pdf"})
+    engine.add_document("doc1", "manual.pdf", chunks)
+
+
+def test_fit_platt_recovers_scale_and_bias():
+    rng = np.random.default_rng(0)
+    logits = rng.normal(0, 3, 4000)
+    labels = rng.random(4000) < 1 / (1 + np.exp(-(0.5 * logits - 1.0)))
+    scale, bias = fit_platt(logits, labels)
+    assert abs(scale - 0.5) < 0.1
+    assert abs(bias + 1.0) < 0.2
+
+
+def test_reranker_batches_and_caches_pairs():
+    model = KeywordCrossEncoder("torque")
+    reranker = Reranker(model, min_relevance=0.5)
+    items = [{"text": "general notes"}, {"text": "torque settings"}, {"text": "general notes"}]
+
+    ranked = reranker.rerank("Torque?", items, top_k=3)
+    assert [i["text"] for i in ranked] == ["torque settings"]
+    assert model.calls == [2]  # duplicates scored once, in one batch
+
+    reranker.rerank("torque?", items + [{"text": "new chunk"}], top_k=3)
+    assert model.calls == [2, 1]  # only the unseen pair is scored
+
+
+def test_reranker_refuses_before_generation(make_engine):
+    engine = make_engine(hybrid_search=False)
+    load_manual(engine)
+    engine.llm = CountingLlm()
+
+    engine.reranker = Reranker(KeywordCrossEncoder("torque"), min_relevance=0.5)
+    response = engine.generate_answer("pump maintenance torque")
+    assert engine.llm.calls == 1
+    assert response["citations"][0].page_number == 30
+
+    engine.reranker = Reranker(KeywordCrossEncoder("warranty"), min_relevance=0.5)
+    response = engine.generate_answer("pump maintenance routine inspection")
+    assert engine.llm.calls == 1  # candidates were retrieved but none judged relevant
+    assert response["citations"] == []
+    assert "not available" in response["answer"]
@@ -0,0 +1,119 @@
+def make_chunks(doc_name, pages, per_page=3):
+    return [
+        {"text": f"{doc_name} page {p} section {i}", "page": p, "source": doc_name}
+        for p in pages for i in range(per_page)
+    ]
+
+
+def load_corpus(engine):
+    engine.add_document("doc1", "alpha.pdf", make_chunks("alpha", range(1, 61)))
+    engine.add_document("doc2", "beta.pdf", make_chunks("beta", range(1, 41)))
+
+
+QUERIES = [
+    "alpha page 3 section 1",
+    "beta page 22 section 0",
+    "alpha page 47 section 2",
+    "nothing relevant here",
+    "beta page 22 section 0",
+]
+
+
+def test_search_batch_matches_search_loop(make_engine):
+    engine = make_engine()
+    load_corpus(engine)
+
+    expected = [engine.search(q, top_k_blocks=2) for q in QUERIES]
+    engine.search_cache.clear()
+    batched = engine.search_batch(QUERIES, top_k_blocks=2)
+
+    assert batched == expected
+    assert batched[0][0]["page"] == 3
+    assert batched[3] == []
+
+
+def test_search_batch_encodes_once(make_engine):
+    engine = make_engine()
+    load_corpus(engine)
+
+    calls = []
+    encode = engine.embedding_model.encode
+    engine.embedding_model.encode = lambda texts, **kw: calls.append(len(texts)) or encode(texts, **kw)
+
+    engine.search_batch(QUERIES)
+    assert calls == [len(set(QUERIES))]  # duplicate queries are embedded once
+    assert engine.search_batch([]) == []
+
+
+def test_ann_block_index_builds_past_threshold_and_persists(make_engine):
+    engine = make_engine(block_index_type="hnsw", block_index_threshold=10)
+    for i in range(3):
+        engine.add_document(f"doc{i}", f"{i}.pdf", make_chunks(f"doc{i}", range(1, 61)))
+    assert type(engine.block_index).__name__ == "IndexFlatL2"
+
+    engine.add_document("doc3", "3.pdf", make_chunks("doc3", range(1, 21)))
+    assert type(engine.block_index).__name__ == "IndexHNSWFlat"
+    assert engine.block_index.ntotal == 10
+
+    reloaded = make_engine(block_index_type="hnsw", block_index_threshold=10)
+    assert type(reloaded.block_index).__name__ == "IndexHNSWFlat"
+    assert reloaded.block_index.ntotal == 10
+    assert reloaded.search("doc2 page 45 section 1")[0]["page"] == 45
+
+
+def test_ann_block_index_type_change_triggers_rebuild(make_engine):
+    engine = make_engine(block_index_type="hnsw", block_index_threshold=2)
+    engine.add_document("doc1", "a.pdf", make_chunks("alpha", range(1, 61)))
+    assert type(engine.block_index).__name__ == "IndexHNSWFlat"
+
+    reloaded = make_engine(block_index_type="ivf_flat", block_index_threshold=2)
+    assert type(reloaded.block_index).__name__ == "IndexIVFFlat"
+    assert reloaded.block_index.ntotal == 3
+
+
+def test_quantized_chunk_indexes_rerank_exactly(make_engine, tmp_path):
+    exact = make_engine(models_dir=str(tmp_path / "exact"))
+    load_corpus(exact)
+    compressed = make_engine(models_dir=str(tmp_path / "sq8"), chunk_quantization="sq8")
+    load_corpus(compressed)
+    compressed = make_engine(models_dir=str(tmp_path / "sq8"), chunk_quantization="sq8")
+
+    for query in QUERIES:
+        expected = exact.search(query)
+        got = compressed.search(query)
+        assert [(r["document_name"], r["page"], r["text"]) for r in got] == \
+            [(r["document_name"], r["page"], r["text"]) for r in expected]
+        for r, e in zip(got, expected):
+            assert abs(r["score"] - e["score"]) < 1e-2  # fp16 stored rows
+
+    assert compressed.chunk_store.segments[0].vectors.dtype.name == "float16"
+    assert compressed.chunk_indexes["doc1_block_0"].code_size * 4 == exact.chunk_indexes["doc1_block_0"].code_size
+
+
+def test_pq_training_is_retried_only_after_the_store_grows(make_engine, monkeypatch):
+    from backend import quantization
+
+    attempts = []
+    train = quantization.train_pq_template
+    monkeypatch.setattr(quantization, "train_pq_template", lambda d, sample: attempts.append(len(sample)) or train(d, sample))
+    engine = make_engine(chunk_quantization="pq")
+    load_corpus(engine)  # 5 blocks, 300 chunks: too few to train
+    assert attempts == [0]  # first block, before anything was stored
+
+    engine.add_document("doc3", "gamma.pdf", make_chunks("gamma", range(1, 401)))
+    assert len(attempts) == 2 and engine._pq_template is not None
+
+
+def test_mixed_precision_segments_still_load(make_engine, tmp_path):
+    models_dir = str(tmp_path / "mixed")
+    engine = make_engine(models_dir=models_dir)
+    engine.add_document("doc1", "alpha.pdf", make_chunks("alpha", range(1, 21)))
+
+    engine = make_engine(models_dir=models_dir, chunk_quantization="fp16")
+    engine.add_document("doc2", "beta.pdf", make_chunks("beta", range(1, 21)))
+
+    reloaded = make_engine(models_dir=models_dir, chunk_quantization="fp16")
+    dtypes = [seg.vectors.dtype.name for seg in reloaded.chunk_store.segments]
+    assert dtypes == ["float32", "float16"]
+    assert reloaded.search("alpha page 4 section 2")[0]["page"] == 4
+    assert reloaded.search("beta page 9 section 0")[0]["document_name"] == "beta"